@@ -0,0 +1,68 @@
+"""Benchmark of the recovery of a store (cf `LsmStorage.reconstruct_from_manifest`) versus the volume of its WAL files.
+
+For each WAL volume, a store is filled with records that are never flushed (its memtables are frozen every
+`records_per_wal` records, so that the recovery replays several WAL files), then it is dropped as if the process had
+crashed, and the time taken to reopen it is measured.
+
+Usage: python -m benchmarks.recovery [--records 1000 10000 100000] [--records-per-wal 10000] [--threads 1 4]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from src.lsm_storage import LsmStorage
+from src.wal import WriteAheadLog
+
+
+def fill_store_without_flushing(directory: str, nb_records: int, records_per_wal: int) -> str:
+    store = LsmStorage.create(directory=directory)
+    for i in range(nb_records):
+        store.put(key=f"key{i:010d}", value=f"value{i}".encode())
+        if (i + 1) % records_per_wal == 0:
+            store._freeze_memtable()
+    return store.manifest.file.path
+
+
+def wal_volume(directory: str) -> int:
+    return sum(os.path.getsize(path) for path in WriteAheadLog.list_paths(directory=directory))
+
+
+def benchmark(nb_records: int, records_per_wal: int, nb_threads: int) -> tuple[int, int, float]:
+    directory = tempfile.mkdtemp(prefix="pebbledb-recovery-")
+    try:
+        manifest_path = fill_store_without_flushing(directory=directory, nb_records=nb_records,
+                                                    records_per_wal=records_per_wal)
+        nb_wals = len(WriteAheadLog.list_paths(directory=directory))
+        volume = wal_volume(directory=directory)
+
+        start = time.perf_counter()
+        store = LsmStorage.reconstruct_from_manifest(manifest_path=manifest_path, nb_recovery_threads=nb_threads)
+        duration = time.perf_counter() - start
+
+        store.close()
+        return nb_wals, volume, duration
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--records-per-wal", type=int, default=10_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    print(f"{'records':>10} | {'WAL files':>9} | {'WAL bytes':>11} | {'threads':>7} | {'recovery (s)':>12} | {'MB/s':>7}")
+    for nb_records in args.records:
+        for nb_threads in args.threads:
+            nb_wals, volume, duration = benchmark(nb_records=nb_records, records_per_wal=args.records_per_wal,
+                                                  nb_threads=nb_threads)
+            throughput = volume / duration / 1_000_000
+            print(f"{nb_records:>10} | {nb_wals:>9} | {volume:>11} | {nb_threads:>7} | {duration:>12.3f} | "
+                  f"{throughput:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
 import os
+import struct
 from collections import deque
 
 import pytest
 
 from src.__fixtures__.constants import TEST_SSTABLE_FIXTURES_DIRECTORY, TEST_DIRECTORY
-from src.manifest import ManifestFile, FlushEvent, CompactionEvent, Configuration, Manifest
+from src.manifest import ManifestFile, FlushEvent, CompactionEvent, Configuration, Manifest, ManifestRecord
 from src.memtable import MemTable
 
 
@@ -134,3 +135,19 @@ def expected_state_of_manifest_1(sstable_one_block_3, sstable_one_block_4,
     sstables_levels[0] = deque([sstable_one_block_3])
 
     return memtables, immutable_memtables, sstables_level0, sstables_levels
+
+
+@pytest.fixture
+def baseline_manifest_path(sstable_one_block_1):
+    """A manifest written with the baseline layout: its header only holds the first five fields of the configuration
+    (without magic nor version), and its flush records have no WAL name."""
+    path = f"{TEST_DIRECTORY}/baseline_manifest.txt"
+    encoded_header = struct.pack("=idiii", 6, 0.1, 10, 262_144_000, 65_536)
+    encoded_record = ManifestRecord(event=FlushEvent(sstable=sstable_one_block_1)).to_bytes()
+    with open(path, "wb") as f:
+        f.write(encoded_header + encoded_record)
+
+    yield path
+
+    # Cleanup code (Delete the file created by the fixture)
+    os.remove(path)
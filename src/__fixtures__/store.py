@@ -206,7 +206,8 @@ def store_with_four_l1_and_one_l2_sstables(records_for_store_with_four_l1_and_on
     assert len(store.state.sstables_level0) == 4
 
     store.force_compaction_l0()
-    store.force_compaction_l1_or_more_level(level=1)
+    for i in range(4):
+        store.force_compaction_l1_or_more_level(level=1)
 
     assert len(store.state.sstables_level0) == 0
     assert len(store.state.sstables_levels) == 2
@@ -12,6 +12,8 @@ errors at https://flake8.pycqa.org/en/latest/user/violations.html#in-line-ignori
 error codes at https://flake8.pycqa.org/en/2.5.5/warnings.html).
 """
 
+import gc
+
 from src.__fixtures__.bloom_filter import *  # noqa: F401
 from src.__fixtures__.constants import *  # noqa: F401
 from src.__fixtures__.manifest import *  # noqa: F401
@@ -19,3 +21,13 @@ from src.__fixtures__.memtable import *  # noqa: F401
 from src.__fixtures__.sstable import *  # noqa: F401
 from src.__fixtures__.store import *  # noqa: F401
 from src.__fixtures__.wal import *  # noqa: F401
+
+
+def pytest_collection_finish(session):
+    """Moves every object created while collecting the tests (the test items, the imported modules, ...) to the
+    permanent generation of the garbage collector (cf https://docs.python.org/3/library/gc.html#gc.freeze).
+    These objects live until the end of the session: without this, each full collection goes through all of them and
+    pauses every thread for tens of milliseconds, which is longer than the windows measured by the concurrency tests.
+    """
+    gc.collect()
+    gc.freeze()
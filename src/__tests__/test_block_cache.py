@@ -0,0 +1,92 @@
+from src.block_cache import BlockCache
+from src.blocks import DataBlock
+
+
+def test_get_missing_block_counts_a_miss():
+    # GIVEN
+    cache = BlockCache(capacity=100)
+
+    # WHEN
+    block = cache.get(key=("file.sst", 0))
+
+    # THEN
+    assert block is None
+    assert cache.misses == 1
+    assert cache.hits == 0
+
+
+def test_get_cached_block_counts_a_hit():
+    # GIVEN
+    cache = BlockCache(capacity=100)
+    block = DataBlock(data=b'some_data', offsets=[0])
+    cache.put(key=("file.sst", 0), block=block, charge=10)
+
+    # WHEN
+    cached_block = cache.get(key=("file.sst", 0))
+
+    # THEN
+    assert cached_block is block
+    assert cache.hits == 1
+    assert cache.misses == 0
+
+
+def test_blocks_are_keyed_by_file_and_block_id():
+    # GIVEN
+    cache = BlockCache(capacity=100)
+    block_1 = DataBlock(data=b'block_1', offsets=[0])
+    block_2 = DataBlock(data=b'block_2', offsets=[0])
+
+    # WHEN
+    cache.put(key=("file1.sst", 0), block=block_1, charge=10)
+    cache.put(key=("file2.sst", 0), block=block_2, charge=10)
+
+    # THEN
+    assert cache.get(key=("file1.sst", 0)) is block_1
+    assert cache.get(key=("file2.sst", 0)) is block_2
+    assert cache.get(key=("file1.sst", 1)) is None
+
+
+def test_least_recently_used_blocks_are_evicted_when_full():
+    # GIVEN
+    cache = BlockCache(capacity=30)
+    blocks = [DataBlock(data=bytes(i), offsets=[0]) for i in range(4)]
+    for i in range(3):
+        cache.put(key=("file.sst", i), block=blocks[i], charge=10)
+    cache.get(key=("file.sst", 0))  # Block 0 becomes the most recently used
+
+    # WHEN
+    cache.put(key=("file.sst", 3), block=blocks[3], charge=10)
+
+    # THEN
+    assert cache.evictions == 1
+    assert cache.size == 30
+    assert cache.get(key=("file.sst", 1)) is None
+    assert cache.get(key=("file.sst", 0)) is blocks[0]
+    assert cache.get(key=("file.sst", 2)) is blocks[2]
+    assert cache.get(key=("file.sst", 3)) is blocks[3]
+
+
+def test_cache_is_bounded_by_bytes_and_not_by_entries():
+    # GIVEN
+    cache = BlockCache(capacity=30)
+
+    # WHEN
+    cache.put(key=("file.sst", 0), block=DataBlock(data=b'', offsets=[]), charge=25)
+    cache.put(key=("file.sst", 1), block=DataBlock(data=b'', offsets=[]), charge=25)
+
+    # THEN
+    assert len(cache) == 1
+    assert cache.size == 25
+    assert cache.evictions == 1
+
+
+def test_block_bigger_than_capacity_is_not_cached():
+    # GIVEN
+    cache = BlockCache(capacity=30)
+
+    # WHEN
+    cache.put(key=("file.sst", 0), block=DataBlock(data=b'', offsets=[]), charge=31)
+
+    # THEN
+    assert len(cache) == 0
+    assert cache.size == 0
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from src.blocks import DataBlockBuilder, DataBlock, MetaBlock
 from src.record import Record
 
@@ -168,3 +170,109 @@ def test_meta_blocks_are_not_equal_if_different_offsets():
 
     # THEN
     assert are_equal is False
+
+
+def test_search_record():
+    # GIVEN
+    block_builder = DataBlockBuilder(target_size=100)
+    for key in ["key1", "key3", "key5"]:
+        block_builder.add(key=key, value=b'value')
+    block = block_builder.create_block()
+
+    # WHEN/THEN
+    assert block.search("key0") == (0, False)
+    assert block.search("key1") == (0, True)
+    assert block.search("key2") == (1, False)
+    assert block.search("key5") == (2, True)
+    assert block.search("key6") == (3, False)
+
+
+def test_get_record_decodes_a_single_value():
+    # GIVEN
+    block_builder = DataBlockBuilder(target_size=1000)
+    for i in range(30):
+        block_builder.add(key=f"key{i:02d}", value=b'value')
+    block = block_builder.create_block()
+
+    # WHEN/THEN
+    with mock.patch.object(block, '_decode_key', wraps=block._decode_key) as mocked_decode_key, \
+            mock.patch.object(block, '_decode_value', wraps=block._decode_value) as mocked_decode_value:
+        # WHEN
+        record = block.get("key17")
+
+        # THEN
+        assert record == Record(key="key17", value=b'value')
+        mocked_decode_value.assert_called_once()
+        assert mocked_decode_key.call_count <= 5  # ceil(log2(30))
+
+
+def test_block_builder_shares_key_prefixes_between_restart_points():
+    # GIVEN
+    block_builder = DataBlockBuilder(target_size=100, restart_interval=2)
+
+    # WHEN
+    block_builder.add(key="key1", value=b'v1')
+    block_builder.add(key="key2", value=b'v2')
+    block_builder.add(key="key3", value=b'v3')
+
+    # THEN
+    assert block_builder.offsets == [0, 25]
+    assert block_builder.data_buffer[:block_builder.data_length] == (
+        b'\x04\x00\x00\x00key1\x02\x00\x00\x00v1'  # Restart point: the key is not shared
+        b'\x01\x00\x03\x002\x02\x00\x00\x00v2'  # Shares "key" with the previous key
+        b'\x04\x00\x00\x00key3\x02\x00\x00\x00v3'  # Restart point
+    )
+
+
+def test_prefix_compressed_block_can_be_read():
+    # GIVEN
+    kv_pairs = [(f"tenant1/entity{i:03d}", f"value{i}".encode()) for i in range(40)]
+    block_builder = DataBlockBuilder(target_size=10_000, restart_interval=16)
+    for key, value in kv_pairs:
+        block_builder.add(key=key, value=value)
+    encoded_block = block_builder.create_block().to_bytes()
+
+    # WHEN
+    block = DataBlock.from_bytes(encoded_block)
+
+    # THEN
+    assert len(block.offsets) == 3
+    assert block.number_records == 40
+    assert list(block.records()) == [Record(key=key, value=value) for key, value in kv_pairs]
+    for key, value in kv_pairs:
+        assert block.get(key) == Record(key=key, value=value)
+    assert block.get("tenant1/entity0155") is None
+    assert block.get("tenant0") is None
+    assert block.get("tenant2") is None
+
+
+def test_prefix_compression_reduces_block_size():
+    # GIVEN
+    kv_pairs = [(f"tenant1/entity{i:03d}", b'value') for i in range(40)]
+    uncompressed_block_builder = DataBlockBuilder(target_size=10_000, restart_interval=1)
+    compressed_block_builder = DataBlockBuilder(target_size=10_000, restart_interval=16)
+
+    # WHEN
+    for key, value in kv_pairs:
+        uncompressed_block_builder.add(key=key, value=value)
+        compressed_block_builder.add(key=key, value=value)
+
+    # THEN
+    assert compressed_block_builder.create_block().size < uncompressed_block_builder.create_block().size / 2
+
+
+def test_block_with_tombstones():
+    # GIVEN
+    block_builder = DataBlockBuilder(target_size=100, restart_interval=2)
+    block_builder.add(key="key1", value=b'value1')
+    block_builder.add(key="key2", value=b'', is_tombstone=True)
+    block_builder.add(key="key3", value=b'value3')
+
+    # WHEN
+    block = DataBlock.from_bytes(block_builder.create_block().to_bytes())
+
+    # THEN
+    assert block.get(key="key2") == Record.tombstone(key="key2")
+    assert block.get(key="key3") == Record(key="key3", value=b'value3')
+    assert list(block.records()) == [Record(key="key1", value=b'value1'), Record.tombstone(key="key2"),
+                                     Record(key="key3", value=b'value3')]
@@ -1,4 +1,9 @@
-from src.bloom_filter import BloomFilter
+from array import array
+
+import mmh3
+import pytest
+
+from src.bloom_filter import BloomFilter, BlockedBloomFilter
 
 
 def test_lookups():
@@ -31,7 +36,7 @@ def test_build_from_keys():
 
 def test_encode():
     # GIVEN
-    bloom_filter = BloomFilter(nb_bytes=1, nb_hash_functions=2)
+    bloom_filter = BloomFilter(nb_bytes=1, nb_hash_functions=2, double_hashing=False)
     bloom_filter.add("key1")
     bloom_filter.add("key2")
     bloom_filter.add("key3")
@@ -47,7 +52,7 @@ def test_encode():
 
 def test_encode_with_multiple_bytes():
     # GIVEN
-    bloom_filter = BloomFilter(nb_bytes=3, nb_hash_functions=2)
+    bloom_filter = BloomFilter(nb_bytes=3, nb_hash_functions=2, double_hashing=False)
     bloom_filter.add("key1")
     bloom_filter.add("key2")
     bloom_filter.add("key3")
@@ -138,3 +143,107 @@ def test_bloom_filters_are_not_equal_if_different_keys():
 
     # THEN
     assert are_equal is False
+
+
+def test_legacy_hashing_sets_one_bit_per_seeded_hash():
+    # GIVEN
+    bloom_filter = BloomFilter(nb_bytes=8, nb_hash_functions=3, double_hashing=False)
+
+    # WHEN
+    bits = bloom_filter._hash(key="key1")
+
+    # THEN
+    assert bits == [mmh3.hash(b"key1", seed) % 64 for seed in range(3)]
+
+
+def test_add_many_is_equivalent_to_adding_keys_one_by_one():
+    # GIVEN
+    keys = [f"key{i}" for i in range(100)]
+    bloom_filter1 = BloomFilter(nb_bytes=64, nb_hash_functions=5)
+    bloom_filter2 = BloomFilter(nb_bytes=64, nb_hash_functions=5)
+
+    # WHEN
+    bloom_filter1.add_many(keys=keys)
+    for key in keys:
+        bloom_filter2.add(key=key)
+
+    # THEN
+    assert bloom_filter1 == bloom_filter2
+    assert all(bloom_filter1.may_contain(key=key) for key in keys)
+
+
+@pytest.mark.parametrize("bloom_filter_class", [BloomFilter, BlockedBloomFilter])
+def test_build_from_hashes_is_equivalent_to_building_from_keys(bloom_filter_class):
+    # GIVEN
+    keys = [f"key{i}" for i in range(1000)]
+    hashes = array("Q")
+    for key in keys:
+        hashes.extend(BloomFilter.hash_key(key=key))
+
+    # WHEN
+    bloom_filter = bloom_filter_class.build_from_hashes_and_bits_per_key(hashes=hashes, bits_per_key=10)
+
+    # THEN
+    assert bloom_filter == bloom_filter_class.build_from_keys_and_bits_per_key(keys=keys, bits_per_key=10)
+
+
+def test_false_positive_rate_with_double_hashing():
+    # GIVEN
+    bloom_filter = BloomFilter.build_from_keys_and_fp_rate([f"key{i}" for i in range(10_000)], fp_rate=0.01)
+
+    # WHEN
+    nb_false_positives = sum(bloom_filter.may_contain(key=f"missing{i}") for i in range(10_000))
+
+    # THEN
+    assert nb_false_positives < 200
+
+
+def test_decode_does_not_copy_the_bits():
+    # GIVEN
+    bloom_filter = BloomFilter.build_from_keys_and_fp_rate(["key1", "key2"], 0.001)
+    encoded_bloom_filter = bytearray(bloom_filter.to_bytes())
+
+    # WHEN
+    decoded_bloom_filter = BloomFilter.from_bytes(data=encoded_bloom_filter)
+
+    # THEN
+    assert decoded_bloom_filter == bloom_filter
+    encoded_bloom_filter[:-1] = bytes(len(encoded_bloom_filter) - 1)
+    assert decoded_bloom_filter.may_contain("key1") is False
+
+
+def test_bloom_filter_with_no_bits_per_key_is_disabled():
+    # GIVEN/WHEN
+    bloom_filter = BloomFilter.build_from_keys_and_bits_per_key(["key1", "key2"], bits_per_key=0)
+
+    # THEN
+    assert bloom_filter.nb_bytes == 0
+    assert bloom_filter.may_contain("key1") is True
+    assert bloom_filter.may_contain("missing") is True
+
+
+def test_blocked_bloom_filter_sets_all_bits_of_a_key_in_one_block():
+    # GIVEN
+    bloom_filter = BlockedBloomFilter.build_from_keys_and_bits_per_key([f"key{i}" for i in range(1000)],
+                                                                      bits_per_key=10)
+
+    # WHEN
+    bits = bloom_filter._hash(key="key1")
+
+    # THEN
+    assert bloom_filter.nb_bytes % BlockedBloomFilter.BLOCK_SIZE == 0
+    assert len(bits) == len(set(bits)) == 7
+    assert len({bit // BlockedBloomFilter.BLOCK_BITS_SIZE for bit in bits}) == 1
+
+
+def test_false_positive_rate_of_blocked_bloom_filter():
+    # GIVEN
+    bloom_filter = BlockedBloomFilter.build_from_keys_and_bits_per_key([f"key{i}" for i in range(10_000)],
+                                                                      bits_per_key=10)
+
+    # WHEN
+    nb_false_positives = sum(bloom_filter.may_contain(key=f"missing{i}") for i in range(10_000))
+
+    # THEN
+    assert all(bloom_filter.may_contain(key=f"key{i}") for i in range(10_000))
+    assert nb_false_positives < 300
@@ -0,0 +1,181 @@
+import gc
+import weakref
+from unittest import mock
+
+import pytest
+
+from src.__fixtures__.constants import TEST_DIRECTORY
+from src.compaction import (CompactionStrategy, CompactionStyle, LeveledCompactionStrategy, SortedRun,
+                            UniversalCompactionStrategy)
+from src.lsm_storage import LsmStorage
+
+
+def sorted_run_of_size(level, size):
+    return SortedRun(level=level, sstables=[mock.Mock(size=size)])
+
+
+def test_create_the_compaction_strategy_of_the_configuration():
+    # GIVEN
+    leveled_store = mock.Mock(_configuration=mock.Mock(compaction_style=CompactionStyle.LEVELED))
+    universal_store = mock.Mock(_configuration=mock.Mock(compaction_style=CompactionStyle.UNIVERSAL))
+
+    # WHEN
+    leveled_strategy = CompactionStrategy.create(store=leveled_store)
+    universal_strategy = CompactionStrategy.create(store=universal_store)
+
+    # THEN
+    assert isinstance(leveled_strategy, LeveledCompactionStrategy) and leveled_strategy.store is leveled_store
+    assert isinstance(universal_strategy, UniversalCompactionStrategy) and universal_strategy.store is universal_store
+
+
+def test_level_targets_grow_by_the_levels_ratio():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, nb_levels=4, levels_ratio=0.1, base_level_size=1000)
+
+    # WHEN
+    targets = store.compaction_strategy.level_targets()
+
+    # THEN
+    assert targets == pytest.approx([1000, 10_000, 100_000])
+
+
+def test_dynamic_level_targets_derive_from_the_size_of_the_last_level():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, nb_levels=4, levels_ratio=0.1, base_level_size=1000,
+                              dynamic_level_bytes=True)
+    store.state.sstables_levels[-1].extend([mock.Mock(size=300_000), mock.Mock(size=200_000)])
+
+    # WHEN
+    targets = store.compaction_strategy.level_targets()
+
+    # THEN
+    assert targets == pytest.approx([1000, 5000, 50_000])
+
+
+def test_compaction_scores_use_the_size_of_the_levels():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, nb_levels=3, levels_ratio=0.5, base_level_size=100,
+                              max_l0_sstables=4)
+    store.state.sstables_level0.extend([mock.Mock(size=1)])
+    store.state.sstables_levels[0].extend([mock.Mock(size=60), mock.Mock(size=90)])
+    store.state.sstables_levels[1].extend([mock.Mock(size=100)])
+
+    # WHEN
+    scores = store.compaction_strategy.compaction_scores()
+
+    # THEN
+    assert scores == pytest.approx([0.25, 1.5, 0.5])
+    assert store._levels_to_compact() == [1]
+
+
+def test_store_is_freed_without_waiting_for_the_garbage_collector():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY)
+    store.put(key="key1", value=b'value1')
+    store_reference = weakref.ref(store)
+
+    # WHEN
+    gc.disable()
+    try:
+        del store
+        is_store_freed = store_reference() is None
+    finally:
+        gc.enable()
+
+    # THEN
+    assert is_store_freed
+
+
+def test_universal_compaction_waits_for_enough_sorted_runs():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, max_l0_sstables=4, compaction_style=CompactionStyle.UNIVERSAL)
+    sorted_runs = [sorted_run_of_size(level=0, size=10) for _ in range(3)]
+
+    # WHEN
+    picked_sorted_runs = store.compaction_strategy.pick_sorted_runs(sorted_runs=sorted_runs)
+
+    # THEN
+    assert picked_sorted_runs is None
+
+
+def test_universal_compaction_merges_all_sorted_runs_when_space_amplification_is_too_high():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, max_l0_sstables=3, compaction_style=CompactionStyle.UNIVERSAL)
+    sorted_runs = [sorted_run_of_size(level=0, size=10), sorted_run_of_size(level=0, size=100),
+                   sorted_run_of_size(level=6, size=50)]
+
+    # WHEN
+    picked_sorted_runs = store.compaction_strategy.pick_sorted_runs(sorted_runs=sorted_runs)
+
+    # THEN
+    assert picked_sorted_runs == sorted_runs
+
+
+def test_universal_compaction_merges_sorted_runs_of_similar_sizes():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, max_l0_sstables=4, compaction_style=CompactionStyle.UNIVERSAL)
+    sorted_runs = [sorted_run_of_size(level=0, size=1), sorted_run_of_size(level=0, size=10),
+                   sorted_run_of_size(level=0, size=10), sorted_run_of_size(level=4, size=100),
+                   sorted_run_of_size(level=6, size=1000)]
+
+    # WHEN
+    picked_sorted_runs = store.compaction_strategy.pick_sorted_runs(sorted_runs=sorted_runs)
+
+    # THEN
+    assert picked_sorted_runs == sorted_runs[1:3]
+
+
+def test_universal_compaction_merges_the_newest_sorted_runs_when_no_sizes_are_similar():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, max_l0_sstables=3, compaction_style=CompactionStyle.UNIVERSAL)
+    sorted_runs = [sorted_run_of_size(level=0, size=1), sorted_run_of_size(level=0, size=10),
+                   sorted_run_of_size(level=5, size=100), sorted_run_of_size(level=6, size=1000)]
+
+    # WHEN
+    picked_sorted_runs = store.compaction_strategy.pick_sorted_runs(sorted_runs=sorted_runs)
+
+    # THEN
+    assert picked_sorted_runs == sorted_runs[:3]
+
+
+def test_universal_compaction_writes_to_the_deepest_free_level_above_the_next_sorted_run():
+    # GIVEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, nb_levels=6, compaction_style=CompactionStyle.UNIVERSAL)
+    sorted_runs = [sorted_run_of_size(level=0, size=10), sorted_run_of_size(level=0, size=10),
+                   sorted_run_of_size(level=3, size=100), sorted_run_of_size(level=6, size=1000)]
+
+    # WHEN
+    l0_output_level = store.compaction_strategy.output_level(sorted_runs=sorted_runs,
+                                                             picked_sorted_runs=sorted_runs[:2])
+    l3_output_level = store.compaction_strategy.output_level(sorted_runs=sorted_runs,
+                                                             picked_sorted_runs=sorted_runs[:3])
+    full_output_level = store.compaction_strategy.output_level(sorted_runs=sorted_runs,
+                                                               picked_sorted_runs=sorted_runs[2:])
+
+    # THEN
+    assert l0_output_level == 2
+    assert l3_output_level == 3
+    assert full_output_level == 6
+
+
+def test_universal_compaction_keeps_all_records_and_bounds_the_number_of_sorted_runs():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=50, block_size=20, directory=TEST_DIRECTORY, nb_levels=4,
+                              max_l0_sstables=3, compaction_style=CompactionStyle.UNIVERSAL)
+
+    # WHEN
+    for i in range(40):
+        store.put(key=f"key{i % 15:02d}", value=f"value{i}".encode())
+        store.flush_next_immutable_memtable() if len(store.state.immutable_memtables) else None
+
+    store.close()
+
+    # THEN
+    sorted_runs = store.compaction_strategy.sorted_runs()
+    assert 1 < len(sorted_runs) < 3
+    assert all(sorted_run.level > 0 for sorted_run in sorted_runs[1:])
+    expected_values = {f"key{i % 15:02d}": f"value{i}".encode() for i in range(40)}
+    assert {key: store.get(key=key) for key in expected_values} == expected_values
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+    assert reconstructed_store.state.sstables_level0 == store.state.sstables_level0
+    assert reconstructed_store.state.sstables_levels == store.state.sstables_levels
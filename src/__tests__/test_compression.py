@@ -0,0 +1,50 @@
+import pytest
+
+from src.compression import Compression, compress_block, decompress_block
+
+
+@pytest.mark.parametrize("compression", list(Compression))
+def test_compressed_block_can_be_decompressed(compression):
+    # GIVEN
+    data = b'key1value1' * 100
+
+    # WHEN
+    encoded_block = compress_block(data=data, compression=compression)
+
+    # THEN
+    assert encoded_block[-1] == compression
+    assert bytes(decompress_block(data=encoded_block)) == data
+
+
+def test_compression_reduces_size_of_repetitive_blocks():
+    # GIVEN
+    data = b'key1value1' * 100
+
+    # WHEN
+    encoded_block = compress_block(data=data, compression=Compression.ZLIB)
+
+    # THEN
+    assert len(encoded_block) < len(data)
+
+
+def test_block_that_does_not_shrink_is_stored_uncompressed():
+    # GIVEN
+    data = b'\x8f\x01'
+
+    # WHEN
+    encoded_block = compress_block(data=data, compression=Compression.LZMA)
+
+    # THEN
+    assert encoded_block == data + b'\x00'
+
+
+def test_uncompressed_block_is_not_copied():
+    # GIVEN
+    encoded_block = memoryview(b'some_data\x00')
+
+    # WHEN
+    data = decompress_block(data=encoded_block)
+
+    # THEN
+    assert isinstance(data, memoryview)
+    assert data.obj is encoded_block.obj
@@ -0,0 +1,106 @@
+import os
+import weakref
+
+from src.file_descriptor_pool import FileDescriptorPool
+from src.sstable import SSTableFile
+
+
+def test_descriptor_is_kept_open_between_reads(sstable_file_1):
+    # GIVEN
+    pool = FileDescriptorPool(capacity=2)
+
+    # WHEN
+    with pool.open(path=sstable_file_1.path) as first_descriptor:
+        pass
+    with pool.open(path=sstable_file_1.path) as second_descriptor:
+        pass
+
+    # THEN
+    assert first_descriptor == second_descriptor
+    assert len(pool) == 1
+
+
+def test_least_recently_used_descriptor_is_closed_when_full(temporary_sstable_path, temporary_sstable_path_2,
+                                                            sstable_file_1):
+    # GIVEN
+    pool = FileDescriptorPool(capacity=2)
+    paths = [sstable_file_1.path,
+             SSTableFile.create(path=temporary_sstable_path + "_a", data=b'a').path,
+             SSTableFile.create(path=temporary_sstable_path_2 + "_b", data=b'b').path]
+    with pool.open(path=paths[0]):
+        pass
+    with pool.open(path=paths[1]):
+        pass
+
+    # WHEN
+    with pool.open(path=paths[2]):
+        pass
+
+    # THEN
+    assert len(pool) == 2
+    assert pool.evictions == 1
+    assert paths[0] not in pool._descriptors
+
+
+def test_descriptor_in_use_is_not_evicted(temporary_sstable_path, sstable_file_1):
+    # GIVEN
+    pool = FileDescriptorPool(capacity=1)
+    other_path = SSTableFile.create(path=temporary_sstable_path + "_a", data=b'a').path
+
+    # WHEN/THEN
+    with pool.open(path=sstable_file_1.path) as descriptor:
+        with pool.open(path=other_path):
+            assert len(pool) == 2
+            assert os.pread(descriptor, 4, 0) == b'this'
+
+    # THEN
+    assert len(pool) == 1
+
+
+def test_read_range_with_descriptor_pool(sstable_file_1, content_of_sstable_file_1):
+    # GIVEN
+    pool = FileDescriptorPool(capacity=1)
+    sstable_file = SSTableFile.open(path=sstable_file_1.path, descriptor_pool=pool)
+
+    # WHEN
+    content = sstable_file.read_range(start=8, end=19)
+
+    # THEN
+    assert content == content_of_sstable_file_1[8:19]
+    assert len(pool) == 1
+
+
+def test_maps_count_against_the_capacity_and_are_unmapped_when_evicted(temporary_sstable_path, sstable_file_1):
+    # GIVEN
+    pool = FileDescriptorPool(capacity=1)
+    other_path = SSTableFile.create(path=temporary_sstable_path + "_a", data=b'a').path
+    with pool.map(path=sstable_file_1.path):
+        pass
+    file_map = pool._descriptors[sstable_file_1.path]
+
+    # WHEN
+    with pool.map(path=other_path) as view:
+        content = bytes(view)
+
+    # THEN
+    assert content == b'a'
+    assert len(pool) == 1
+    assert pool.evictions == 1
+    assert file_map.closed
+
+
+def test_map_is_unmapped_once_its_views_are_freed(sstable_file_1, content_of_sstable_file_1):
+    # GIVEN
+    pool = FileDescriptorPool(capacity=1)
+    with pool.map(path=sstable_file_1.path) as view:
+        content = view[8:19]
+    file_map = weakref.ref(pool._descriptors[sstable_file_1.path])
+
+    # WHEN
+    pool.close_all()
+
+    # THEN
+    assert len(pool) == 0
+    assert content == content_of_sstable_file_1[8:19]
+    del view, content
+    assert file_map() is None
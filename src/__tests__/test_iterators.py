@@ -1,10 +1,14 @@
+from unittest import mock
+
 import pytest
 
 from src.blocks import DataBlock, DataBlockBuilder
 from src.iterators import DataBlockIterator, MemTableIterator, SSTableIterator, MergingIterator, BaseIterator, \
     ConcatenatingIterator
 from src.memtable import MemTable
+from src.range_tombstones import RangeTombstone, RangeTombstones
 from src.record import Record
+from src.sstable import SSTableBuilder
 
 
 def test_iterate_on_memtable(empty_memtable):
@@ -199,6 +203,38 @@ def test_iterate_on_finished_sstable_raises_stop_iteration(sstable_four_blocks):
         next(sstable_iterator)
 
 
+def test_iterate_on_sstable_skips_blocks_covered_by_range_tombstones(sstable_four_blocks,
+                                                                    records_for_sstable_four_blocks):
+    # GIVEN
+    shadowing_range_tombstones = RangeTombstones([RangeTombstone(start="aaa", end="e")])
+
+    # WHEN
+    with mock.patch.object(sstable_four_blocks, 'read_data_block',
+                           wraps=sstable_four_blocks.read_data_block) as mocked_read_data_block:
+        iterated_records = list(SSTableIterator(sstable=sstable_four_blocks,
+                                                shadowing_range_tombstones=shadowing_range_tombstones))
+
+    # THEN
+    assert iterated_records == records_for_sstable_four_blocks[4:]
+    assert [call.kwargs["block_id"] for call in mocked_read_data_block.call_args_list] == [1, 2, 3]
+
+
+def test_iterate_on_sstable_skips_thousands_of_blocks_covered_by_range_tombstones(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=1_000_000, block_size=30)
+    for i in range(5000):
+        sstable_builder.add(key=f"k{i:06d}", value=b'value')
+    sstable = sstable_builder.build(path=temporary_sstable_path)
+    shadowing_range_tombstones = RangeTombstones([RangeTombstone(start="k000001", end="k004990")])
+
+    # WHEN
+    records = list(SSTableIterator(sstable=sstable, shadowing_range_tombstones=shadowing_range_tombstones))
+
+    # THEN
+    assert len(sstable.meta_blocks) > 3000
+    assert [record.key for record in records] == ["k000000"] + [f"k{i:06d}" for i in range(4990, 5000)]
+
+
 def test_iterate_on_sstable_with_boundaries_inside(sstable_four_blocks, records_for_sstable_four_blocks):
     # GIVEN
     start_key, end_key = "cc", "eeee"
@@ -302,6 +338,47 @@ def test_merge_iterators_with_identical_values():
     assert list(merging_iterator) == expected_items
 
 
+def test_merge_iterators_skips_tombstones_and_the_records_they_shadow():
+    # GIVEN
+    iterator1 = MockBaseIterator(records=[Record.tombstone(key="A"), Record(key="B", value=b'B1'),
+                                          Record.tombstone(key="C")])
+    iterator2 = MockBaseIterator(records=[Record(key="A", value=b'A2'), Record(key="B", value=b'B2')])
+
+    # WHEN
+    merging_iterator = MergingIterator(iterators=[iterator1, iterator2])
+
+    # THEN
+    assert list(merging_iterator) == [Record(key="B", value=b'B1')]
+
+
+def test_merge_iterators_can_keep_tombstones():
+    # GIVEN
+    iterator1 = MockBaseIterator(records=[Record.tombstone(key="A"), Record(key="B", value=b'B1')])
+    iterator2 = MockBaseIterator(records=[Record(key="A", value=b'A2')])
+
+    # WHEN
+    merging_iterator = MergingIterator(iterators=[iterator1, iterator2], keep_tombstones=True)
+
+    # THEN
+    assert list(merging_iterator) == [Record.tombstone(key="A"), Record(key="B", value=b'B1')]
+
+
+def test_merge_iterators_skips_records_covered_by_range_tombstones_of_newer_iterators():
+    # GIVEN
+    iterator1 = MockBaseIterator(records=[Record(key="B", value=b'B1')])
+    iterator2 = MockBaseIterator(records=[Record(key="A", value=b'A2'), Record(key="C", value=b'C2')])
+    iterator3 = MockBaseIterator(records=[Record(key="C", value=b'C3'), Record(key="D", value=b'D3')])
+    range_tombstones = [RangeTombstones([RangeTombstone(start="A", end="C")]),
+                        RangeTombstones([RangeTombstone(start="C", end="E")]),
+                        RangeTombstones()]
+
+    # WHEN
+    merging_iterator = MergingIterator(iterators=[iterator1, iterator2, iterator3], range_tombstones=range_tombstones)
+
+    # THEN
+    assert list(merging_iterator) == [Record(key="B", value=b'B1'), Record(key="C", value=b'C2')]
+
+
 def test_merge_iterators_when_one_empty():
     # GIVEN
     iterator_with_one_item = MockBaseIterator(records=[Record("0", b'0')])
@@ -2,12 +2,23 @@ import threading
 import time
 from unittest import mock
 
-from src.bloom_filter import BloomFilter
+import pytest
+
+from src.__fixtures__.constants import TEST_DIRECTORY
+from src.blocks import MetaBlock
+from src.bloom_filter import BloomFilter, BlockedBloomFilter
+from src.compression import Compression
 from src.iterators import MergingIterator, SSTableIterator
 from src.lsm_storage import LsmStorage
-from src.manifest import CompactionEvent, FlushEvent
+from src.manifest import CompactionEvent, FlushEvent, TrivialMoveEvent, CompactionPointerEvent
+from src.prefix_extractor import PrefixExtractor
+from src.range_tombstones import RangeTombstone, RangeTombstones
 from src.record import Record
-from src.sstable import SSTable, SSTableFile
+from src.scheduler import SchedulerOptions
+from src.sstable import SSTable, SSTableFile, MmapSSTableFile, PartitionedIndex, \
+    compress_block as sstable_compress_block
+from src.wal import Durability, WriteAheadLog
+from src.write_batch import WriteBatch
 
 
 def test_can_read_a_value_inserted(empty_store):
@@ -302,14 +313,14 @@ def test_dont_look_in_bloom_filter_if_key_absent(temporary_sstable_path, empty_s
 
     # WHEN/THEN
     for key in inserted_keys:
-        with mock.patch.object(sstable, 'get', wraps=sstable.get) as mocked_sstable_get:
+        with mock.patch.object(sstable, 'get_record', wraps=sstable.get_record) as mocked_sstable_get:
             # WHEN
             store.get(key=key)
 
             # THEN
             mocked_sstable_get.assert_called_once()
 
-    with mock.patch.object(sstable, 'get', wraps=sstable.get) as mocked_sstable_get:
+    with mock.patch.object(sstable, 'get_record', wraps=sstable.get_record) as mocked_sstable_get:
         # WHEN
         store.get("baz")
 
@@ -346,6 +357,18 @@ def test_compact(store_with_multiple_l0_sstables, records_for_store_with_multipl
     assert len(new_sstables) == 2
 
 
+def test_compact_keeps_records_that_are_only_in_the_last_block():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY)
+    records = [Record(key=f"key{i}", value=f"value{i}".encode()) for i in range(4)]
+
+    # WHEN
+    new_sstables = store._compact(records_iterator=iter(records))
+
+    # THEN
+    assert [len(list(SSTableIterator(sstable=sstable))) for sstable in new_sstables] == [3, 1]
+
+
 def test_trigger_l0_compaction(store_with_multiple_l0_sstables, records_for_store_with_multiple_l0_sstables):
     # GIVEN
     store = store_with_multiple_l0_sstables
@@ -385,6 +408,21 @@ def test_trigger_l1_compaction_to_l2(store_with_multiple_l1_sstables, records_fo
 
     # THEN
     assert len(store.state.sstables_levels) == store._configuration.nb_levels
+    assert len(store.state.sstables_levels[0]) == 3
+    assert len(store.state.sstables_levels[1]) == 1
+    assert store.state.sstables_levels[1][0].first_key == "key1"
+    assert store.state.sstables_levels[1][0].last_key == "key2"
+
+
+def test_l1_compactions_go_round_the_level(store_with_multiple_l1_sstables):
+    # GIVEN
+    store = store_with_multiple_l1_sstables
+
+    # WHEN
+    for _ in range(4):
+        store.force_compaction_l1_or_more_level(level=1)
+
+    # THEN
     assert len(store.state.sstables_levels[0]) == 0
     assert len(store.state.sstables_levels[1]) == 4
     assert store.state.sstables_levels[1][0].first_key == "key1"
@@ -397,6 +435,154 @@ def test_trigger_l1_compaction_to_l2(store_with_multiple_l1_sstables, records_fo
     assert store.state.sstables_levels[1][3].last_key == "key8"
 
 
+def test_l1_compaction_only_rewrites_the_overlapping_sstables_of_l2(store_with_multiple_l1_sstables):
+    # GIVEN
+    store = store_with_multiple_l1_sstables
+    for _ in range(4):
+        store.force_compaction_l1_or_more_level(level=1)
+    store.put(key="key3", value=b'value3B')
+    store.put(key="key4", value=b'value4B')
+    store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    first_sstable, overlapped_sstable, *last_sstables = store.state.sstables_levels[1]
+
+    # WHEN
+    store.force_compaction_l1_or_more_level(level=1)
+
+    # THEN
+    level = store.state.sstables_levels[1]
+    assert len(store.state.sstables_levels[0]) == 0
+    assert len(level) == 4
+    assert level[0] is first_sstable and list(level)[2:] == last_sstables
+    assert overlapped_sstable not in level
+    assert all(previous.last_key < sstable.first_key for previous, sstable in zip(level, list(level)[1:]))
+    assert store.get(key="key3") == b'value3B' and store.get(key="key4") == b'value4B'
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+    assert reconstructed_store.state.sstables_levels == store.state.sstables_levels
+
+
+def test_l1_compaction_picks_the_sstable_after_the_compaction_pointer():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=20, block_size=20, directory=TEST_DIRECTORY, nb_levels=3)
+    sstables = [mock.Mock(first_key=f"key{i}", last_key=f"key{i}B") for i in range(3)]
+    store.state.sstables_levels[0].extend(sstables)
+
+    # WHEN
+    picked_without_pointer = store._pick_sstable_to_compact(level=1)
+    store._compaction_pointers[1] = "key1B"
+    picked_after_pointer = store._pick_sstable_to_compact(level=1)
+    store._compaction_pointers[1] = "key2B"
+    picked_after_last_sstable = store._pick_sstable_to_compact(level=1)
+
+    # THEN
+    assert picked_without_pointer is sstables[0]
+    assert picked_after_pointer is sstables[2]
+    assert picked_after_last_sstable is sstables[0]
+
+
+def test_l1_compactions_resume_from_the_compaction_pointer_when_the_store_is_reopened(store_with_multiple_l1_sstables):
+    # GIVEN
+    store = store_with_multiple_l1_sstables
+    store.force_compaction_l1_or_more_level(level=1)
+
+    # WHEN
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+
+    # THEN
+    assert reconstructed_store._compaction_pointers == {1: "key2"}
+    assert reconstructed_store._pick_sstable_to_compact(level=1).first_key == "key3"
+    reconstructed_store.close()
+
+
+def test_split_key_range_at_first_keys_of_data_blocks():
+    # GIVEN
+    def sstable_with_blocks(*first_keys):
+        meta_blocks = [MetaBlock(offset=0, first_key=first_key, last_key=first_key) for first_key in first_keys]
+        return SSTable(meta_blocks=meta_blocks, meta_block_offset=0, file=SSTableFile(path="sstable"),
+                       bloom_filter=BloomFilter(nb_bytes=1, nb_hash_functions=1), first_key=first_keys[0],
+                       last_key=first_keys[-1])
+
+    sstables = [sstable_with_blocks("a", "c", "e"), sstable_with_blocks("b", "d", "f")]
+
+    # WHEN
+    key_ranges = LsmStorage._split_key_range(sstables=sstables, nb_subranges=3)
+    single_key_range = LsmStorage._split_key_range(sstables=sstables, nb_subranges=1)
+
+    # THEN
+    assert key_ranges == [(None, "c"), ("c", "e"), ("e", None)]
+    assert single_key_range == [(None, None)]
+
+
+def test_subcompactions_write_the_same_records_as_a_single_compaction():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=100, block_size=40, directory=TEST_DIRECTORY, max_l0_sstables=100,
+                              max_subcompactions=3)
+    for i in range(60):
+        store.put(key=f"key{i % 40:02d}", value=f"value{i}".encode())
+    store.delete_range(lower="key10", upper="key15")
+    store._freeze_memtable()
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    sstables_level0 = list(store.state.sstables_level0)
+    expected_records = list(store._merge_sorted_runs(sorted_runs=[[sstable] for sstable in sstables_level0],
+                                                     keep_tombstones=True))
+
+    # WHEN
+    store.force_compaction_l0()
+
+    # THEN
+    level = store.state.sstables_levels[0]
+    assert len(store._split_key_range(sstables=sstables_level0, nb_subranges=3)) == 3
+    # The last key of an SSTable is the (excluded) end of its last range tombstone when there is one
+    assert all(previous.last_key <= sstable.first_key for previous, sstable in zip(level, list(level)[1:]))
+    assert [record for sstable in level for record in SSTableIterator(sstable)] == expected_records
+    assert (RangeTombstones.union([sstable.range_tombstones for sstable in level]) ==
+            RangeTombstones([RangeTombstone(start="key10", end="key15")]))
+    assert store.get(key="key05") == b'value45' and store.get(key="key12") is None
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+    assert reconstructed_store.state.sstables_levels == store.state.sstables_levels
+    store.close()
+
+
+def test_sstables_that_do_not_overlap_the_next_level_are_moved_without_being_rewritten():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=20, block_size=20, directory=TEST_DIRECTORY, nb_levels=3,
+                              max_l0_sstables=100)
+    for i in range(6):
+        store.put(key=f"key{i}", value=f"value{i}".encode())  # Sequential keys: the SSTables do not overlap
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    sstables = sorted(store.state.sstables_level0, key=lambda sstable: sstable.first_key)
+
+    # WHEN
+    with mock.patch.object(store, '_compact', wraps=store._compact) as mocked_compact:
+        store.force_compaction_l0()
+        store.force_compaction_l1_or_more_level(level=1)
+
+        # THEN
+        mocked_compact.assert_not_called()
+    assert len(store.state.sstables_level0) == 0
+    assert list(store.state.sstables_levels[0]) == sstables[1:]
+    assert list(store.state.sstables_levels[1]) == sstables[:1]
+    assert store.manifest.events[-3:] == [TrivialMoveEvent(sstables=sstables, level=0),
+                                          TrivialMoveEvent(sstables=sstables[:1], level=1),
+                                          CompactionPointerEvent(level=1, key=sstables[0].last_key)]
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+    assert reconstructed_store.state.sstables_levels == store.state.sstables_levels
+
+
+def test_overlapping_l0_sstables_are_not_moved(store_with_multiple_l0_sstables):
+    # GIVEN
+    store = store_with_multiple_l0_sstables
+
+    # WHEN
+    with mock.patch.object(store, '_move_sstables', wraps=store._move_sstables) as mocked_move:
+        store.force_compaction_l0()
+
+        # THEN
+        mocked_move.assert_not_called()
+
+
 def test_try_compact_should_force_compact_l0_if_above_the_threshold(store_with_one_l0_sstable):
     # GIVEN
     store = store_with_one_l0_sstable
@@ -428,7 +614,7 @@ def test_try_compact_should_not_force_compact_l0_if_below_the_threshold(store_wi
 def test_try_compact_should_force_compact_l1_if_above_the_threshold(store_with_four_l1_and_one_l2_sstables):
     # GIVEN
     store = store_with_four_l1_and_one_l2_sstables
-    store._configuration.levels_ratio = 0.2
+    store._configuration.base_level_size = store.state.sstables_levels[0][0].size
 
     # WHEN/THEN
     with mock.patch.object(store, 'force_compaction_l1_or_more_level',
@@ -443,7 +629,7 @@ def test_try_compact_should_force_compact_l1_if_above_the_threshold(store_with_f
 def test_try_compact_should_not_force_compact_l1_if_below_the_threshold(store_with_four_l1_and_one_l2_sstables):
     # GIVEN
     store = store_with_four_l1_and_one_l2_sstables
-    store._configuration.levels_ratio = 0.3
+    store._configuration.base_level_size = store.state.sstables_levels[0][0].size + 1
 
     # WHEN/THEN
     with mock.patch.object(store, 'force_compaction_l1_or_more_level',
@@ -458,7 +644,7 @@ def test_try_compact_should_not_force_compact_l1_if_below_the_threshold(store_wi
 def test_try_compact_should_compact_in_cascade(store_with_one_sstable_at_five_levels):
     # GIVEN
     store = store_with_one_sstable_at_five_levels
-    store._configuration.levels_ratio = 2
+    store._configuration.base_level_size = 1
     store._configuration.max_l0_sstables = 1
 
     # WHEN/THEN
@@ -468,11 +654,28 @@ def test_try_compact_should_compact_in_cascade(store_with_one_sstable_at_five_le
         store._try_compact()
 
         # THEN
-        mocked_compact.assert_has_calls([mock.call(level=1), mock.call(level=2), mock.call(level=3)])
-        assert len(store.state.sstables_levels[0]) == 0
-        assert len(store.state.sstables_levels[1]) == 0
-        assert len(store.state.sstables_levels[2]) == 0
-        assert len(store.state.sstables_levels[3]) == 5
+        assert {call.kwargs["level"] for call in mocked_compact.call_args_list} == {1, 2, 3}
+        assert [len(level) for level in store.state.sstables_levels] == [0, 0, 0, 5]
+        assert len(store.state.sstables_level0) == 0
+
+
+def test_try_compact_should_compact_the_level_with_the_highest_score_first(store_with_one_sstable_at_five_levels):
+    # GIVEN
+    store = store_with_one_sstable_at_five_levels
+    store._configuration.levels_ratio = 2  # Targets shrink with depth: L3 has the highest score, then L2, then L1
+    store._configuration.base_level_size = store.state.sstables_levels[0][0].size / 2
+    store._configuration.max_l0_sstables = 10
+    scores = store.compaction_strategy.compaction_scores()
+
+    # WHEN/THEN
+    with mock.patch.object(store, '_force_compaction', wraps=store._force_compaction) as mocked_compact:
+        # WHEN
+        store._try_compact()
+
+        # THEN
+        assert scores[3] > scores[2] > scores[1] > 1
+        assert mocked_compact.call_args_list[0] == mock.call(level=3)
+        assert all(score < 1 for score in store.compaction_strategy.compaction_scores())
 
 
 def test_try_compact_should_not_compact_an_empty_level(store_with_one_sstable_at_last_level):
@@ -583,9 +786,12 @@ def test_compact_l1_writes_to_manifest(store_with_four_l1_and_one_l2_sstables):
         store.force_compaction_l1_or_more_level(level=1)
 
         # THEN
-        mocked_add_event_to_manifest.assert_called_once()
-        called_with_event = mocked_add_event_to_manifest.call_args[1]['event']
-        assert isinstance(called_with_event, CompactionEvent)
+        assert mocked_add_event_to_manifest.call_count == 2
+        compaction_event, compaction_pointer_event = [call[1]['event']
+                                                      for call in mocked_add_event_to_manifest.call_args_list]
+        assert isinstance(compaction_event, CompactionEvent)
+        assert compaction_pointer_event == CompactionPointerEvent(level=1,
+                                                                  key=compaction_event.input_sstables[0].last_key)
 
 
 def test_flush_writes_to_manifest(store_with_multiple_immutable_memtables):
@@ -620,3 +826,770 @@ def test_close_flushes_everything(store_with_multiple_immutable_memtables_and_on
     assert store.state.memtable.approximate_size == 0
     assert len(store.state.immutable_memtables) == 0
     assert len(store.state.sstables_level0) == 3
+
+
+def test_sstables_share_the_block_cache_of_the_store(store_with_multiple_l0_sstables):
+    # GIVEN
+    store = store_with_multiple_l0_sstables
+
+    # WHEN
+    store.get(key="key3")
+    store.get(key="key3")
+
+    # THEN
+    assert store.block_cache is not None
+    assert all(sstable.block_cache is store.block_cache for sstable in store.state.sstables_level0)
+    assert store.block_cache.hits >= 1
+
+
+def test_block_cache_can_be_disabled():
+    # GIVEN/WHEN
+    store = LsmStorage.create(directory=TEST_DIRECTORY, block_cache_size=0)
+
+    # THEN
+    assert store.block_cache is None
+
+
+def test_read_sstables_through_memory_maps():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY, use_mmap=True)
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')
+    store.flush_next_immutable_memtable()
+
+    # WHEN
+    value = store.get(key="key1")
+
+    # THEN
+    assert isinstance(store.state.sstables_level0[0].file, MmapSSTableFile)
+    assert value == b'value1'
+
+
+def test_memory_maps_count_against_the_maximum_number_of_open_files():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY, use_mmap=True,
+                              max_open_files=2, max_l0_sstables=100)
+    for i in range(8):
+        store.put(key=f"key{i % 4}", value=f"value{i}".encode())  # Overlapping SSTables: they are rewritten
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    compacted_sstables = list(store.state.sstables_level0)
+
+    # WHEN
+    values = [store.get(key=f"key{i}") for i in range(4)]
+    nb_open_files = len(store.descriptor_pool)
+    store.force_compaction_l0()
+
+    # THEN
+    assert values == [f"value{i}".encode() for i in range(4, 8)]
+    assert len(compacted_sstables) > 2 and nb_open_files == 2
+    assert all(sstable.file.path not in store.descriptor_pool._descriptors for sstable in compacted_sstables)
+    store.close()
+    assert len(store.descriptor_pool) == 0
+
+
+def test_sstables_are_compressed_with_the_codec_of_their_level():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=60, block_size=100, directory=TEST_DIRECTORY, max_l0_sstables=100,
+                              compression_per_level=[Compression.NONE, Compression.ZLIB])
+    for i in range(6):
+        store.put(key=f"key{i}", value=b'value' * 4)
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+
+    # WHEN
+    with mock.patch("src.sstable.compress_block", wraps=sstable_compress_block) as mocked_compress_block:
+        store.force_compaction_l0()
+
+    # THEN
+    assert {call.kwargs["compression"] for call in mocked_compress_block.call_args_list} == {Compression.ZLIB}
+    assert all(store.get(key=f"key{i}") == b'value' * 4 for i in range(6))
+
+
+def test_sstables_get_the_bloom_filters_of_their_level():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=60, block_size=100, directory=TEST_DIRECTORY, max_l0_sstables=100,
+                              nb_levels=1, bloom_bits_per_key_per_level=[10, 0], blocked_bloom_filters=True)
+    for i in range(6):
+        store.put(key=f"key{i}", value=b'value' * 4)
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+
+    # WHEN
+    store.force_compaction_l0()
+
+    # THEN
+    assert all(isinstance(sstable.bloom_filter, BlockedBloomFilter) for sstable in store.state.sstables_levels[0])
+    assert all(sstable.bloom_filter.nb_bytes == 0 for sstable in store.state.sstables_levels[0])
+    assert all(store.get(key=f"key{i}") == b'value' * 4 for i in range(6))
+    assert store.get(key="key9") is None
+
+
+def test_sstables_get_partitioned_indexes():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=40, directory=TEST_DIRECTORY, max_l0_sstables=100,
+                              nb_levels=1, index_partition_size=2)
+    for i in range(60):
+        store.put(key=f"key{i:02d}", value=b'value' * 4)
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+
+    # WHEN
+    store.force_compaction_l0()
+
+    # THEN
+    assert all(isinstance(sstable.meta_blocks, PartitionedIndex) for sstable in store.state.sstables_levels[0])
+    assert all(store.get(key=f"key{i:02d}") == b'value' * 4 for i in range(60))
+    assert store.get(key="key99") is None
+    assert [record.key for record in store.scan(lower="key10", upper="key19")] == [f"key{i}" for i in range(10, 20)]
+
+
+def test_partitioned_indexes_use_the_block_cache_of_the_reconstructed_store():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=40, directory=TEST_DIRECTORY, index_partition_size=2)
+    for i in range(30):
+        store.put(key=f"key{i:02d}", value=b'value' * 4)
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+
+    # WHEN
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+
+    # THEN
+    sstable = reconstructed_store.state.sstables_level0[0]
+    assert sstable.meta_blocks.block_cache is reconstructed_store.block_cache
+    assert sstable.meta_blocks.file is sstable.file
+    assert all(reconstructed_store.get(key=f"key{i:02d}") == b'value' * 4 for i in range(30))
+
+
+def test_scan_prefix_skips_sstables_without_the_prefix():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=50, directory=TEST_DIRECTORY, max_l0_sstables=100,
+                              prefix_extractor=PrefixExtractor(length=4))
+    for tenant in ["ten1", "ten2"]:
+        for i in range(5):
+            store.put(key=f"{tenant}/key{i}", value=f"{tenant}/value{i}".encode())
+        store._freeze_memtable()
+        store.flush_next_immutable_memtable()
+    store.put(key="ten1/key5", value=b'ten1/value5')
+    sstable_of_ten1, sstable_of_ten2 = store.state.sstables_level0[1], store.state.sstables_level0[0]
+
+    # WHEN
+    with mock.patch.object(sstable_of_ten2, 'scan', wraps=sstable_of_ten2.scan) as mocked_scan:
+        scanned_records = list(store.scan_prefix(prefix="ten1/"))
+
+    # THEN
+    mocked_scan.assert_not_called()
+    assert [record.key for record in scanned_records] == [f"ten1/key{i}" for i in range(6)]
+    assert sstable_of_ten1.may_contain_prefix(prefix="ten1")
+
+
+def test_scan_prefix_applies_the_range_tombstones_of_skipped_sstables():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=50, directory=TEST_DIRECTORY, max_l0_sstables=100,
+                              prefix_extractor=PrefixExtractor(length=4))
+    for i in range(5):
+        store.put(key=f"ten1/key{i}", value=f"value{i}".encode())
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.delete_range(lower="ten1/key1", upper="ten1/key3")
+    store.put(key="ten2/key0", value=b'value0')
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+
+    # WHEN
+    scanned_records = list(store.scan_prefix(prefix="ten1"))
+
+    # THEN
+    assert not store.state.sstables_level0[0].may_contain_prefix(prefix="ten1")
+    assert [record.key for record in scanned_records] == ["ten1/key0", "ten1/key3", "ten1/key4"]
+
+
+@pytest.mark.parametrize("prefix_extractor", [None, PrefixExtractor(length=4)])
+@pytest.mark.parametrize("prefix", ["te", "ten1", "ten1/key1"])
+def test_scan_prefix_returns_the_keys_with_the_prefix(prefix_extractor, prefix):
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=100, block_size=50, directory=TEST_DIRECTORY, max_l0_sstables=100,
+                              prefix_extractor=prefix_extractor)
+    keys = [f"ten{tenant}/key{i}" for tenant in range(3) for i in range(15)] + ["tf", "ten1"]
+    for key in keys:
+        store.put(key=key, value=key.encode())
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+
+    # WHEN
+    scanned_records = list(store.scan_prefix(prefix=prefix))
+
+    # THEN
+    assert [record.key for record in scanned_records] == sorted(key for key in keys if key.startswith(prefix))
+
+
+@pytest.mark.parametrize("prefix, successor", [
+    ("ten1", "ten2"),
+    ("a\U0010FFFF", "b"),
+    ("a\U0010FFFF\U0010FFFF", "b"),
+    ("\U0010FFFF", None),
+    ("a\uD7FF", "a\uE000"),
+])
+def test_prefix_successor(prefix, successor):
+    # GIVEN/WHEN/THEN
+    assert LsmStorage._prefix_successor(prefix=prefix) == successor
+
+
+@pytest.mark.parametrize("prefix", ["\U0010FFFF", "a\U0010FFFF", "\uD7FF"])
+def test_scan_prefix_ending_with_the_greatest_characters(prefix):
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=100, block_size=50, directory=TEST_DIRECTORY, nb_levels=2,
+                              max_l0_sstables=100)
+    keys = ["a", "a\U0010FFFF", "a\U0010FFFFz", "b", "\uD7FF", "\uD7FFz", "\uE000", "\U0010FFFF",
+            "\U0010FFFF\U0010FFFF"]
+    for key in keys[::2]:
+        store.put(key=key, value=key.encode())
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    for key in keys[1::2]:
+        store.put(key=key, value=key.encode())
+
+    # WHEN
+    scanned_records = list(store.scan_prefix(prefix=prefix))
+
+    # THEN
+    assert [record.key for record in scanned_records] == sorted(key for key in keys if key.startswith(prefix))
+
+
+@pytest.mark.parametrize("multi_get_threads", [1, 4])
+def test_multi_get_returns_the_same_values_as_get(multi_get_threads):
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=100, block_size=40, directory=TEST_DIRECTORY, nb_levels=2,
+                              max_l0_sstables=100, multi_get_threads=multi_get_threads)
+    for i in range(40):
+        store.put(key=f"key{i:02d}", value=f"value{i:02d}".encode())
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    for i in range(0, 40, 3):
+        store.put(key=f"key{i:02d}", value=f"value{i:02d}B".encode())
+    store.delete(key="key07")
+    store.delete_range(lower="key20", upper="key25")
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    store.put(key="key30", value=b'value30C')
+    keys = [f"key{i:02d}" for i in range(45, -1, -1)] + ["key03", "a", "z"]
+
+    # WHEN
+    values = store.multi_get(keys=keys)
+
+    # THEN
+    assert len(store.state.sstables_level0) > 1 and len(store.state.sstables_levels[0]) > 1
+    assert values == [store.get(key=key) for key in keys]
+    assert values[-3:] == [b'value03B', None, None]
+    store.close()
+
+
+def test_multi_get_reads_each_block_once():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=10_000, block_size=100, directory=TEST_DIRECTORY, block_cache_size=0)
+    for i in range(100):
+        store.put(key=f"key{i:02d}", value=f"value{i:02d}".encode())
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    sstable = store.state.sstables_level0[0]
+    keys = [f"key{i:02d}" for i in range(0, 100, 2)]
+
+    # WHEN
+    with mock.patch.object(sstable, 'read_data_block') as mocked_read_data_block, \
+            mock.patch.object(sstable.file, 'read_range', wraps=sstable.file.read_range) as mocked_read_range:
+        values = store.multi_get(keys=keys)
+
+    # THEN
+    assert values == [f"value{i:02d}".encode() for i in range(0, 100, 2)]
+    mocked_read_data_block.assert_not_called()
+    assert mocked_read_range.call_count == 1  # All the blocks are consecutive
+
+
+def test_background_scheduler_flushes_and_compacts():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY, max_l0_sstables=3,
+                              scheduler_options=SchedulerOptions(nb_compaction_threads=2))
+    records = [(f"key{i:02d}", f"value{i:02d}".encode()) for i in range(40)]
+
+    # WHEN
+    for key, value in records:
+        store.put(key=key, value=value)
+    store.scheduler.wait_until_idle()
+
+    # THEN
+    assert store.scheduler.error is None
+    assert len(store.state.immutable_memtables) == 0
+    assert len(store.state.sstables_level0) < 3
+    assert sum(len(level) for level in store.state.sstables_levels) > 0
+    assert all(store.get(key=key) == value for key, value in records)
+    store.close()
+
+
+def test_background_scheduler_does_not_compute_the_levels_to_compact_while_holding_its_condition():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY, max_l0_sstables=3,
+                              scheduler_options=SchedulerOptions(nb_compaction_threads=2))
+    original_levels_to_compact = store._levels_to_compact
+    calls_holding_the_condition = []
+
+    def _checked_levels_to_compact():
+        # Jobs take the locks of the store, then `_condition`: taking them the other way round could deadlock
+        calls_holding_the_condition.append(store.scheduler._condition._is_owned())
+        return original_levels_to_compact()
+
+    store._levels_to_compact = _checked_levels_to_compact
+
+    # WHEN
+    for i in range(40):
+        store.put(key=f"key{i:02d}", value=f"value{i:02d}".encode())
+    store.scheduler.wait_until_idle()
+
+    # THEN
+    assert store.scheduler.error is None
+    assert len(calls_holding_the_condition) > 0
+    assert not any(calls_holding_the_condition)
+    assert store._levels_to_compact() == []
+    store.close()
+
+
+@pytest.mark.parametrize("durability", [Durability.NONE, Durability.BATCHED_FSYNC, Durability.FSYNC])
+def test_acknowledged_writes_of_concurrent_writers_are_not_lost(durability):
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=200, block_size=50, directory=TEST_DIRECTORY, max_l0_sstables=4,
+                              durability=durability, scheduler_options=SchedulerOptions(nb_compaction_threads=2))
+    nb_writers, nb_keys_per_writer = 4, 100
+
+    def _write(writer_id: int):
+        for i in range(nb_keys_per_writer):
+            key = f"key{writer_id}-{i:03d}"
+            store.put(key=key, value=key.encode())
+            if i % 10 == 9:
+                store.delete(key=f"key{writer_id}-{i - 1:03d}")
+                store.delete_range(lower=f"key{writer_id}-{i - 3:03d}", upper=f"key{writer_id}-{i - 2:03d}")
+
+    # WHEN
+    writers = [threading.Thread(target=_write, args=(writer_id,)) for writer_id in range(nb_writers)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    store.scheduler.wait_until_idle()
+
+    # THEN
+    deleted_keys = {f"key{writer_id}-{i:03d}" for writer_id in range(nb_writers)
+                    for i in range(nb_keys_per_writer) if i % 10 in (6, 8)}
+    expected_keys = sorted(f"key{writer_id}-{i:03d}" for writer_id in range(nb_writers)
+                           for i in range(nb_keys_per_writer) if f"key{writer_id}-{i:03d}" not in deleted_keys)
+    assert store.scheduler.error is None
+    assert all(store.get(key=key) == key.encode() for key in expected_keys)
+    assert [record.key for record in store.scan(lower="key", upper="key9")] == expected_keys
+    store.close()
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+    assert all(reconstructed_store.get(key=key) == key.encode() for key in expected_keys)
+    assert all(reconstructed_store.get(key=key) is None for key in deleted_keys)
+    reconstructed_store.close()
+
+
+def test_writes_are_stopped_while_too_many_memtables_wait_for_flush():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY,
+                              scheduler_options=SchedulerOptions(slowdown_immutable_memtables=1,
+                                                                 stop_immutable_memtables=1))
+    flush_can_start = threading.Event()
+    original_flush_in_background = store._flush_in_background
+
+    def _blocked_flush_in_background():
+        flush_can_start.wait()
+        original_flush_in_background()
+
+    store._flush_in_background = _blocked_flush_in_background
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')  # Freezes the memtable
+    assert len(store.state.immutable_memtables) == 1
+
+    # WHEN
+    writer = threading.Thread(target=lambda: store.put(key="key3", value=b'value3'))
+    writer.start()
+    writer.join(timeout=0.1)
+    is_writer_stopped = writer.is_alive()
+    flush_can_start.set()
+    writer.join()
+
+    # THEN
+    assert is_writer_stopped
+    assert store.scheduler.nb_stops == 1
+    assert store.get(key="key3") == b'value3'
+    store.close()
+
+
+def test_writes_fail_after_a_background_job_failed():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY,
+                              scheduler_options=SchedulerOptions())
+    store._flush_in_background = mock.Mock(side_effect=OSError("No space left on device"))
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')  # Freezes the memtable
+    store.scheduler.wait_until_idle()
+
+    # WHEN/THEN
+    with pytest.raises(RuntimeError):
+        store.put(key="key3", value=b'value3')
+    assert isinstance(store.scheduler.error, OSError)
+    store.close()
+
+
+def test_writes_cannot_be_stopped_before_l0_gets_compacted():
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError):
+        LsmStorage.create(directory=TEST_DIRECTORY, max_l0_sstables=10,
+                          scheduler_options=SchedulerOptions(stop_l0_sstables=5))
+
+
+def test_memtables_use_the_durability_of_the_store():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, directory=TEST_DIRECTORY, durability=Durability.BATCHED_FSYNC)
+
+    # WHEN
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')  # Freezes the memtable
+
+    # THEN
+    assert store.state.memtable.wal.durability == Durability.BATCHED_FSYNC
+    assert store.state.immutable_memtables[0].wal.durability == Durability.BATCHED_FSYNC
+
+
+def test_write_batch_applies_all_writes():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, directory=TEST_DIRECTORY)
+    batch = WriteBatch()
+    batch.put(key="key1", value=b'value1A')
+    batch.put(key="key2", value=b'value2')
+    batch.put(key="key1", value=b'value1B')
+
+    # WHEN
+    with mock.patch.object(store.state.memtable.wal, 'append', wraps=store.state.memtable.wal.append) as mocked_append:
+        store.write(batch=batch)
+
+    # THEN
+    mocked_append.assert_called_once()
+    assert store.get(key="key1") == b'value1B'
+    assert store.get(key="key2") == b'value2'
+
+
+def test_write_batch_is_applied_to_a_single_memtable():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, directory=TEST_DIRECTORY)
+    batch = WriteBatch()
+    for i in range(5):
+        batch.put(key=f"key{i}", value=f"value{i}".encode())
+
+    # WHEN
+    store.write(batch=batch)
+
+    # THEN
+    assert len(store.state.immutable_memtables) == 1
+    assert all(store.state.immutable_memtables[0].get(key=f"key{i}") == f"value{i}".encode() for i in range(5))
+
+
+def test_deleted_key_is_absent(empty_store):
+    # GIVEN
+    store = empty_store
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')
+
+    # WHEN
+    store.delete(key="key1")
+
+    # THEN
+    assert store.get(key="key1") is None
+    assert store.get(key="key2") == b'value2'
+
+
+def test_tombstones_hide_values_of_older_layers():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY)
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')  # Freezes the memtable
+    store.flush_next_immutable_memtable()
+
+    # WHEN
+    store.delete(key="key1")
+    batch = WriteBatch()
+    batch.delete(key="key2")
+    store.write(batch=batch)
+
+    # THEN
+    assert store.get(key="key1") is None
+    assert store.get(key="key2") is None
+    assert list(store.scan(lower="key0", upper="key9")) == []
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    assert store.get(key="key1") is None
+    assert list(store.scan(lower="key0", upper="key9")) == []
+
+
+def test_compaction_into_last_level_drops_tombstones_and_shadowed_records():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=30, block_size=20, directory=TEST_DIRECTORY, nb_levels=2,
+                              max_l0_sstables=100)
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')  # Freezes the memtable
+    store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    store.force_compaction_l1_or_more_level(level=1)
+    store.delete(key="key1")
+    store.put(key="key2", value=b'value2B')  # Freezes the memtable
+    store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+
+    # WHEN
+    store.force_compaction_l1_or_more_level(level=1)
+
+    # THEN
+    last_level_records = [record for sstable in store.state.sstables_levels[1] for record in SSTableIterator(sstable)]
+    assert last_level_records == [Record(key="key2", value=b'value2B')]
+    assert store.get(key="key1") is None
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+    assert reconstructed_store.state.sstables_levels[1] == store.state.sstables_levels[1]
+
+
+def test_delete_range_hides_keys_of_all_layers():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=50, directory=TEST_DIRECTORY)
+    for i in range(10):
+        store.put(key=f"key{i}", value=f"value{i}".encode())
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.put(key="key5", value=b'value5B')
+
+    # WHEN
+    store.delete_range(lower="key2", upper="key8")
+    store.put(key="key6", value=b'value6B')
+
+    # THEN
+    assert [store.get(key=f"key{i}") for i in range(10)] == [
+        b'value0', b'value1', None, None, None, None, b'value6B', None, b'value8', b'value9']
+    assert [record.key for record in store.scan(lower="key0", upper="key9")] == [
+        "key0", "key1", "key6", "key8", "key9"]
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    assert [store.get(key=f"key{i}") for i in range(10)] == [
+        b'value0', b'value1', None, None, None, None, b'value6B', None, b'value8', b'value9']
+    assert [record.key for record in store.scan(lower="key0", upper="key9")] == [
+        "key0", "key1", "key6", "key8", "key9"]
+
+
+def test_scan_and_compaction_skip_thousands_of_blocks_covered_by_a_range_tombstone():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1_000_000, block_size=30, directory=TEST_DIRECTORY, max_l0_sstables=100)
+    for i in range(5000):
+        store.put(key=f"k{i:06d}", value=b'value')
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.delete_range(lower="k000001", upper="k004990")
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+
+    # WHEN
+    scanned_keys = [record.key for record in store.scan(lower="k", upper="l")]
+    store.force_compaction_l0()
+
+    # THEN
+    expected_keys = ["k000000"] + [f"k{i:06d}" for i in range(4990, 5000)]
+    assert scanned_keys == expected_keys
+    assert [record.key for record in store.scan(lower="k", upper="l")] == expected_keys
+
+
+def test_compaction_skips_data_blocks_covered_by_range_tombstones():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=50, directory=TEST_DIRECTORY, max_l0_sstables=100)
+    for i in range(10):
+        store.put(key=f"key{i}", value=f"value{i}".encode())
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    old_sstable = store.state.sstables_level0[0]
+    nb_blocks = len(old_sstable.meta_blocks)
+    store.delete_range(lower="key", upper="key9")
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+
+    # WHEN
+    with mock.patch.object(old_sstable, 'read_data_block', wraps=old_sstable.read_data_block) as mocked_read:
+        store.force_compaction_l0()
+
+    # THEN
+    assert nb_blocks > 1
+    assert mocked_read.call_count == 1  # Only the block of key9 is read
+    assert [store.get(key=f"key{i}") for i in range(10)] == [None] * 9 + [b'value9']
+    assert store.state.sstables_levels[0][-1].range_tombstones == \
+        RangeTombstones([RangeTombstone(start="key", end="key9")])
+
+
+def test_range_tombstones_are_dropped_in_the_last_level():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=50, directory=TEST_DIRECTORY, nb_levels=2,
+                              max_l0_sstables=100)
+    for i in range(10):
+        store.put(key=f"key{i}", value=f"value{i}".encode())
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    store.force_compaction_l1_or_more_level(level=1)
+    store.delete_range(lower="key2", upper="key8")
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+
+    # WHEN
+    store.force_compaction_l1_or_more_level(level=1)
+
+    # THEN
+    last_level = store.state.sstables_levels[1]
+    assert all(len(sstable.range_tombstones) == 0 for sstable in last_level)
+    assert [record.key for sstable in last_level for record in SSTableIterator(sstable)] == [
+        "key0", "key1", "key8", "key9"]
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+    assert [reconstructed_store.get(key=f"key{i}") for i in range(10)] == [
+        b'value0', b'value1', None, None, None, None, None, None, b'value8', b'value9']
+
+
+def test_unflushed_memtables_are_recovered_from_their_wal_upon_opening():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=100, directory=TEST_DIRECTORY)
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.put(key="key2", value=b'value2B')
+    store.delete_range(lower="key1", upper="key2")
+    store._freeze_memtable()
+    store.put(key="key3", value=b'value3')
+    # The store crashes: neither the immutable memtable nor the active one are flushed
+
+    # WHEN
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+
+    # THEN
+    assert reconstructed_store.get(key="key1") is None
+    assert reconstructed_store.get(key="key2") == b'value2B'
+    assert reconstructed_store.get(key="key3") == b'value3'
+    assert len(reconstructed_store.state.immutable_memtables) == 0
+    assert len(reconstructed_store.state.sstables_level0) == 3
+    assert WriteAheadLog.list_paths(directory=TEST_DIRECTORY) == [reconstructed_store.state.memtable.wal.path]
+
+
+def test_store_is_recovered_from_a_wal_with_a_torn_last_record():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=100, directory=TEST_DIRECTORY)
+    store.put(key="key1", value=b'value1')
+    store.put(key="key2", value=b'value2')
+    with open(store.state.memtable.wal.path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)  # The store crashes while the last record is being written
+
+    # WHEN
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+
+    # THEN
+    assert reconstructed_store.get(key="key1") == b'value1'
+    assert reconstructed_store.get(key="key2") is None
+
+
+def test_wal_of_a_flushed_memtable_is_not_replayed():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=1000, block_size=100, directory=TEST_DIRECTORY)
+    store.put(key="key1", value=b'value1')
+    store._freeze_memtable()
+    flushed_wal_path = store.state.immutable_memtables[0].wal.path
+    with mock.patch.object(WriteAheadLog, 'remove_self'):  # The store crashes before the WAL is removed
+        store.flush_next_immutable_memtable()
+
+    # WHEN
+    reconstructed_store = LsmStorage.reconstruct_from_manifest(manifest_path=store.manifest.file.path)
+
+    # THEN
+    assert reconstructed_store.get(key="key1") == b'value1'
+    assert len(reconstructed_store.state.sstables_level0) == 1
+    assert flushed_wal_path not in WriteAheadLog.list_paths(directory=TEST_DIRECTORY)
+
+
+def test_scan_includes_all_levels():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=40, block_size=20, directory=TEST_DIRECTORY, nb_levels=3,
+                              max_l0_sstables=100)
+    for i in range(6):
+        store.put(key=f"key{i}", value=f"value{i}".encode())  # Freezes the memtable twice
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    for level in [1, 2]:
+        while len(store.state.sstables_levels[level - 1]):
+            store.force_compaction_l1_or_more_level(level=level)
+    store.put(key="key1", value=b'value1B')
+    store.delete(key="key4")
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    while len(store.state.sstables_levels[0]):
+        store.force_compaction_l1_or_more_level(level=1)
+    store.put(key="key3", value=b'value3B')
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    store.put(key="key5", value=b'value5B')
+    store._freeze_memtable()
+    store.flush_next_immutable_memtable()
+    store.put(key="key2", value=b'value2C')
+
+    # WHEN
+    scanned_records = list(store.scan(lower="key1", upper="key5"))
+
+    # THEN
+    assert len(store.state.sstables_level0) > 0
+    assert all(len(level) > 0 for level in store.state.sstables_levels)
+    assert scanned_records == [Record(key="key1", value=b'value1B'), Record(key="key2", value=b'value2C'),
+                               Record(key="key3", value=b'value3B'), Record(key="key5", value=b'value5B')]
+
+
+def test_scan_only_reads_sstables_of_levels_that_overlap_the_range_when_reaching_them():
+    # GIVEN
+    store = LsmStorage.create(max_sstable_size=20, block_size=20, directory=TEST_DIRECTORY, max_l0_sstables=100)
+    for i in range(6):
+        store.put(key=f"key{i}", value=f"value{i}".encode())
+    while len(store.state.immutable_memtables):
+        store.flush_next_immutable_memtable()
+    store.force_compaction_l0()
+    level = store.state.sstables_levels[0]
+    first_sstable, last_sstable = level[0], level[-1]
+
+    # WHEN
+    with mock.patch.object(first_sstable, 'read_data_block', wraps=first_sstable.read_data_block) as mocked_first, \
+            mock.patch.object(last_sstable, 'read_data_block', wraps=last_sstable.read_data_block) as mocked_last:
+        scanned_records = store.scan(lower="key0", upper="key1")
+        first_record = next(scanned_records)
+
+        # THEN
+        assert first_record == Record(key="key0", value=b'value0')
+        assert list(scanned_records) == [Record(key="key1", value=b'value1')]
+        assert mocked_first.call_count > 0
+        assert mocked_last.call_count == 0
+    assert len(level) > 2
+
+
+def test_sorted_runs_of_a_level():
+    # GIVEN
+    def sstable_with_keys(first_key, last_key):
+        return SSTable(meta_blocks=[], meta_block_offset=0, file=SSTableFile(path=f"{first_key}-{last_key}"),
+                       bloom_filter=BloomFilter(nb_bytes=1, nb_hash_functions=1), first_key=first_key,
+                       last_key=last_key)
+
+    newest_1, newest_2 = sstable_with_keys("a", "c"), sstable_with_keys("d", "f")
+    oldest_1, oldest_2 = sstable_with_keys("b", "e"), sstable_with_keys("g", "h")
+
+    # WHEN
+    sorted_runs = LsmStorage._sorted_runs(sstables=[newest_1, newest_2, oldest_1, oldest_2])
+
+    # THEN
+    assert sorted_runs == [[newest_1, newest_2], [oldest_1, oldest_2]]
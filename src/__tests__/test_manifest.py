@@ -1,13 +1,19 @@
+import struct
 from contextlib import nullcontext as does_not_raise
 from unittest import mock
 
 import pytest
 
+from src.compaction import CompactionStyle
+from src.compression import Compression
+from src.prefix_extractor import PrefixExtractor
 from src.manifest import (
     Manifest,
     ManifestSSTable,
     FlushEvent,
     CompactionEvent,
+    TrivialMoveEvent,
+    CompactionPointerEvent,
     ManifestFlushRecord,
     ManifestCompactionRecord,
     ManifestSSTablesBlock,
@@ -15,6 +21,8 @@ from src.manifest import (
     ManifestHeader,
     ManifestFile,
     Configuration,
+    HEADER_MAGIC,
+    HEADER_VERSION,
 )
 
 
@@ -296,6 +304,31 @@ def test_encode_decode_manifest_flush_record(sstable_one_block_1):
     assert manifest_flush_record.event.sstable == decoded_manifest_record.event.sstable
 
 
+def test_encode_decode_manifest_flush_record_with_wal_name(sstable_one_block_1):
+    # GIVEN
+    flush_event = FlushEvent(sstable=sstable_one_block_1, wal_name="1712345678.123456.wal")
+    manifest_flush_record = ManifestFlushRecord(event=flush_event)
+
+    # WHEN
+    encoded_manifest_record = manifest_flush_record.to_bytes()
+    decoded_manifest_record = ManifestFlushRecord.from_bytes(data=encoded_manifest_record)
+
+    # THEN
+    assert decoded_manifest_record.event == flush_event
+
+
+def test_decode_manifest_flush_record_without_wal_name(sstable_one_block_1):
+    # GIVEN
+    encoded_manifest_sstable = ManifestSSTable(sstable=sstable_one_block_1).to_bytes()
+    encoded_manifest_record = struct.pack("B", len(encoded_manifest_sstable)) + encoded_manifest_sstable
+
+    # WHEN
+    decoded_manifest_record = ManifestFlushRecord.from_bytes(data=encoded_manifest_record)
+
+    # THEN
+    assert decoded_manifest_record.event == FlushEvent(sstable=sstable_one_block_1)
+
+
 def test_encode_decode_manifest_sstable_block(sstable_one_block_1, sstable_one_block_2):
     # GIVEN
     sstable1 = sstable_one_block_1
@@ -366,6 +399,71 @@ def test_encode_decode_manifest_record_which_is_a_compaction_record(sstable_one_
     assert manifest_record.event == decoded_manifest_record.event
 
 
+def test_encode_decode_manifest_record_which_is_a_trivial_move_record(sstable_one_block_1, sstable_one_block_2):
+    # GIVEN
+    trivial_move_event = TrivialMoveEvent(sstables=[sstable_one_block_1, sstable_one_block_2], level=2)
+    manifest_record = ManifestRecord(event=trivial_move_event)
+
+    # WHEN
+    encoded_manifest_record = manifest_record.to_bytes()
+    decoded_manifest_record = ManifestRecord.from_bytes(data=encoded_manifest_record)
+
+    # THEN
+    assert isinstance(decoded_manifest_record.event, TrivialMoveEvent)
+    assert manifest_record.event == decoded_manifest_record.event
+    assert decoded_manifest_record.size == len(encoded_manifest_record)
+
+
+def test_reconstruct_from_a_trivial_move_event(sstable_one_block_1, sstable_one_block_2, empty_manifest_file,
+                                               empty_manifest_file_configuration):
+    # GIVEN
+    events = [
+        FlushEvent(sstable=sstable_one_block_1),
+        FlushEvent(sstable=sstable_one_block_2),
+        TrivialMoveEvent(sstables=[sstable_one_block_1], level=0),
+    ]
+    manifest = Manifest(events=events, configuration=empty_manifest_file_configuration, file=empty_manifest_file)
+
+    # WHEN
+    all_ss_tables_levels = manifest.reconstruct_sstables()
+
+    # THEN
+    assert list(all_ss_tables_levels[0]) == [sstable_one_block_2]
+    assert list(all_ss_tables_levels[1]) == [sstable_one_block_1]
+
+
+def test_encode_decode_manifest_record_which_is_a_compaction_pointer_record():
+    # GIVEN
+    manifest_record = ManifestRecord(event=CompactionPointerEvent(level=2, key="key42"))
+
+    # WHEN
+    encoded_manifest_record = manifest_record.to_bytes()
+    decoded_manifest_record = ManifestRecord.from_bytes(data=encoded_manifest_record)
+
+    # THEN
+    assert isinstance(decoded_manifest_record.event, CompactionPointerEvent)
+    assert manifest_record.event == decoded_manifest_record.event
+    assert decoded_manifest_record.size == len(encoded_manifest_record)
+
+
+def test_compaction_pointers_are_the_last_ones_recorded_for_each_level(sstable_one_block_1, empty_manifest_file,
+                                                                       empty_manifest_file_configuration):
+    # GIVEN
+    events = [
+        FlushEvent(sstable=sstable_one_block_1),
+        CompactionPointerEvent(level=1, key="key1"),
+        CompactionPointerEvent(level=2, key="key5"),
+        CompactionPointerEvent(level=1, key="key3"),
+    ]
+    manifest = Manifest(events=events, configuration=empty_manifest_file_configuration, file=empty_manifest_file)
+
+    # WHEN
+    compaction_pointers = manifest.compaction_pointers()
+
+    # THEN
+    assert compaction_pointers == {1: "key3", 2: "key5"}
+
+
 def test_encode_decode_header():
     # GIVEN
     configuration = Configuration(nb_levels=6, levels_ratio=0.10, max_l0_sstables=10,
@@ -380,6 +478,127 @@ def test_encode_decode_header():
     assert decoded_header == header
 
 
+def test_encode_decode_header_with_compression_per_level():
+    # GIVEN
+    configuration = Configuration(nb_levels=6, levels_ratio=0.10, max_l0_sstables=10,
+                                  block_size=65_536, max_sstable_size=262_144_000,
+                                  compression_per_level=[Compression.NONE, Compression.ZLIB, Compression.LZMA])
+    header = ManifestHeader(configuration=configuration)
+
+    # WHEN
+    decoded_header = ManifestHeader.from_bytes(data=header.to_bytes())
+
+    # THEN
+    assert decoded_header == header
+    assert decoded_header.configuration.compression_for_level(level=0) == Compression.NONE
+    assert decoded_header.configuration.compression_for_level(level=1) == Compression.ZLIB
+    assert decoded_header.configuration.compression_for_level(level=5) == Compression.LZMA
+
+
+def test_encode_decode_header_with_level_targets_and_compaction_style():
+    # GIVEN
+    configuration = Configuration(nb_levels=6, levels_ratio=0.10, max_l0_sstables=10,
+                                  block_size=65_536, max_sstable_size=262_144_000,
+                                  compression_per_level=[Compression.ZLIB],
+                                  base_level_size=10_737_418_240, dynamic_level_bytes=True,
+                                  compaction_style=CompactionStyle.UNIVERSAL)
+    header = ManifestHeader(configuration=configuration)
+
+    # WHEN
+    decoded_header = ManifestHeader.from_bytes(data=header.to_bytes())
+
+    # THEN
+    assert decoded_header == header
+    assert decoded_header.configuration.base_level_size == 10_737_418_240
+    assert decoded_header.configuration.dynamic_level_bytes
+    assert decoded_header.configuration.compaction_style == CompactionStyle.UNIVERSAL
+
+
+def test_encode_decode_header_with_bloom_filters_per_level():
+    # GIVEN
+    configuration = Configuration(nb_levels=3, levels_ratio=0.10, max_l0_sstables=10,
+                                  block_size=65_536, max_sstable_size=262_144_000,
+                                  bloom_bits_per_key_per_level=[14, 9.5, 0], blocked_bloom_filters=True)
+    header = ManifestHeader(configuration=configuration)
+
+    # WHEN
+    decoded_header = ManifestHeader.from_bytes(data=header.to_bytes())
+
+    # THEN
+    assert decoded_header == header
+    assert decoded_header.configuration.blocked_bloom_filters
+    assert decoded_header.configuration.bloom_bits_per_key_for_level(level=1) == 9.5
+    assert decoded_header.configuration.bloom_bits_per_key_for_level(level=5) == 0
+
+
+def test_encode_decode_header_with_index_partition_size():
+    # GIVEN
+    configuration = Configuration(nb_levels=3, levels_ratio=0.10, max_l0_sstables=10,
+                                  block_size=65_536, max_sstable_size=262_144_000, index_partition_size=16)
+    header = ManifestHeader(configuration=configuration)
+
+    # WHEN
+    decoded_header = ManifestHeader.from_bytes(data=header.to_bytes())
+
+    # THEN
+    assert decoded_header == header
+    assert decoded_header.configuration.index_partition_size == 16
+
+
+def test_encode_decode_header_with_prefix_extractor():
+    # GIVEN
+    configuration = Configuration(nb_levels=3, levels_ratio=0.10, max_l0_sstables=10,
+                                  block_size=65_536, max_sstable_size=262_144_000,
+                                  prefix_extractor=PrefixExtractor(length=8))
+    header = ManifestHeader(configuration=configuration)
+
+    # WHEN
+    decoded_header = ManifestHeader.from_bytes(data=header.to_bytes())
+
+    # THEN
+    assert decoded_header == header
+    assert decoded_header.configuration.prefix_extractor == PrefixExtractor(length=8)
+
+
+def test_decode_legacy_header_defaults_the_missing_fields():
+    # GIVEN
+    encoded_header = struct.pack("=idiii", 6, 0.1, 10, 262_144_000, 65_536)
+
+    # WHEN
+    decoded_header = ManifestHeader.from_bytes(data=encoded_header)
+
+    # THEN
+    assert decoded_header == ManifestHeader(configuration=Configuration(nb_levels=6, levels_ratio=0.1,
+                                                                        max_l0_sstables=10,
+                                                                        max_sstable_size=262_144_000,
+                                                                        block_size=65_536))
+    assert decoded_header.configuration.compression_for_level(level=0) == Compression.NONE
+    assert decoded_header.configuration.compaction_style == CompactionStyle.LEVELED
+    assert decoded_header.configuration.prefix_extractor is None
+
+
+def test_decode_header_with_unsupported_version_should_raise_an_error():
+    # GIVEN
+    encoded_header = HEADER_MAGIC + struct.pack("B", HEADER_VERSION + 1)
+
+    # WHEN/THEN
+    with pytest.raises(ValueError):
+        ManifestHeader.from_bytes(data=encoded_header)
+
+
+def test_build_manifest_from_file_with_baseline_layout(baseline_manifest_path, sstable_one_block_1):
+    # GIVEN
+    path = baseline_manifest_path
+
+    # WHEN
+    manifest = Manifest.build(manifest_path=path)
+
+    # THEN
+    assert manifest.configuration == Configuration(nb_levels=6, levels_ratio=0.1, max_l0_sstables=10,
+                                                   max_sstable_size=262_144_000, block_size=65_536)
+    assert manifest.events == [FlushEvent(sstable=sstable_one_block_1)]
+
+
 def test_create_manifest_file_from_existing_path_should_raise_an_error(empty_manifest_file):
     # GIVEN
     path_with_file = empty_manifest_file.path
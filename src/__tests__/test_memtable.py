@@ -72,6 +72,75 @@ def test_can_recover(empty_memtable):
     assert [record for record in resulting_memtable.map] == [record for record in memtable.map]
 
 
+def test_can_recover_batches(empty_memtable):
+    # GIVEN
+    memtable = empty_memtable
+    memtable.put(key="1", value=b'1')
+    memtable.put_batch(records=[Record(key="4", value=b'4'), Record(key="6", value=b'6')])
+    memtable.put(key="9", value=b'9')
+    wal_path = memtable.wal.path
+
+    # WHEN
+    resulting_memtable = memtable.create_from_wal(wal_path=wal_path)
+
+    # THEN
+    assert [record for record in resulting_memtable.map] == [record for record in memtable.map]
+
+
+def test_torn_batch_is_not_recovered(empty_memtable):
+    # GIVEN
+    memtable = empty_memtable
+    memtable.put(key="1", value=b'1')
+    memtable.put_batch(records=[Record(key="4", value=b'4'), Record(key="6", value=b'6')])
+    wal_path = memtable.wal.path
+    with open(wal_path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 1)  # Simulates a crash while the batch was being written
+
+    # WHEN
+    resulting_memtable = memtable.create_from_wal(wal_path=wal_path)
+
+    # THEN
+    assert resulting_memtable.get(key="1") == b'1'
+    assert resulting_memtable.get(key="4") is None
+    assert resulting_memtable.get(key="6") is None
+
+
+def test_delete_range_hides_records_put_before_it(empty_memtable):
+    # GIVEN
+    memtable = empty_memtable
+    for key in ["1", "4", "6", "9"]:
+        memtable.put(key=key, value=key.encode(encoding="utf-8"))
+
+    # WHEN
+    memtable.delete_range(lower="3", upper="9")
+    memtable.put(key="6", value=b'6 again')
+
+    # THEN
+    assert memtable.get(key="1") == b'1'
+    assert memtable.get(key="4") is None
+    assert memtable.get_record(key="5") == Record.tombstone(key="5")
+    assert memtable.get(key="6") == b'6 again'
+    assert memtable.get(key="9") == b'9'
+
+
+def test_can_recover_range_tombstones(empty_memtable):
+    # GIVEN
+    memtable = empty_memtable
+    memtable.put(key="1", value=b'1')
+    memtable.put(key="4", value=b'4')
+    memtable.delete_range(lower="3", upper="9")
+    memtable.put(key="6", value=b'6')
+    wal_path = memtable.wal.path
+
+    # WHEN
+    resulting_memtable = memtable.create_from_wal(wal_path=wal_path)
+
+    # THEN
+    assert resulting_memtable == memtable
+    assert resulting_memtable.get(key="4") is None
+    assert resulting_memtable.get(key="6") == b'6'
+
+
 def test_equal(empty_memtable, empty_memtable2):
     # GIVEN
     memtable1 = empty_memtable
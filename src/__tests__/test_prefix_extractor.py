@@ -0,0 +1,29 @@
+import pytest
+
+from src.prefix_extractor import PrefixExtractor
+
+
+def test_extract_prefix_of_keys():
+    # GIVEN
+    prefix_extractor = PrefixExtractor(length=8)
+
+    # WHEN/THEN
+    assert prefix_extractor.in_domain("tenant01/entity42")
+    assert prefix_extractor.transform("tenant01/entity42") == "tenant01"
+    assert prefix_extractor.in_domain("tenant01")
+    assert not prefix_extractor.in_domain("tenant")
+
+
+@pytest.mark.parametrize("prefix_extractor", [PrefixExtractor(length=8), None])
+def test_encode_decode_prefix_extractor(prefix_extractor):
+    # WHEN
+    decoded_prefix_extractor = PrefixExtractor.decode(data=PrefixExtractor.encode(prefix_extractor=prefix_extractor))
+
+    # THEN
+    assert decoded_prefix_extractor == prefix_extractor
+
+
+def test_prefix_extractor_needs_a_positive_length():
+    # WHEN/THEN
+    with pytest.raises(ValueError):
+        PrefixExtractor(length=0)
@@ -0,0 +1,89 @@
+import pytest
+
+from src.range_tombstones import RangeTombstone, RangeTombstones
+
+
+def test_range_tombstone_must_not_be_empty():
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError):
+        RangeTombstone(start="b", end="a")
+
+
+def test_can_encode_and_decode_range_tombstone():
+    # GIVEN
+    range_tombstone = RangeTombstone(start="key1", end="key5")
+
+    # WHEN
+    encoded_range_tombstone = range_tombstone.to_bytes()
+    decoded_range_tombstone = RangeTombstone.from_bytes(encoded_range_tombstone)
+
+    # THEN
+    assert encoded_range_tombstone == b'\x04\x00\x00\x00key1\x04\x00\x00\x00key5'
+    assert decoded_range_tombstone == range_tombstone
+
+
+def test_overlapping_and_contiguous_range_tombstones_are_merged():
+    # GIVEN
+    range_tombstones = RangeTombstones([RangeTombstone(start="f", end="h"), RangeTombstone(start="a", end="c")])
+
+    # WHEN
+    range_tombstones.add(RangeTombstone(start="b", end="d"))
+    range_tombstones.add(RangeTombstone(start="h", end="j"))
+    range_tombstones.add(RangeTombstone(start="m", end="n"))
+
+    # THEN
+    assert list(range_tombstones) == [RangeTombstone(start="a", end="d"), RangeTombstone(start="f", end="j"),
+                                      RangeTombstone(start="m", end="n")]
+    assert range_tombstones.first_key == "a"
+    assert range_tombstones.last_key == "n"
+
+
+def test_covers_keys_from_start_included_to_end_excluded():
+    # GIVEN
+    range_tombstones = RangeTombstones([RangeTombstone(start="b", end="d"), RangeTombstone(start="f", end="h")])
+
+    # WHEN
+    covered_keys = [key for key in "abcdefghi" if range_tombstones.covers(key=key)]
+
+    # THEN
+    assert covered_keys == ["b", "c", "f", "g"]
+    assert range_tombstones.covers_range(first_key="b", last_key="c9") is True
+    assert range_tombstones.covers_range(first_key="c", last_key="f") is False
+    assert range_tombstones.covers_range(first_key="a", last_key="c") is False
+
+
+def test_clip():
+    # GIVEN
+    range_tombstones = RangeTombstones([RangeTombstone(start="b", end="d"), RangeTombstone(start="f", end="h")])
+
+    # WHEN
+    clipped_range_tombstones = range_tombstones.clip(lower="c", upper="g")
+
+    # THEN
+    assert list(clipped_range_tombstones) == [RangeTombstone(start="c", end="d"), RangeTombstone(start="f", end="g")]
+    assert list(range_tombstones.clip(upper="b")) == []
+    assert list(range_tombstones.clip(lower="g")) == [RangeTombstone(start="g", end="h")]
+
+
+def test_shadowing_range_tombstones_are_those_of_newer_layers():
+    # GIVEN
+    newest = RangeTombstones([RangeTombstone(start="a", end="b")])
+    middle = RangeTombstones()
+    oldest = RangeTombstones([RangeTombstone(start="c", end="d")])
+
+    # WHEN
+    shadowing = RangeTombstones.shadowing([newest, middle, oldest])
+
+    # THEN
+    assert shadowing == [RangeTombstones(), newest, newest]
+
+
+def test_can_encode_and_decode_range_tombstones():
+    # GIVEN
+    range_tombstones = RangeTombstones([RangeTombstone(start="b", end="d"), RangeTombstone(start="f", end="h")])
+
+    # WHEN
+    decoded_range_tombstones = RangeTombstones.from_bytes(range_tombstones.to_bytes())
+
+    # THEN
+    assert decoded_range_tombstones == range_tombstones
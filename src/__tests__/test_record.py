@@ -13,3 +13,31 @@ def test_can_decode_record():
 
     # THEN
     assert out_record == in_record
+
+
+def test_can_decode_tombstone():
+    # GIVEN
+    in_record = Record.tombstone(key="key")
+    in_bytes = in_record.to_bytes()
+
+    # WHEN
+    out_record = Record.from_bytes(in_bytes)
+
+    # THEN
+    assert in_bytes == b'\x03\x00\x00\x00key\xff\xff\xff\xff'
+    assert out_record.is_tombstone
+    assert out_record == in_record
+    assert out_record != Record(key="key", value=b'')
+
+
+def test_can_decode_record_with_multibyte_characters_in_its_key():
+    # GIVEN
+    in_record = Record(key="clé\U0010FFFF", value=b"value")
+    assert in_record.key_size == 8
+    in_bytes = in_record.to_bytes()
+
+    # WHEN
+    out_record = Record.from_bytes(in_bytes)
+
+    # THEN
+    assert out_record == in_record
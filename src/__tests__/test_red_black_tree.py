@@ -993,6 +993,20 @@ def test_iterate():
         tree.scan(lower=-12, upper=-2).__next__()
 
 
+def test_scan_gets_keys_within_bounds_in_subtrees_of_nodes_outside_bounds():
+    # GIVEN
+    tree = RedBlackTree()
+    all_keys = [0, 2, 3, 4, 5, 8, 12, 25, 27, 30, 45, 50]
+    for key in all_keys:
+        tree.insert(key=key, data=str(key).encode(encoding="utf-8"))
+
+    # WHEN
+    scanned_data = list(tree.scan(lower=1, upper=29))
+
+    # THEN
+    assert scanned_data == [str(key).encode(encoding="utf-8") for key in [2, 3, 4, 5, 8, 12, 25, 27]]
+
+
 def test_iterate_on_empty_tree_raises_stop_iteration_signal():
     # GIVEN
     tree = RedBlackTree()
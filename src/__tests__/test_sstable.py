@@ -1,10 +1,21 @@
+import os
+import struct
 from contextlib import nullcontext as does_not_raise
+from unittest import mock
 
 import pytest
 
+from src.__fixtures__.constants import TEST_DIRECTORY
+from src.block_cache import BlockCache
 from src.blocks import DataBlock, MetaBlock
-from src.bloom_filter import BloomFilter
-from src.sstable import SSTableBuilder, SSTableEncoding, SSTable, SSTableFile
+from src.bloom_filter import BloomFilter, BlockedBloomFilter, DEFAULT_BITS_PER_KEY
+from src.compression import Compression, compress_block
+from src.prefix_extractor import PrefixExtractor
+from src.range_tombstones import RangeTombstone, RangeTombstones
+from src.record import Record
+from src.sstable import SSTableBuilder, SSTableEncoding, SSTable, SSTableFile, MmapSSTableFile, \
+    FORMAT_VERSION_BLOCK_COMPRESSION, FORMAT_VERSION_RANGE_TOMBSTONES, IndexPartition, TopLevelIndex, \
+    PartitionedIndex, PartitionedBloomFilter
 
 
 def test_add_record_to_current_block():
@@ -22,7 +33,7 @@ def test_add_record_to_current_block():
     # THEN
     assert sstable_builder.current_buffer_position == 0
     assert sstable_builder.data_block_offsets == []
-    assert sstable_builder.data_buffer == bytearray(150)
+    assert sstable_builder._temporary_file is None
 
 
 def test_adding_record_to_new_block_updates_buffer():
@@ -44,7 +55,8 @@ def test_adding_record_to_new_block_updates_buffer():
     nb_records = 2
     nb_records_size = 2  # Number of bytes for a "H" integer (Blocks)
     block_index_size = nb_records * record_index_size + nb_records_size
-    assert sstable_builder.current_buffer_position == 2 * record_size + block_index_size
+    codec_size = 1  # Number of bytes of the compression codec (Blocks are followed by it)
+    assert sstable_builder.current_buffer_position == 2 * record_size + block_index_size + codec_size
     assert sstable_builder.data_block_offsets == [0]
 
 
@@ -71,10 +83,36 @@ def test_encode_sstable():
     encoded_meta_blocks = b''.join([encoded_meta_block1, encoded_meta_block2])
     encoded_64 = b'@\x00\x00\x00'  # 64 = len(data) = 42 + 18 + 2 + 2
     encoded_meta_block_offset = encoded_64
-    encoded_bloom_filter = bloom_filter.to_bytes()
+    encoded_bloom_filter = b'\x00' + bloom_filter.to_bytes()  # The bloom filter is preceded by its layout
     encoded_96 = b'`\x00\x00\x00'  # 96 = len(data + encoded_meta_blocks)
     encoded_bloom_filter_offset = encoded_96
-    assert encoded_sstable == data + encoded_meta_blocks + encoded_bloom_filter + encoded_meta_block_offset + encoded_bloom_filter_offset
+    encoded_range_tombstone_offset = encoded_96  # There is no range tombstone
+    encoded_partitions_offset = encoded_64  # The index is not partitioned
+    encoded_prefix_bloom_filter_offset = encoded_96  # There is no prefix bloom filter
+    encoded_version = b'\x08'
+    encoded_magic = b'PBL\xdb'
+    assert encoded_sstable == (data + encoded_meta_blocks + encoded_bloom_filter + encoded_meta_block_offset +
+                               encoded_bloom_filter_offset + encoded_range_tombstone_offset +
+                               encoded_partitions_offset + encoded_prefix_bloom_filter_offset + encoded_version +
+                               encoded_magic)
+
+
+def test_encode_legacy_sstable_has_no_version():
+    # GIVEN
+    data = DataBlock(data=b'\x04\x00\x00\x00key1\x06\x00\x00\x00value1', offsets=[0]).to_bytes()
+    meta_block = MetaBlock(first_key="key1", last_key="key1", offset=0)
+    bloom_filter = BloomFilter.build_from_keys_and_fp_rate(["key1"], fp_rate=0.0001)
+    sstable = SSTableEncoding(data=data, meta_blocks=[meta_block], bloom_filter=bloom_filter, version=1)
+
+    # WHEN
+    encoded_sstable = sstable.to_bytes()
+    decoded_sstable = SSTableEncoding.from_bytes(encoded_sstable)
+
+    # THEN
+    assert encoded_sstable.endswith(struct.pack("ii", len(data), len(data) + meta_block.size))
+    assert decoded_sstable.version == 1
+    assert decoded_sstable.data == data
+    assert decoded_sstable.meta_blocks == [meta_block]
 
 
 def test_decode_sstable():
@@ -92,6 +130,7 @@ def test_decode_sstable():
     decoded_sstable = SSTableEncoding.from_bytes(data)
 
     # THEN
+    assert decoded_sstable.version == 1
     assert decoded_sstable.data == encoded_data
     actual_encoded_meta_blocks = b''.join([meta_block.to_bytes() for meta_block in decoded_sstable.meta_blocks])
     assert encoded_meta_blocks == actual_encoded_meta_blocks
@@ -321,3 +360,529 @@ def test_reconstruct_a_sstable_from_file(sstable_four_blocks):
 
     # THEN
     assert reconstructed_sstable == original_sstable
+
+
+def test_read_data_block_goes_through_the_block_cache(sstable_four_blocks):
+    # GIVEN
+    sstable = sstable_four_blocks
+    sstable.block_cache = BlockCache(capacity=10_000)
+    first_read_block = sstable.read_data_block(block_id=1)
+
+    # WHEN
+    with mock.patch.object(sstable.file, 'read_range', wraps=sstable.file.read_range) as mocked_read_range:
+        second_read_block = sstable.read_data_block(block_id=1)
+
+        # THEN
+        mocked_read_range.assert_not_called()
+    assert second_read_block is first_read_block
+    assert sstable.block_cache.misses == 1
+    assert sstable.block_cache.hits == 1
+
+
+def test_read_range_of_mmap_sstable_file_is_a_view(sstable_file_1, content_of_sstable_file_1):
+    # GIVEN
+    sstable_file = MmapSSTableFile.open(path=sstable_file_1.path)
+
+    # WHEN
+    content = sstable_file.read_range(start=8, end=19)
+
+    # THEN
+    assert isinstance(content, memoryview)
+    assert content == content_of_sstable_file_1[8:19]
+
+
+def test_closed_mmap_sstable_file_is_unmapped_and_mapped_again_upon_the_next_read(sstable_file_1,
+                                                                                 content_of_sstable_file_1):
+    # GIVEN
+    sstable_file = MmapSSTableFile.open(path=sstable_file_1.path)
+    sstable_file.read_range(start=8, end=19)
+    file_map = sstable_file._map
+
+    # WHEN
+    sstable_file.close()
+
+    # THEN
+    assert file_map.closed
+    assert sstable_file._map is None
+    assert sstable_file.read_range(start=8, end=19) == content_of_sstable_file_1[8:19]
+    sstable_file.close()
+
+
+def test_reconstruct_a_sstable_from_file_with_mmap(sstable_four_blocks, records_for_sstable_four_blocks):
+    # GIVEN
+    original_sstable = sstable_four_blocks
+    path = original_sstable.file.path
+
+    # WHEN
+    reconstructed_sstable = SSTable.build_from_path(path=path, use_mmap=True)
+
+    # THEN
+    assert reconstructed_sstable == original_sstable
+    assert isinstance(reconstructed_sstable.read_data_block(block_id=0).data, memoryview)
+    for record in records_for_sstable_four_blocks:
+        value = reconstructed_sstable.get(record.key)
+        assert value == record.value
+        assert isinstance(value, bytes)
+    assert list(reconstructed_sstable.scan(lower="ccc", upper="fff")) == records_for_sstable_four_blocks[2:6]
+
+
+def test_reconstruct_a_sstable_from_file_does_not_read_the_whole_file(sstable_four_blocks):
+    # GIVEN
+    path = sstable_four_blocks.file.path
+
+    # WHEN/THEN
+    with mock.patch.object(SSTableFile, 'read') as mocked_read:
+        SSTable.build_from_path(path=path)
+
+        # THEN
+        mocked_read.assert_not_called()
+
+
+def test_find_first_block_of_key(sstable_four_blocks):
+    # GIVEN
+    sstable = sstable_four_blocks
+
+    # WHEN/THEN
+    assert sstable.find_first_block_id("a") == 0
+    assert sstable.find_first_block_id("ddd") == 0
+    assert sstable.find_first_block_id("dddd") == 1
+    assert sstable.find_first_block_id("jj") == 2
+    assert sstable.find_first_block_id("zzz") == 4
+
+
+def test_scan_sstable_only_reads_relevant_blocks(sstable_four_blocks, records_for_sstable_four_blocks):
+    # GIVEN
+    sstable = sstable_four_blocks
+
+    # WHEN/THEN
+    with mock.patch.object(sstable, 'read_data_block', wraps=sstable.read_data_block) as mocked_read_data_block:
+        # WHEN
+        scanned_records = list(sstable.scan(lower="hhh", upper="jjj"))
+
+        # THEN
+        assert mocked_read_data_block.call_args_list == [mock.call(block_id=1), mock.call(block_id=2)]
+    assert scanned_records == records_for_sstable_four_blocks[7:10]
+
+
+def test_sstable_with_prefix_compressed_blocks(temporary_sstable_path):
+    # GIVEN
+    keys = [f"tenant1/entity{i:03d}" for i in range(100)]
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500, restart_interval=4)
+    for key in keys:
+        sstable_builder.add(key=key, value=key.encode())
+    sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable.format_version == 8
+    for key in keys:
+        assert sstable.get(key) == key.encode()
+    assert sstable.get("tenant1/entity0505") is None
+    scanned_keys = [record.key for record in sstable.scan(lower="tenant1/entity010", upper="tenant1/entity050")]
+    assert scanned_keys == keys[10:51]
+
+
+@pytest.mark.parametrize("compression", [Compression.ZLIB, Compression.LZMA, Compression.BZ2])
+def test_sstable_with_compressed_blocks(temporary_sstable_path, compression):
+    # GIVEN
+    keys = [f"key{i:03d}" for i in range(100)]
+    uncompressed_builder = SSTableBuilder(sstable_size=20000, block_size=500)
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500, compression=compression)
+    for key in keys:
+        uncompressed_builder.add(key=key, value=b'value' * 10)
+        sstable_builder.add(key=key, value=b'value' * 10)
+    sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    uncompressed_builder.finish_block()
+    assert sstable.meta_block_offset < uncompressed_builder.current_buffer_position
+    for key in keys:
+        assert sstable.get(key) == b'value' * 10
+    scanned_keys = [record.key for record in sstable.scan(lower="key010", upper="key050")]
+    assert scanned_keys == keys[10:51]
+
+
+def test_sstable_builder_streams_full_blocks_to_a_temporary_file(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500, directory=TEST_DIRECTORY)
+    for i in range(100):
+        sstable_builder.add(key=f"key{i:03d}", value=b'value' * 10)
+    temporary_file_path = sstable_builder._temporary_file.name
+
+    # WHEN
+    sstable = sstable_builder.build(path=temporary_sstable_path)
+
+    # THEN
+    assert os.path.dirname(temporary_file_path) == os.path.abspath(TEST_DIRECTORY)
+    assert not os.path.exists(temporary_file_path)
+    assert [name for name in os.listdir(TEST_DIRECTORY) if name.endswith(SSTableBuilder.TEMPORARY_FILE_SUFFIX)] == []
+    data = sstable.file.read()
+    expected_sstable = SSTableEncoding(data=data[:sstable.meta_block_offset], meta_blocks=sstable.meta_blocks,
+                                       bloom_filter=sstable.bloom_filter)
+    assert data == expected_sstable.to_bytes()
+
+
+def test_sstable_builder_does_not_overwrite_an_existing_file(sstable_file_1, content_of_sstable_file_1):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500, directory=TEST_DIRECTORY)
+    sstable_builder.add(key="key1", value=b'value1')
+
+    # WHEN
+    with pytest.raises(ValueError):
+        sstable_builder.build(path=sstable_file_1.path)
+
+    # THEN
+    assert sstable_file_1.read() == content_of_sstable_file_1
+
+
+def test_block_cache_holds_decompressed_blocks(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500, compression=Compression.ZLIB)
+    for i in range(100):
+        sstable_builder.add(key=f"key{i:03d}", value=b'value' * 10)
+    sstable_builder.build(path=temporary_sstable_path)
+    block_cache = BlockCache(capacity=100_000)
+    sstable = SSTable.build_from_path(path=temporary_sstable_path, block_cache=block_cache)
+
+    # WHEN
+    block = sstable.read_data_block(block_id=0)
+
+    # THEN
+    encoded_block_size = sstable.meta_blocks[1].offset - sstable.meta_blocks[0].offset
+    assert block_cache.size == block.size > encoded_block_size
+    with mock.patch("src.sstable.decompress_block") as mocked_decompress_block:
+        assert sstable.read_data_block(block_id=0) is block
+        mocked_decompress_block.assert_not_called()
+
+
+def test_sstable_with_range_tombstones(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=1000, block_size=100)
+    sstable_builder.add(key="key3", value=b'value3')
+    sstable_builder.add_range_tombstone(RangeTombstone(start="key1", end="key5"))
+    sstable_builder.add_range_tombstone(RangeTombstone(start="key7", end="key8"))
+    built_sstable = sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable == built_sstable
+    assert sstable.first_key == "key1"
+    assert sstable.last_key == "key8"
+    assert sstable.get_record(key="key3") == Record(key="key3", value=b'value3')
+    assert sstable.get_record(key="key4") == Record.tombstone(key="key4")
+    assert sstable.get_record(key="key5") is None
+    assert sstable.get_range_tombstone(key="key7") == Record.tombstone(key="key7")
+
+
+def test_sstable_with_only_range_tombstones(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=1000, block_size=100)
+    sstable_builder.add_range_tombstone(RangeTombstone(start="key1", end="key5"))
+    sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable.meta_blocks == []
+    assert (sstable.first_key, sstable.last_key) == ("key1", "key5")
+    assert sstable.get_record(key="key2") == Record.tombstone(key="key2")
+    assert list(sstable.scan(lower="key0", upper="key9")) == []
+
+
+def test_decode_sstable_without_range_tombstones_section():
+    # GIVEN
+    data = DataBlock(data=b'\x04\x00\x00\x00key1\x06\x00\x00\x00value1', offsets=[0]).to_bytes()
+    meta_block = MetaBlock(first_key="key1", last_key="key1", offset=0)
+    bloom_filter = BloomFilter.build_from_keys_and_fp_rate(["key1"], fp_rate=0.0001)
+    sstable = SSTableEncoding(data=data, meta_blocks=[meta_block], bloom_filter=bloom_filter,
+                              version=FORMAT_VERSION_BLOCK_COMPRESSION)
+
+    # WHEN
+    decoded_sstable = SSTableEncoding.from_bytes(sstable.to_bytes())
+
+    # THEN
+    assert decoded_sstable.version == FORMAT_VERSION_BLOCK_COMPRESSION
+    assert decoded_sstable.meta_blocks == [meta_block]
+    assert decoded_sstable.range_tombstones == RangeTombstones()
+
+
+def test_read_sstable_with_bloom_filter_built_without_double_hashing(temporary_sstable_path):
+    # GIVEN
+    block = DataBlock(data=b'\x04\x00\x00\x00key1\x06\x00\x00\x00value1', offsets=[0])
+    data = compress_block(data=block.to_bytes(), compression=Compression.NONE)
+    meta_block = MetaBlock(first_key="key1", last_key="key1", offset=0)
+    bloom_filter = BloomFilter(nb_bytes=16, nb_hash_functions=3, double_hashing=False)
+    bloom_filter.add(key="key1")
+    encoded_sstable = SSTableEncoding(data=data, meta_blocks=[meta_block], bloom_filter=bloom_filter,
+                                      version=FORMAT_VERSION_RANGE_TOMBSTONES).to_bytes()
+    SSTableFile.create(path=temporary_sstable_path, data=encoded_sstable)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable.bloom_filter.double_hashing is False
+    assert sstable.bloom_filter == bloom_filter
+    assert sstable.get(key="key1") == b'value1'
+
+
+@pytest.mark.parametrize("blocked_bloom_filter", [False, True])
+def test_sstable_bloom_filter_is_built_with_the_given_bits_per_key(temporary_sstable_path, blocked_bloom_filter):
+    # GIVEN
+    keys = [f"key{i:03d}" for i in range(100)]
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500, bloom_bits_per_key=8,
+                                     blocked_bloom_filter=blocked_bloom_filter)
+    for key in keys:
+        sstable_builder.add(key=key, value=key.encode())
+    built_sstable = sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable.bloom_filter == built_sstable.bloom_filter
+    assert isinstance(sstable.bloom_filter, BlockedBloomFilter) is blocked_bloom_filter
+    assert sstable.bloom_filter.nb_hash_functions == 6
+    assert all(sstable.get(key) == key.encode() for key in keys)
+
+
+def test_sstable_without_bloom_filter(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500, bloom_bits_per_key=0)
+    sstable_builder.add(key="key1", value=b'value1')
+    sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable.bloom_filter.nb_bytes == 0
+    assert sstable.bloom_filter.may_contain(key="key2") is True
+    assert sstable.get(key="key1") == b'value1'
+    assert sstable.get(key="key2") is None
+
+
+def test_encode_decode_index_partition():
+    # GIVEN
+    meta_blocks = [MetaBlock(first_key="key1", last_key="key3", offset=0),
+                   MetaBlock(first_key="key4", last_key="key6", offset=100)]
+    bloom_filter = BlockedBloomFilter.build_from_keys_and_bits_per_key(keys=["key1", "key3", "key4", "key6"],
+                                                                       bits_per_key=10)
+    partition = IndexPartition(meta_blocks=meta_blocks, bloom_filter=bloom_filter)
+
+    # WHEN
+    decoded_partition = IndexPartition.from_bytes(data=partition.to_bytes())
+
+    # THEN
+    assert decoded_partition == partition
+    assert decoded_partition.find_first_block_id(key="key2") == 0
+    assert decoded_partition.find_first_block_id(key="key5") == 1
+
+
+def test_encode_decode_top_level_index():
+    # GIVEN
+    handles = [MetaBlock(first_key="key1", last_key="key6", offset=200),
+               MetaBlock(first_key="key7", last_key="key9", offset=300)]
+    top_level_index = TopLevelIndex(handles=handles, blocks_per_partition=2, nb_blocks=3)
+
+    # WHEN
+    decoded_top_level_index = TopLevelIndex.from_bytes(data=top_level_index.to_bytes())
+
+    # THEN
+    assert decoded_top_level_index == top_level_index
+
+
+def build_partitioned_sstable(path: str, keys: list[str], block_cache: BlockCache = None) -> SSTable:
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=100, index_partition_size=3,
+                                     block_cache=block_cache)
+    for key in keys:
+        sstable_builder.add(key=key, value=key.encode())
+    return sstable_builder.build(path=path)
+
+
+def test_sstable_with_partitioned_index(temporary_sstable_path):
+    # GIVEN
+    keys = [f"key{i:03d}" for i in range(0, 200, 2)]
+    built_sstable = build_partitioned_sstable(path=temporary_sstable_path, keys=keys)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable == built_sstable
+    assert isinstance(sstable.meta_blocks, PartitionedIndex)
+    assert isinstance(sstable.bloom_filter, PartitionedBloomFilter)
+    assert sstable.meta_blocks.nb_partitions == -(-len(sstable.meta_blocks) // 3) > 1
+    assert (sstable.first_key, sstable.last_key) == ("key000", "key198")
+    assert all(sstable.get(key) == key.encode() for key in keys)
+    assert sstable.get("key001") is None
+    assert sstable.get("a") is None and sstable.get("z") is None
+    assert [record.key for record in sstable.scan(lower="key051", upper="key151")] == keys[26:76]
+    assert [meta_block.first_key for meta_block in sstable.meta_blocks][0] == "key000"
+
+
+def test_partitioned_bloom_filter_only_reads_one_partition(temporary_sstable_path):
+    # GIVEN
+    keys = [f"key{i:03d}" for i in range(0, 200, 2)]
+    build_partitioned_sstable(path=temporary_sstable_path, keys=keys)
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # WHEN
+    with mock.patch.object(IndexPartition, 'from_bytes', wraps=IndexPartition.from_bytes) as mocked_from_bytes:
+        may_contain_existing_key = sstable.bloom_filter.may_contain(key="key100")
+        may_contain_key_out_of_range = sstable.bloom_filter.may_contain(key="key999")
+
+    # THEN
+    assert may_contain_existing_key is True
+    assert may_contain_key_out_of_range is False
+    assert mocked_from_bytes.call_count == 1
+
+
+def test_lookups_without_block_cache_read_each_partition_once(temporary_sstable_path):
+    # GIVEN
+    keys = [f"key{i:03d}" for i in range(0, 200, 2)]
+    build_partitioned_sstable(path=temporary_sstable_path, keys=keys)
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+    assert sstable.find_block_id(key="key100") == 10 and sstable.find_block_id(key="key130") == 13
+
+    # WHEN
+    with mock.patch.object(IndexPartition, 'from_bytes', wraps=IndexPartition.from_bytes) as mocked_from_bytes:
+        may_contain_key = sstable.bloom_filter.may_contain(key="key100")
+        value = sstable.get("key100")
+        nb_reads_for_get = mocked_from_bytes.call_count
+        # Blocks 10 to 13 span partitions 3 (blocks 9 to 11) and 4 (blocks 12 to 14)
+        scanned_keys = [record.key for record in sstable.scan(lower="key100", upper="key130")]
+
+    # THEN
+    assert may_contain_key is True
+    assert value == b'key100'
+    assert scanned_keys == keys[50:66]
+    assert nb_reads_for_get == 1
+    assert mocked_from_bytes.call_count == 2
+
+
+def test_partitioned_builder_only_keeps_the_key_hashes_of_the_current_partition(temporary_sstable_path):
+    # GIVEN
+    keys = [f"key{i:03d}" for i in range(0, 200, 2)]
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=100, index_partition_size=3)
+
+    # WHEN
+    nb_hashed_keys = []
+    for key in keys:
+        sstable_builder.add(key=key, value=key.encode())
+        nb_hashed_keys.append(len(sstable_builder._key_hashes) // 2)
+    sstable = sstable_builder.build(path=temporary_sstable_path)
+
+    # THEN
+    # A partition of 3 blocks of about 10 keys each
+    assert max(nb_hashed_keys) <= 3 * 10
+    assert sstable.meta_blocks.nb_partitions > 1
+    for partition_id in range(sstable.meta_blocks.nb_partitions):
+        partition = sstable.meta_blocks.read_partition(partition_id=partition_id)
+        partition_keys = [key for key in keys
+                          if partition.meta_blocks[0].first_key <= key <= partition.meta_blocks[-1].last_key]
+        assert partition.bloom_filter == BloomFilter.build_from_keys_and_bits_per_key(keys=partition_keys,
+                                                                                      bits_per_key=DEFAULT_BITS_PER_KEY)
+
+
+def test_partitions_of_index_go_through_the_block_cache(temporary_sstable_path):
+    # GIVEN
+    keys = [f"key{i:03d}" for i in range(0, 200, 2)]
+    block_cache = BlockCache(capacity=1_000_000)
+    sstable = build_partitioned_sstable(path=temporary_sstable_path, keys=keys, block_cache=block_cache)
+    assert len(block_cache) == 0
+    sstable.get("key100")
+    cached_keys = set(block_cache._entries.keys())
+
+    # WHEN
+    with mock.patch.object(IndexPartition, 'from_bytes') as mocked_from_bytes:
+        value = sstable.get("key100")
+
+    # THEN
+    assert value == b'key100'
+    mocked_from_bytes.assert_not_called()
+    assert any(key[1] == "partition" for key in cached_keys)
+
+
+def test_decode_partitioned_sstable_from_bytes_raises_an_error(temporary_sstable_path):
+    # GIVEN
+    build_partitioned_sstable(path=temporary_sstable_path, keys=[f"key{i:03d}" for i in range(100)])
+    with open(temporary_sstable_path, "rb") as file:
+        data = file.read()
+
+    # WHEN/THEN
+    with pytest.raises(ValueError):
+        SSTableEncoding.from_bytes(data)
+
+
+def test_sstable_with_prefix_bloom_filter(temporary_sstable_path):
+    # GIVEN
+    keys = sorted([f"tenant{i:02d}/entity{j:02d}" for i in range(0, 20, 2) for j in range(10)] + ["short"])
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500,
+                                     prefix_extractor=PrefixExtractor(length=len("tenant00")))
+    for key in keys:
+        sstable_builder.add(key=key, value=key.encode())
+    built_sstable = sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable == built_sstable
+    assert sstable.prefix_bloom_filter == built_sstable.prefix_bloom_filter
+    assert all(sstable.may_contain_prefix(prefix=f"tenant{i:02d}") for i in range(0, 20, 2))
+    assert not any(sstable.may_contain_prefix(prefix=f"tenant{i:02d}") for i in range(1, 20, 2))
+    assert all(sstable.get(key) == key.encode() for key in keys)
+
+
+def test_sstable_without_prefix_bloom_filter_may_contain_any_prefix(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=500)
+    sstable_builder.add(key="tenant00/entity00", value=b'value')
+    sstable_builder.build(path=temporary_sstable_path)
+
+    # WHEN
+    sstable = SSTable.build_from_path(path=temporary_sstable_path)
+
+    # THEN
+    assert sstable.prefix_bloom_filter is None
+    assert sstable.may_contain_prefix(prefix="tenant01")
+
+
+def test_group_consecutive_block_ids():
+    # WHEN/THEN
+    assert SSTable.group_consecutive_block_ids(block_ids=[1, 2, 2, 3, 5, 7, 8]) == [[1, 2, 3], [5], [7, 8]]
+    assert SSTable.group_consecutive_block_ids(block_ids=[]) == []
+
+
+def test_read_data_blocks_reads_consecutive_blocks_at_once(temporary_sstable_path):
+    # GIVEN
+    sstable_builder = SSTableBuilder(sstable_size=20000, block_size=100, compression=Compression.ZLIB,
+                                     block_cache=BlockCache(capacity=100_000))
+    for i in range(100):
+        sstable_builder.add(key=f"key{i:03d}", value=b'value' * 4)
+    sstable = sstable_builder.build(path=temporary_sstable_path)
+    cached_block = sstable.read_data_block(block_id=3)
+
+    # WHEN
+    with mock.patch.object(sstable.file, 'read_range', wraps=sstable.file.read_range) as mocked_read_range:
+        blocks = sstable.read_data_blocks(block_ids=[1, 2, 3, 4, 6])
+
+    # THEN
+    assert mocked_read_range.call_args_list == [
+        mock.call(start=sstable.meta_blocks[1].offset, end=sstable.meta_blocks[3].offset),
+        mock.call(start=sstable.meta_blocks[4].offset, end=sstable.meta_blocks[5].offset),
+        mock.call(start=sstable.meta_blocks[6].offset, end=sstable.meta_blocks[7].offset)]
+    assert blocks[2] is cached_block
+    assert [block.to_bytes() for block in blocks] == [
+        SSTable.build_from_path(path=temporary_sstable_path).read_data_block(block_id=block_id).to_bytes()
+        for block_id in [1, 2, 3, 4, 6]]
+
@@ -1,8 +1,13 @@
+import threading
+import time
 from contextlib import nullcontext as does_not_raise
+from unittest import mock
 
 import pytest
 
-from src.wal import WriteAheadLog
+from src.range_tombstones import RangeTombstone
+from src.record import Record
+from src.wal import WriteAheadLog, Durability
 
 
 def test_create_wal_from_existing_path_should_raise_an_error(empty_wal):
@@ -33,3 +38,162 @@ def test_open_wal_from_new_path_should_raise_an_error(wal_path_with_no_file):
     # GIVEN/WHEN/THEN
     with pytest.raises(ValueError):
         WriteAheadLog.open(path=wal_path_with_no_file)
+
+
+@pytest.mark.parametrize("durability", list(Durability))
+def test_inserted_records_can_be_read_back(wal_path_with_no_file, durability):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file, durability=durability)
+    records = [Record(key=f"key{i}", value=f"value{i}".encode()) for i in range(3)]
+
+    # WHEN
+    for record in records:
+        wal.insert(record=record)
+
+    # THEN
+    assert WriteAheadLog.open(path=wal_path_with_no_file).read_records() == records
+
+
+def test_range_tombstones_can_be_read_back(wal_path_with_no_file):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file)
+    record = Record(key="key1", value=b'value1')
+    range_tombstone = RangeTombstone(start="key0", end="key5")
+
+    # WHEN
+    wal.insert(record=record)
+    wal.insert_range_tombstone(range_tombstone=range_tombstone)
+    wal.insert_batch(records=[record])
+
+    # THEN
+    assert WriteAheadLog.open(path=wal_path_with_no_file).read_records() == [record, range_tombstone, record]
+
+
+@pytest.mark.parametrize("last_entry", [Record(key="key2", value=b'value2'),
+                                        Record.tombstone(key="key2"),
+                                        RangeTombstone(start="key0", end="key5")])
+def test_torn_last_entry_is_ignored(wal_path_with_no_file, last_entry):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file)
+    record = Record(key="key1", value=b'value1')
+    wal.insert(record=record)
+    if isinstance(last_entry, RangeTombstone):
+        wal.insert_range_tombstone(range_tombstone=last_entry)
+    else:
+        wal.insert(record=last_entry)
+    full_size = wal.file.tell()
+
+    for torn_size in range(full_size - 1, len(record.to_bytes()), -1):
+        # WHEN (a crash while the last entry was being written)
+        with open(wal_path_with_no_file, "r+b") as f:
+            f.truncate(torn_size)
+
+        # THEN
+        assert WriteAheadLog.open(path=wal_path_with_no_file).read_records() == [record]
+
+
+@pytest.mark.parametrize("durability, nb_syncs", [(Durability.NONE, 0),
+                                                  (Durability.BATCHED_FSYNC, 3),
+                                                  (Durability.FSYNC, 3)])
+def test_records_are_synced_as_per_durability(wal_path_with_no_file, durability, nb_syncs):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file, durability=durability)
+
+    # WHEN
+    with mock.patch.object(wal, '_sync', wraps=wal._sync) as mocked_sync:
+        for i in range(3):
+            wal.insert(record=Record(key=f"key{i}", value=f"value{i}".encode()))
+
+    # THEN
+    assert mocked_sync.call_count == nb_syncs
+
+
+def test_concurrent_records_are_written_and_synced_in_one_batch(wal_path_with_no_file):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file, durability=Durability.BATCHED_FSYNC)
+    first_write_can_end = threading.Event()
+    original_sync = wal._sync
+
+    def _sync_waiting_for_first_write():
+        first_write_can_end.wait()
+        original_sync()
+
+    records = [Record(key=f"key{i}", value=f"value{i}".encode()) for i in range(6)]
+    writers = [threading.Thread(target=lambda record=record: wal.insert(record=record)) for record in records]
+
+    # WHEN
+    with mock.patch.object(wal, '_sync', side_effect=_sync_waiting_for_first_write) as mocked_sync:
+        writers[0].start()
+        while not wal._is_writing:
+            time.sleep(0.001)
+        for writer in writers[1:]:
+            writer.start()
+        while len(wal._pending) < 5:
+            time.sleep(0.001)
+        first_write_can_end.set()
+        for writer in writers:
+            writer.join()
+
+    # THEN
+    assert mocked_sync.call_count == 2
+    assert sorted(WriteAheadLog.open(path=wal_path_with_no_file).read_records()) == records
+
+
+def test_writes_fail_once_a_write_failed(wal_path_with_no_file):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file, durability=Durability.BATCHED_FSYNC)
+    with mock.patch.object(wal, '_sync', side_effect=OSError("Input/output error")):
+        with pytest.raises(OSError):
+            wal.insert(record=Record(key="key1", value=b'value1'))
+
+    # WHEN/THEN
+    with pytest.raises(OSError):
+        wal.insert(record=Record(key="key2", value=b'value2'))
+
+
+@pytest.mark.parametrize("durability", [Durability.NONE, Durability.BATCHED_FSYNC, Durability.FSYNC])
+def test_writes_to_a_removed_wal_raise_an_error_without_breaking_it(wal_path_with_no_file, durability):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file, durability=durability)
+    wal.insert(record=Record(key="key1", value=b'value1'))
+
+    # WHEN
+    wal.remove_self()
+
+    # THEN
+    with pytest.raises(ValueError):
+        wal.insert(record=Record(key="key2", value=b'value2'))
+    with pytest.raises(ValueError):
+        wal.insert(record=Record(key="key3", value=b'value3'))
+    assert wal._error is None
+
+
+def test_wal_is_removed_once_the_batch_being_written_is_written(wal_path_with_no_file):
+    # GIVEN
+    wal = WriteAheadLog.create(path=wal_path_with_no_file, durability=Durability.BATCHED_FSYNC)
+    write_can_end = threading.Event()
+    original_sync = wal._sync
+
+    def _sync_waiting_for_removal():
+        write_can_end.wait()
+        original_sync()
+
+    writer = threading.Thread(target=lambda: wal.insert(record=Record(key="key1", value=b'value1')))
+    remover = threading.Thread(target=wal.remove_self)
+
+    # WHEN
+    with mock.patch.object(wal, '_sync', side_effect=_sync_waiting_for_removal):
+        writer.start()
+        while not wal._is_writing:
+            time.sleep(0.001)
+        remover.start()
+        remover.join(timeout=0.05)
+        is_remover_waiting = remover.is_alive()
+        write_can_end.set()
+        writer.join()
+        remover.join()
+
+    # THEN
+    assert is_remover_waiting
+    assert wal._error is None
+    assert wal.file.closed
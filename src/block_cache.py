@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from typing import Optional, Union, TYPE_CHECKING
+
+from src.blocks import DataBlock
+from src.locks import Mutex
+
+if TYPE_CHECKING:
+    from src.sstable import IndexPartition
+
+
+class BlockCache:
+    """This class implements a Least Recently Used (LRU) cache of decoded data blocks and index partitions.
+
+    The cache is shared by all the SSTables of a store. Each data block is keyed by the path of the SSTable file and the
+    id of the block within that file, so that blocks of different SSTables never collide. Index partitions (of SSTables
+    with a partitioned index) are keyed by the path of the file, "partition" and the id of the partition.
+
+    The cache is bounded by a number of bytes (and not by a number of entries): each block is charged with its encoded
+    size. When inserting a block makes the cache exceed its capacity, the least recently used blocks are evicted until
+    it fits again. A block whose size exceeds the capacity of the whole cache is never cached.
+
+    Hits, misses and evictions are counted so that the efficiency of the cache can be monitored.
+    """
+    Key = Union[tuple[str, int], tuple[str, str, int]]
+    Entry = Union[DataBlock, "IndexPartition"]
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[BlockCache.Key, tuple[BlockCache.Entry, int]] = OrderedDict()
+        self._lock = Mutex()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Key) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            block, _ = entry
+            return block
+
+    def put(self, key: Key, block: Entry, charge: int) -> None:
+        if charge > self.capacity:
+            return
+
+        with self._lock:
+            previous_entry = self._entries.pop(key, None)
+            if previous_entry is not None:
+                self.size -= previous_entry[1]
+
+            self._entries[key] = (block, charge)
+            self.size += charge
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.size > self.capacity:
+            _, (_, charge) = self._entries.popitem(last=False)
+            self.size -= charge
+            self.evictions += 1
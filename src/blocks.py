@@ -1,7 +1,6 @@
 import struct
 from typing import Optional, Iterator
 
-from src.iterators import DataBlockIterator
 from src.record import Record
 
 INT_H_SIZE = 2
@@ -11,21 +10,46 @@ class DataBlock:
     """This class handles encoding and decoding of Data Blocks.
 
     Each Data Block has the following format:
-    +--------------------+-----------------------------+-------+
-    |       Records      |             Meta            | Extra |
-    +--------------------+-----------------------------+-------+
-    | R1 | R2 | ... | Rn | offset_R1 | ... | offset_Rn | nb_R  |
-    +--------------------+-----------------------------+-------+
-    (R = Record)
+    +--------------------+---------------------------------------+-------+
+    |       Entries      |                 Meta                  | Extra |
+    +--------------------+---------------------------------------+-------+
+    | E1 | E2 | ... | En | offset_RP1 | ... | offset_RPm          | nb_RP |
+    +--------------------+---------------------------------------+-------+
+    (E = Entry, RP = Restart Point)
+
+    Keys are prefix-compressed: each entry only stores the part of its key that differs from the key of the previous
+    entry. Every `restart_interval` entries, the key is stored in full: this is a restart point. The offsets of all
+    restart points are stored after the entries, which allows to binary search over restart points and then to
+    decode at most `restart_interval` entries sequentially.
+
+    Each Entry has the following format:
+    +---------------+-------------+-------------------+------------+------------------+
+    | Unshared_size | Shared_size |   Unshared key    | Value_size |      Value       |
+    +---------------+-------------+-------------------+------------+------------------+
+    |    2 bytes    |   2 bytes   | Unshared_size B   |  4 bytes   | Value_size bytes |
+    +---------------+-------------+-------------------+------------+------------------+
+    (Shared_size = number of leading bytes shared with the key of the previous entry - always 0 at a restart point)
+    As for Records, the Value_size of a tombstone is `Record.TOMBSTONE_VALUE_SIZE` (and it has no value).
+
+    Note: a Record (as encoded by `Record.to_bytes`) is exactly an entry whose key is not shared (its 4-byte key size
+    reads as a 2-byte unshared size followed by a 2-byte shared size of 0). Data blocks written before prefix
+    compression existed are thus valid data blocks where every entry is a restart point (`restart_interval` = 1).
     """
+    ENCODING = "utf-8"
+    ENTRY_HEADER_FORMAT = "HH"
+    ENTRY_HEADER_SIZE = 2 * INT_H_SIZE
+    VALUE_SIZE_FORMAT = "i"
+    VALUE_SIZE_SIZE = 4
 
-    def __init__(self, data: bytes, offsets: list[int]):
+    def __init__(self, data: bytes | memoryview, offsets: list[int]):
+        # `data` is a memoryview when the block is read from a memory-mapped SSTable (it is never copied then)
         self.data = data
+        # Offsets of the restart points (with a restart interval of 1, every entry is a restart point)
         self.offsets = offsets
 
     @property
     def number_records(self) -> int:
-        return len(self.offsets)
+        return sum(1 for _ in self._entries())
 
     @property
     def size(self):
@@ -33,51 +57,159 @@ class DataBlock:
 
     def to_bytes(self) -> bytes:
         offset_bytes = struct.pack("H" * len(self.offsets), *self.offsets)
-        number_records = struct.pack("H", self.number_records)
+        number_restart_points = struct.pack("H", len(self.offsets))
 
-        return self.data + offset_bytes + number_records
+        return b''.join([self.data, offset_bytes, number_restart_points])
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "DataBlock":
-        # Decode number of records
-        nb_records_offset = len(data) - INT_H_SIZE
-        nb_records = struct.unpack("H", data[nb_records_offset:])[0]
+    def from_bytes(cls, data: bytes | memoryview) -> "DataBlock":
+        # Decode number of restart points
+        nb_restart_points_offset = len(data) - INT_H_SIZE
+        nb_restart_points = struct.unpack("H", data[nb_restart_points_offset:])[0]
 
-        if nb_records * INT_H_SIZE + INT_H_SIZE > len(data):
-            raise ValueError("Data length does not match number of records indicated.")
+        if nb_restart_points * INT_H_SIZE + INT_H_SIZE > len(data):
+            raise ValueError("Data length does not match number of restart points indicated.")
 
         # Decode offsets
-        offsets_start = nb_records_offset - (nb_records * INT_H_SIZE)
-        offsets_format = "H" * nb_records
-        offsets = list(struct.unpack(offsets_format, data[offsets_start:nb_records_offset]))
-
-        # Decode records
-        encoded_records = data[0:offsets_start]
+        offsets_start = nb_restart_points_offset - (nb_restart_points * INT_H_SIZE)
+        offsets_format = "H" * nb_restart_points
+        offsets = list(struct.unpack(offsets_format, data[offsets_start:nb_restart_points_offset]))
+
+        # Decode entries
+        encoded_entries = data[0:offsets_start]
+
+        return cls(data=encoded_entries, offsets=offsets)
+
+    def _decode_key(self, offset: int, previous_key: bytes) -> tuple[bytes, int]:
+        """Decodes the key of the entry starting at `offset` (given the key of the previous entry).
+        Returns the encoded key and the offset of the value size. The value is neither read nor copied.
+        """
+        unshared_size, shared_size = struct.unpack_from(self.ENTRY_HEADER_FORMAT, self.data, offset)
+        unshared_key_start = offset + self.ENTRY_HEADER_SIZE
+        unshared_key_end = unshared_key_start + unshared_size
+        key = previous_key[:shared_size] + bytes(self.data[unshared_key_start:unshared_key_end])
+        return key, unshared_key_end
+
+    def _decode_value(self, offset: int) -> tuple[Optional[Record.Value], int]:
+        """Decodes the value whose size starts at `offset`. Returns the value (None for a tombstone) and the offset of
+        the next entry."""
+        value_size = struct.unpack_from(self.VALUE_SIZE_FORMAT, self.data, offset)[0]
+        value_start = offset + self.VALUE_SIZE_SIZE
+        if value_size == Record.TOMBSTONE_VALUE_SIZE:
+            return None, value_start
+        value_end = value_start + value_size
+        return bytes(self.data[value_start:value_end]), value_end
+
+    def _skip_value(self, offset: int) -> int:
+        value_size = struct.unpack_from(self.VALUE_SIZE_FORMAT, self.data, offset)[0]
+        return offset + self.VALUE_SIZE_SIZE + max(value_size, 0)
+
+    @staticmethod
+    def _create_record(key: Record.Key, value: Optional[Record.Value]) -> Record:
+        return Record(key=key, value=value) if value is not None else Record.tombstone(key=key)
+
+    def _entries(self, restart_index: int = 0) -> Iterator[tuple[bytes, int]]:
+        """Iterates over the entries from a given restart point until the end of the block.
+        Yields the encoded key of each entry and the offset of its value size.
+        """
+        if restart_index >= len(self.offsets):
+            return
+        offset = self.offsets[restart_index]
+        key = b''
+        while offset < len(self.data):
+            key, value_offset = self._decode_key(offset=offset, previous_key=key)
+            yield key, value_offset
+            offset = self._skip_value(offset=value_offset)
+
+    def restart_key(self, restart_index: int) -> bytes:
+        key, _ = self._decode_key(offset=self.offsets[restart_index], previous_key=b'')
+        return key
+
+    def search(self, key: Record.Key) -> tuple[int, bool]:
+        """Performs a binary search on the restart points of the block.
+        Returns the index of the first restart point whose key is >= `key`, and whether this restart point's key is
+        `key`. Only the keys of the probed restart points are decoded (not their values).
+        """
+        encoded_key = key.encode(encoding=self.ENCODING)
+        low, high = 0, len(self.offsets)
+        while low < high:
+            mid = (low + high) // 2
+            mid_key = self.restart_key(restart_index=mid)
+            if mid_key == encoded_key:
+                return mid, True
+            if mid_key < encoded_key:
+                low = mid + 1
+            else:
+                high = mid
+
+        return low, False
+
+    def records(self, restart_index: int = 0, start_key: Optional[Record.Key] = None) -> Iterator[Record]:
+        """Iterates over the records from a given restart point until the end of the block.
+        Records whose key is < `start_key` are skipped without decoding their value.
+        """
+        encoded_start_key = start_key.encode(encoding=self.ENCODING) if start_key is not None else b''
+        for key, value_offset in self._entries(restart_index=restart_index):
+            if key < encoded_start_key:
+                continue
+            value, _ = self._decode_value(offset=value_offset)
+            yield self._create_record(key=str(key, encoding=self.ENCODING), value=value)
 
-        return cls(data=encoded_records, offsets=offsets)
-
-    # TODO: will need to move this to DataBlockIterator at some point I think
     def get(self, key: Record.Key) -> Optional[Record]:
-        iterator = DataBlockIterator(block=self)
-        for record in iterator:
-            if record.key == key:
-                return record
+        """Looks up a key: the restart points are binary searched, then the entries following the last restart point
+        whose key is < `key` are scanned (decoding their keys only) until `key` is reached or passed.
+        """
+        restart_index, is_found = self.search(key=key)
+        if not is_found:
+            if restart_index == 0:
+                return None
+            restart_index -= 1
+
+        encoded_key = key.encode(encoding=self.ENCODING)
+        for entry_key, value_offset in self._entries(restart_index=restart_index):
+            if entry_key == encoded_key:
+                value, _ = self._decode_value(offset=value_offset)
+                return self._create_record(key=key, value=value)
+            if entry_key > encoded_key:
+                return None
         return None
 
 
 class DataBlockBuilder:
-    def __init__(self, target_size: Optional[int] = 65_536):
+    def __init__(self, target_size: Optional[int] = 65_536, restart_interval: int = 1):
         # target_size is the size of a page. In my arm64 M2 mac, it is 65536 bytes (obtained with `stat -f %k`)
         self.target_size = target_size
+        self.restart_interval = restart_interval
         self.offsets = []
         self.data_buffer = bytearray(self.target_size)
         self.data_length = 0
         self.first_key = None
         self.last_key = None
-
-    def add(self, key: Record.Key, value: Record.Value) -> bool:
-        encoded_record = Record(key=key, value=value).to_bytes()
-        size = len(encoded_record)
+        self._nb_entries_since_restart = 0
+        self._last_encoded_key = b''
+
+    @staticmethod
+    def _shared_prefix_size(key1: bytes, key2: bytes) -> int:
+        size = 0
+        for byte1, byte2 in zip(key1, key2):
+            if byte1 != byte2:
+                break
+            size += 1
+        return size
+
+    def add(self, key: Record.Key, value: Record.Value, is_tombstone: bool = False) -> bool:
+        encoded_key = key.encode(encoding=DataBlock.ENCODING)
+        value_size = Record.TOMBSTONE_VALUE_SIZE if is_tombstone else len(value)
+        is_restart_point = (self._nb_entries_since_restart == 0
+                            or self._nb_entries_since_restart >= self.restart_interval)
+        shared_size = 0 if is_restart_point else self._shared_prefix_size(self._last_encoded_key, encoded_key)
+        encoded_entry = b''.join([
+            struct.pack(DataBlock.ENTRY_HEADER_FORMAT, len(encoded_key) - shared_size, shared_size),
+            encoded_key[shared_size:],
+            struct.pack(DataBlock.VALUE_SIZE_FORMAT, value_size),
+            b'' if is_tombstone else value
+        ])
+        size = len(encoded_entry)
 
         current_offset = self.data_length
         new_offset = current_offset + size
@@ -85,8 +217,12 @@ class DataBlockBuilder:
         if new_offset > self.target_size:
             return False
 
-        self.offsets.append(current_offset)
-        self.data_buffer[current_offset:new_offset] = encoded_record
+        if is_restart_point:
+            self.offsets.append(current_offset)
+            self._nb_entries_since_restart = 0
+        self._nb_entries_since_restart += 1
+        self._last_encoded_key = encoded_key
+        self.data_buffer[current_offset:new_offset] = encoded_entry
         self.data_length += size
         if self.first_key is None:
             self.first_key = key
@@ -131,20 +267,20 @@ class MetaBlock:
         return len(self.to_bytes())
 
     def to_bytes(self) -> bytes:
-        encoded_first_key_size = struct.pack("H", len(self.first_key))
         encoded_first_key = bytes(self.first_key, encoding=self.ENCODING)
-        encoded_last_key_size = struct.pack("H", len(self.last_key))
+        encoded_first_key_size = struct.pack("H", len(encoded_first_key))
         encoded_last_key = bytes(self.last_key, encoding=self.ENCODING)
+        encoded_last_key_size = struct.pack("H", len(encoded_last_key))
         encoded_offset = struct.pack("i", self.offset)
 
         return encoded_first_key_size + encoded_first_key + encoded_last_key_size + encoded_last_key + encoded_offset
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "MetaBlock":
+    def from_bytes(cls, data: bytes | memoryview) -> "MetaBlock":
         first_key_size = struct.unpack("H", data[0:2])[0]
-        first_key = data[2:2 + first_key_size].decode(encoding=cls.ENCODING)
+        first_key = str(data[2:2 + first_key_size], encoding=cls.ENCODING)
         last_key_size = struct.unpack("H", data[2 + first_key_size:2 + first_key_size + 2])[0]
-        last_key = data[2 + first_key_size + 2:2 + first_key_size + 2 + last_key_size].decode(encoding=cls.ENCODING)
+        last_key = str(data[2 + first_key_size + 2:2 + first_key_size + 2 + last_key_size], encoding=cls.ENCODING)
         offset = struct.unpack("i", data[2 + first_key_size + 2 + last_key_size:
                                          2 + first_key_size + 2 + last_key_size + 4])[0]
 
@@ -1,9 +1,24 @@
 import struct
+from array import array
+from enum import IntEnum
 from math import log, ceil
-from typing import Optional
+from typing import Iterable, Optional, Union
 
 import mmh3
 
+# Number of bits per key that gives a false positive rate of 0.1% (cf `BloomFilter.build_from_keys_and_fp_rate`)
+DEFAULT_BITS_PER_KEY = -log(0.001) / (log(2) ** 2)
+
+
+class BloomFilterLayout(IntEnum):
+    """Layouts of the bits of a bloom filter (cf `BloomFilter` and `BlockedBloomFilter`).
+
+    The value of each layout is the byte stored before the bloom filter of SSTables (cf `SSTableEncoding`): it must
+    thus never change.
+    """
+    STANDARD = 0
+    BLOCKED = 1
+
 
 class BloomFilter:
     """This class implements a bloom filter.
@@ -21,41 +36,62 @@ class BloomFilter:
     those bits in the sequence:
     - If they are all set, then the key may be in the collection;
     - If at least one of them is not set, then we are guaranteed that the key is not in the collection.
-    """
 
-    def __init__(self, nb_bytes: int, nb_hash_functions: int, bits: Optional[int] = None):
-        # `bits` is bigger than a 4-byte int (it will be `nb_bytes` long), but Python is able to handle this
+    A bloom filter of 0 bytes has no bit to check: it is a disabled filter, which may contain any key.
+    """
+    LAYOUT = BloomFilterLayout.STANDARD
+
+    def __init__(self,
+                 nb_bytes: int,
+                 nb_hash_functions: int,
+                 bits: Optional[Union[bytearray, memoryview]] = None,
+                 double_hashing: bool = True):
+        # Bit `i` of the filter is bit `i % 8` of byte `i // 8` (i.e. the sequence of bits is little-endian)
         self.nb_bytes = nb_bytes
         self.bits_size = 8 * nb_bytes
         self.nb_hash_functions = nb_hash_functions
-        self.bits = bits if bits else 0
+        self.bits = bits if bits is not None else bytearray(nb_bytes)
+        self.double_hashing = double_hashing
 
     def __eq__(self, other):
         if not isinstance(other, BloomFilter):
             return NotImplemented
-        return self.bits == other.bits and self.nb_hash_functions == other.nb_hash_functions
+        return (type(self) is type(other)
+                and self.bits == other.bits
+                and self.nb_hash_functions == other.nb_hash_functions
+                and self.double_hashing == other.double_hashing)
 
     def _hash(self, key: str) -> list[int]:
         """Hashes the key with all hash functions and defines the list of bits that should be set.
         After hashing, we take the modulo of the result by the size of the sequence of bits so that all hash functions
         are mapped to the same output range.
+
+        With double hashing, the key is hashed only once (into a 128-bit hash, split into two 64-bit halves `h1` and
+        `h2`) and the i-th hash function is simulated as `h1 + i * h2`: this is as accurate as independent hash
+        functions (cf Kirsch and Mitzenmacher, "Less Hashing, Same Performance"), for a single call to murmur3.
+        Otherwise (bloom filters of SSTables written before double hashing), the key is hashed once per hash function,
+        with the index of the function as the seed.
         """
+        if self.double_hashing:
+            return self._bits_of_hash(*self.hash_key(key=key))
         encoded_key = key.encode(encoding="utf-8")
-        selected_bits = []
-        for i in range(self.nb_hash_functions):
-            hashed_key = mmh3.hash(encoded_key, i)
-            selected_bit = hashed_key % self.bits_size
-            selected_bits.append(selected_bit)
-        return selected_bits
+        return [mmh3.hash(encoded_key, i) % self.bits_size for i in range(self.nb_hash_functions)]
+
+    @staticmethod
+    def hash_key(key: str) -> tuple[int, int]:
+        """Returns the 128-bit hash of a key, as two 64-bit halves `h1` and `h2`, from which its bits are selected (the
+        bits of a key thus only depend on its hash, which can be computed before the size of the filter is known)."""
+        return mmh3.hash64(key.encode(encoding="utf-8"), signed=False)
+
+    def _bits_of_hash(self, h1: int, h2: int) -> list[int]:
+        return [(h1 + i * h2) % self.bits_size for i in range(self.nb_hash_functions)]
 
     def _set_bit(self, bit_index: int) -> None:
-        assert bit_index <= self.bits_size, "Selected bit is bigger than the size of the bloom filter."
-        bit = (1 << bit_index)
-        self.bits |= bit
+        assert bit_index < self.bits_size, "Selected bit is bigger than the size of the bloom filter."
+        self.bits[bit_index >> 3] |= 1 << (bit_index & 7)
 
     def _is_bit_set(self, bit_index: int) -> bool:
-        bit = (1 << bit_index)
-        return (self.bits & bit) == bit
+        return (self.bits[bit_index >> 3] >> (bit_index & 7)) & 1 == 1
 
     def add(self, key: str) -> None:
         """Adds a key to the bloom filter.
@@ -64,30 +100,51 @@ class BloomFilter:
         for bit in bits_to_set:
             self._set_bit(bit_index=bit)
 
+    def add_many(self, keys: Iterable[str]) -> None:
+        """Adds several keys to the bloom filter.
+        This is equivalent to adding the keys one by one, but avoids the overhead of a method call per hash function.
+        """
+        bits = self.bits
+        hash_key = self._hash
+        for key in keys:
+            for bit_index in hash_key(key=key):
+                bits[bit_index >> 3] |= 1 << (bit_index & 7)
+
+    def add_hashes(self, hashes: array) -> None:
+        """Adds the keys whose hashes (cf `hash_key`) are given, as a flat array of their halves (`h1` and `h2` of the
+        i-th key are at indexes 2i and 2i + 1)."""
+        bits = self.bits
+        bits_of_hash = self._bits_of_hash
+        for i in range(0, len(hashes), 2):
+            for bit_index in bits_of_hash(hashes[i], hashes[i + 1]):
+                bits[bit_index >> 3] |= 1 << (bit_index & 7)
+
     def may_contain(self, key: str) -> bool:
         """Returns True if the key may be in the bloom filter, False if it is guaranteed not to be in it.
         """
-        bits_to_check = self._hash(key=key)
-        for bit in bits_to_check:
-            if not self._is_bit_set(bit_index=bit):
+        if self.bits_size == 0:
+            return True
+        bits = self.bits
+        for bit_index in self._hash(key=key):
+            if not (bits[bit_index >> 3] >> (bit_index & 7)) & 1:
                 return False
         return True
 
     def to_bytes(self) -> bytes:
-        # 0xFF is 255 (mask to get the lowest byte) - this encodes with little-endianness
-        bytes_to_pack = tuple((self.bits >> (8 * i)) & 0xFF for i in range(self.nb_bytes))
-        encoded_bits = struct.pack("B" * self.nb_bytes, *bytes_to_pack)
         encoded_nb_hash_functions = struct.pack("B", self.nb_hash_functions)
-        return encoded_bits + encoded_nb_hash_functions
+        return bytes(self.bits) + encoded_nb_hash_functions
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "BloomFilter":
+    def from_bytes(cls, data: bytes, double_hashing: bool = True) -> "BloomFilter":
+        """Decodes a bloom filter.
+        The bits are not copied: the bloom filter is backed by a view of `data` (it can thus only be modified if `data`
+        is writable). `double_hashing` must tell how the encoded bloom filter was built (cf `_hash`).
+        """
         nb_bytes = len(data) - 1
-        nb_hash_functions = struct.unpack("B", data[nb_bytes:])[0]
-        unpacked_bytes = struct.unpack("B" * nb_bytes, data[:nb_bytes])
-        bits = sum(byte << (8 * i) for i, byte in enumerate(unpacked_bytes))
+        nb_hash_functions = data[nb_bytes]
+        bits = memoryview(data)[:nb_bytes]
 
-        return cls(nb_bytes=nb_bytes, nb_hash_functions=nb_hash_functions, bits=bits)
+        return cls(nb_bytes=nb_bytes, nb_hash_functions=nb_hash_functions, bits=bits, double_hashing=double_hashing)
 
     @classmethod
     def build_from_keys_and_fp_rate(cls, keys: list[str], fp_rate: float) -> "BloomFilter":
@@ -107,13 +164,79 @@ class BloomFilter:
 
         (Proof for the formulas can be found on wikipedia: https://en.wikipedia.org/wiki/Bloom_filter).
         """
-        n = len(keys)
-        m = (-n * log(fp_rate)) / (log(2) ** 2)
-        k = (m / n) * log(2)
+        return cls.build_from_keys_and_bits_per_key(keys=keys, bits_per_key=-log(fp_rate) / (log(2) ** 2))
 
-        bloom_filter = cls(nb_bytes=ceil(m / 8), nb_hash_functions=round(k))
+    @classmethod
+    def build_from_keys_and_bits_per_key(cls, keys: list[str], bits_per_key: float) -> "BloomFilter":
+        """Returns a bloom filter of about `bits_per_key` bits per key (m = n * bits_per_key), with the optimal number
+        of hash functions for this size (k = bits_per_key * log(2)).
+        No bloom filter is built if `bits_per_key` is 0: the returned filter is disabled (it may contain any key).
+        """
+        bloom_filter = cls._build_empty(nb_keys=len(keys), bits_per_key=bits_per_key)
+        if bloom_filter.bits_size > 0:
+            bloom_filter.add_many(keys=keys)
 
-        for key in keys:
-            bloom_filter.add(key)
+        return bloom_filter
+
+    @classmethod
+    def build_from_hashes_and_bits_per_key(cls, hashes: array, bits_per_key: float) -> "BloomFilter":
+        """Same as `build_from_keys_and_bits_per_key`, from the hashes of the keys (cf `add_hashes`): this lets the
+        keys be hashed as they arrive (e.g. by `SSTableBuilder`), instead of being kept until the filter is built."""
+        bloom_filter = cls._build_empty(nb_keys=len(hashes) // 2, bits_per_key=bits_per_key)
+        if bloom_filter.bits_size > 0:
+            bloom_filter.add_hashes(hashes=hashes)
 
         return bloom_filter
+
+    @classmethod
+    def _build_empty(cls, nb_keys: int, bits_per_key: float) -> "BloomFilter":
+        if bits_per_key == 0:
+            return cls(nb_bytes=0, nb_hash_functions=0)
+
+        if nb_keys == 0:
+            # No bit is set: the filter never matches
+            return cls(nb_bytes=cls._nb_bytes_for(nb_bits=1), nb_hash_functions=1)
+
+        m = nb_keys * bits_per_key
+        k = bits_per_key * log(2)
+
+        return cls(nb_bytes=cls._nb_bytes_for(nb_bits=m), nb_hash_functions=max(round(k), 1))
+
+    @classmethod
+    def _nb_bytes_for(cls, nb_bits: float) -> int:
+        return ceil(nb_bits / 8)
+
+
+class BlockedBloomFilter(BloomFilter):
+    """This class implements a blocked bloom filter.
+    The bits are split into blocks of the size of a cache line (64 bytes). Each key is first mapped to one block, and
+    all its bits are then selected within that block: a lookup reads a single cache line instead of `k` random places
+    of the whole filter.
+    The bits of keys are less evenly spread than in a standard bloom filter (blocks get more or fewer keys than the
+    average), so that its false positive rate is a bit higher for the same number of bits per key.
+    """
+    LAYOUT = BloomFilterLayout.BLOCKED
+    BLOCK_SIZE = 64
+    BLOCK_BITS_SIZE = 8 * BLOCK_SIZE
+
+    def _hash(self, key: str) -> list[int]:
+        return self._bits_of_hash(*self.hash_key(key=key))
+
+    def _bits_of_hash(self, h1: int, h2: int) -> list[int]:
+        """The first half of the 128-bit hash of the key selects the block and the two 32-bit halves of its second half
+        are used for double hashing within the block (the step is made odd so that the `k` bits are distinct as long as
+        `k` is smaller than the number of bits of a block, which is a power of 2).
+        """
+        block_start = (h1 % (self.nb_bytes // self.BLOCK_SIZE)) * self.BLOCK_BITS_SIZE
+        a, b = h2 & 0xFFFFFFFF, (h2 >> 32) | 1
+        return [block_start + (a + i * b) % self.BLOCK_BITS_SIZE for i in range(self.nb_hash_functions)]
+
+    @classmethod
+    def _nb_bytes_for(cls, nb_bits: float) -> int:
+        return ceil(nb_bits / cls.BLOCK_BITS_SIZE) * cls.BLOCK_SIZE
+
+
+BLOOM_FILTER_CLASSES = {
+    BloomFilterLayout.STANDARD: BloomFilter,
+    BloomFilterLayout.BLOCKED: BlockedBloomFilter,
+}
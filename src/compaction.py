@@ -0,0 +1,219 @@
+import weakref
+from enum import IntEnum
+from typing import TYPE_CHECKING, Optional
+
+from src.sstable import SSTable
+
+if TYPE_CHECKING:
+    from src.lsm_storage import LsmStorage
+
+
+class CompactionStyle(IntEnum):
+    """Strategies that can be used to compact the SSTables of a store (cf `CompactionStrategy`).
+
+    The value of each style is the byte stored in the header of the manifest: it must thus never change.
+    """
+    LEVELED = 0
+    UNIVERSAL = 1
+
+
+class CompactionStrategy:
+    """This class decides which compactions a store needs and runs them.
+
+    Compactions are identified by the level they start from: the store (or its background scheduler) asks for the
+    levels to compact (`levels_to_compact`, most urgent first), then runs their compactions (`compact`). A background
+    compaction reserves the levels that it may touch (`reserved_levels`), so that no other compaction touches them at
+    the same time.
+    """
+
+    def __init__(self, store: "LsmStorage"):
+        # The store owns its strategy: it is only referenced weakly here, so that a store that is no longer used is
+        # freed (and its files closed) right away instead of waiting for the garbage collector to find the cycle
+        self._store = weakref.ref(store)
+
+    @property
+    def store(self) -> "LsmStorage":
+        return self._store()
+
+    @staticmethod
+    def create(store: "LsmStorage") -> "CompactionStrategy":
+        strategy_classes = {
+            CompactionStyle.LEVELED: LeveledCompactionStrategy,
+            CompactionStyle.UNIVERSAL: UniversalCompactionStrategy,
+        }
+        return strategy_classes[store._configuration.compaction_style](store=store)
+
+    def levels_to_compact(self) -> list[int]:
+        raise NotImplementedError
+
+    def compact(self, level: int) -> None:
+        raise NotImplementedError
+
+    def reserved_levels(self, level: int) -> set[int]:
+        raise NotImplementedError
+
+
+class LeveledCompactionStrategy(CompactionStrategy):
+    """Leveled compaction: each level is compacted into the next one once it exceeds its target size.
+
+    L0 is compacted as a whole into L1, and deeper levels one SSTable at a time (cf `LsmStorage.force_compaction_l0`
+    and `LsmStorage.force_compaction_l1_or_more_level`). Each record is thus rewritten about `1 / levels_ratio` times
+    per level, which keeps reads and space amplification low at the cost of write amplification.
+    """
+
+    def level_targets(self) -> list[float]:
+        """Returns the target size (in bytes) of each level from L1 to the last but one (index 0 is L1).
+
+        The target of L1 is `base_level_size`, and each deeper level targets `1 / levels_ratio` times the target of
+        the previous one.
+        With `dynamic_level_bytes`, the targets are instead derived backwards from the actual size of the last level
+        (each level targets `levels_ratio` times the target of the next one), with `base_level_size` as a lower bound:
+        the shape of the tree then follows the amount of data actually stored, which bounds space amplification.
+        """
+        configuration = self.store._configuration
+        nb_levels = configuration.nb_levels
+        if not configuration.dynamic_level_bytes:
+            return [configuration.base_level_size / configuration.levels_ratio ** level
+                    for level in range(nb_levels - 1)]
+
+        last_level_size = sum(sstable.size for sstable in self.store.state.sstables_levels[-1])
+        return [max(last_level_size * configuration.levels_ratio ** (nb_levels - 1 - level),
+                    configuration.base_level_size)
+                for level in range(nb_levels - 1)]
+
+    def compaction_scores(self) -> list[float]:
+        """Returns the compaction score of each level but the last one (index 0 is L0): a level needs to be compacted
+        when its score is 1 or more.
+        The score of L0 is its number of SSTables over `max_l0_sstables` (L0 SSTables overlap each other, so that each
+        of them slows reads down whatever its size). The score of deeper levels is their size (in bytes) over their
+        target size (cf `level_targets`).
+        """
+        state = self.store.state
+        with self.store._locks.read_write.read():
+            scores = [len(state.sstables_level0) / self.store._configuration.max_l0_sstables]
+            for sstables, target in zip(state.sstables_levels, self.level_targets()):
+                scores.append(sum(sstable.size for sstable in sstables) / target)
+        return scores
+
+    def levels_to_compact(self) -> list[int]:
+        """Returns the levels that need to be compacted, from the highest compaction score to the lowest."""
+        scores = self.compaction_scores()
+        levels = [level for level, score in enumerate(scores) if score >= 1]
+        return sorted(levels, key=lambda level: scores[level], reverse=True)
+
+    def compact(self, level: int) -> None:
+        if level == 0:
+            self.store.force_compaction_l0()
+        else:
+            self.store.force_compaction_l1_or_more_level(level=level)
+
+    def reserved_levels(self, level: int) -> set[int]:
+        return {level, level + 1}
+
+
+class SortedRun:
+    """A sequence of SSTables that are sorted and do not overlap: an L0 SSTable, or all SSTables of a deeper level."""
+
+    def __init__(self, level: int, sstables: list[SSTable]):
+        self.level = level
+        self.sstables = sstables
+        self.size = sum(sstable.size for sstable in sstables)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SortedRun):
+            return NotImplemented
+        return self.level == other.level and self.sstables == other.sstables
+
+    def __repr__(self):
+        return f"SortedRun(level={self.level}, size={self.size})"
+
+
+class UniversalCompactionStrategy(CompactionStrategy):
+    """Universal (size-tiered) compaction: sorted runs of similar sizes are merged together.
+
+    The sorted runs of the store are, from the newest to the oldest, each L0 SSTable then each non-empty deeper level.
+    Once there are `max_l0_sstables` sorted runs or more, some consecutive runs are merged into one (cf
+    `pick_sorted_runs`), which is written to the level of the oldest of them (or to the deepest free level).
+    Each record is rewritten only about once per size tier, which lowers write amplification compared to leveled
+    compaction, at the cost of more sorted runs to read from and of more space (a full compaction needs to rewrite all
+    the data).
+    """
+    # Runs are merged while the next (older) run is at most this percentage bigger than the runs picked so far
+    SIZE_RATIO_PERCENT = 1
+    MIN_MERGE_WIDTH = 2
+    # All runs are merged once the newer runs take this percentage of the size of the oldest one (i.e. once at least
+    # this percentage of the data may be obsolete)
+    MAX_SIZE_AMPLIFICATION_PERCENT = 200
+
+    def sorted_runs(self) -> list[SortedRun]:
+        """Returns the sorted runs of the store, from the newest to the oldest."""
+        state = self.store.state
+        with self.store._locks.read_write.read():
+            return ([SortedRun(level=0, sstables=[sstable]) for sstable in state.sstables_level0] +
+                    [SortedRun(level=level, sstables=list(sstables))
+                     for level, sstables in enumerate(state.sstables_levels, start=1) if len(sstables)])
+
+    def pick_sorted_runs(self, sorted_runs: list[SortedRun]) -> Optional[list[SortedRun]]:
+        """Picks the consecutive sorted runs to merge, if there are too many runs:
+        - all of them if the newer runs are too big compared to the oldest one (space amplification);
+        - otherwise, the first sequence of at least `MIN_MERGE_WIDTH` runs whose sizes are similar (each run is at most
+          `SIZE_RATIO_PERCENT` bigger than the runs before it);
+        - otherwise, the newest runs, just enough of them to bring the number of runs back under the threshold.
+        """
+        max_nb_sorted_runs = self.store._configuration.max_l0_sstables
+        if len(sorted_runs) < max(max_nb_sorted_runs, self.MIN_MERGE_WIDTH):
+            return None
+
+        newer_runs_size = sum(sorted_run.size for sorted_run in sorted_runs[:-1])
+        if newer_runs_size * 100 >= self.MAX_SIZE_AMPLIFICATION_PERCENT * sorted_runs[-1].size:
+            return sorted_runs
+
+        for start in range(len(sorted_runs) - self.MIN_MERGE_WIDTH + 1):
+            picked_size = sorted_runs[start].size
+            end = start + 1
+            while (end < len(sorted_runs)
+                   and sorted_runs[end].size * 100 <= picked_size * (100 + self.SIZE_RATIO_PERCENT)):
+                picked_size += sorted_runs[end].size
+                end += 1
+            if end - start >= self.MIN_MERGE_WIDTH:
+                return sorted_runs[start:end]
+
+        return sorted_runs[:max(len(sorted_runs) - max_nb_sorted_runs + 2, self.MIN_MERGE_WIDTH)]
+
+    def output_level(self, sorted_runs: list[SortedRun], picked_sorted_runs: list[SortedRun]) -> int:
+        """Returns the level where the merged runs are written.
+        The output must be read after all newer runs and before all older ones: it goes to the level of the oldest
+        picked run, or, when this run is an L0 SSTable, to the deepest free level above the next (older) run. When all
+        the runs are picked, it goes to the last level (where tombstones can be dropped).
+        """
+        if picked_sorted_runs[-1] is sorted_runs[-1]:
+            return self.store._configuration.nb_levels
+        if picked_sorted_runs[-1].level > 0:
+            return picked_sorted_runs[-1].level
+        next_sorted_run = sorted_runs[sorted_runs.index(picked_sorted_runs[-1]) + 1]
+        return next_sorted_run.level - 1
+
+    def levels_to_compact(self) -> list[int]:
+        # A universal compaction may touch all levels: it is identified by L0, where its newest runs usually are
+        return [0] if self.pick_sorted_runs(sorted_runs=self.sorted_runs()) is not None else []
+
+    def compact(self, level: int) -> None:
+        sorted_runs = self.sorted_runs()
+        picked_sorted_runs = self.pick_sorted_runs(sorted_runs=sorted_runs)
+        if picked_sorted_runs is None:
+            return
+
+        # An L0 SSTable cannot be written to a deeper level while older L0 SSTables stay in L0, nor can it go to L1 if
+        # L1 is not free: the next runs are merged along until the output fits between the picked and remaining runs
+        end = sorted_runs.index(picked_sorted_runs[-1]) + 1
+        start = sorted_runs.index(picked_sorted_runs[0])
+        while end < len(sorted_runs) and sorted_runs[end - 1].level == 0 and sorted_runs[end].level <= 1:
+            end += 1
+        picked_sorted_runs = sorted_runs[start:end]
+
+        self.store._compact_sorted_runs(
+            sorted_runs=[sorted_run.sstables for sorted_run in picked_sorted_runs],
+            output_level=self.output_level(sorted_runs=sorted_runs, picked_sorted_runs=picked_sorted_runs))
+
+    def reserved_levels(self, level: int) -> set[int]:
+        return set(range(self.store._configuration.nb_levels + 1))
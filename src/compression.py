@@ -0,0 +1,61 @@
+import bz2
+import lzma
+import struct
+import zlib
+from enum import IntEnum
+
+
+class Compression(IntEnum):
+    """Codecs that can be used to compress the data blocks of SSTables (they are all part of the standard library).
+
+    The value of each codec is the byte stored alongside every compressed data block (cf `compress_block`): it must
+    thus never change once SSTables have been written with it.
+    """
+    NONE = 0
+    ZLIB = 1
+    LZMA = 2
+    BZ2 = 3
+
+    def compress(self, data: bytes) -> bytes:
+        if self == Compression.NONE:
+            return data
+        return _CODECS[self][0](data)
+
+    def decompress(self, data: bytes | memoryview) -> bytes | memoryview:
+        if self == Compression.NONE:
+            return data
+        return _CODECS[self][1](data)
+
+
+_CODECS = {
+    Compression.ZLIB: (zlib.compress, zlib.decompress),
+    Compression.LZMA: (lzma.compress, lzma.decompress),
+    Compression.BZ2: (bz2.compress, bz2.decompress),
+}
+
+CODEC_SIZE = 1
+
+
+def compress_block(data: bytes, compression: Compression) -> bytes:
+    """Compresses an encoded data block and appends the codec that was used to it:
+    +-----------------------+---------+
+    |     Compressed data   |  Codec  |
+    +-----------------------+---------+
+    | (variable size)       | 1 byte  |
+    +-----------------------+---------+
+
+    Blocks that do not shrink when compressed (e.g. random values) are stored uncompressed (with the codec NONE) so
+    that reading them does not pay for a useless decompression.
+    """
+    compressed_data = compression.compress(data)
+    if len(compressed_data) >= len(data):
+        compression, compressed_data = Compression.NONE, data
+
+    return compressed_data + struct.pack("B", compression)
+
+
+def decompress_block(data: bytes | memoryview) -> bytes | memoryview:
+    """Decompresses a data block encoded by `compress_block`.
+    Uncompressed blocks are returned as-is (a memoryview is thus not copied)."""
+    compression = Compression(data[-CODEC_SIZE])
+    return compression.decompress(data[:-CODEC_SIZE])
@@ -0,0 +1,123 @@
+import mmap
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Union, Callable
+
+from src.locks import Mutex
+
+
+class FileDescriptorPool:
+    """This class keeps a bounded number of read-only file descriptors open, so that files that are read often (like
+    SSTables) do not need to be re-opened on every read.
+
+    Descriptors are evicted in Least Recently Used (LRU) order when the pool exceeds its capacity.
+    A descriptor that is being used (i.e. that is pinned by an ongoing `open` context) is never closed: the pool may
+    thus temporarily exceed its capacity if more files than its capacity are being read concurrently.
+
+    Descriptors are meant to be read with positional reads (`os.pread`), which do not depend on (nor modify) the
+    offset of the file. This allows several threads to read from the same descriptor at the same time.
+
+    Files can also be memory-mapped through the pool (cf `map`). A map keeps a descriptor of its own open: maps thus
+    count against the capacity of the pool as descriptors do, and they are unmapped when they are evicted.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.evictions = 0
+        # Descriptors (or maps) of the files, from the least to the most recently used
+        self._descriptors: OrderedDict[str, Union[int, mmap.mmap]] = OrderedDict()
+        self._pins: dict[str, int] = {}
+        self._lock = Mutex()
+
+    def __len__(self) -> int:
+        return len(self._descriptors)
+
+    @contextmanager
+    def open(self, path: str) -> Iterator[int]:
+        file_descriptor = self._acquire(path=path, open_file=lambda file_path: os.open(file_path, os.O_RDONLY))
+        try:
+            yield file_descriptor
+        finally:
+            self._release(path=path)
+
+    @contextmanager
+    def map(self, path: str) -> Iterator[memoryview]:
+        """Gives a view of the whole file, which is mapped (read-only) upon its first use.
+        Views may be used after the end of the context: a map that is evicted while views of it are still referenced is
+        only unmapped once they are all freed (cf `unmap`).
+        """
+        file_map = self._acquire(path=path, open_file=map_file)
+        try:
+            yield memoryview(file_map)
+        finally:
+            self._release(path=path)
+
+    def _acquire(self, path: str, open_file: Callable[[str], Union[int, mmap.mmap]]) -> Union[int, mmap.mmap]:
+        with self._lock:
+            file_descriptor = self._descriptors.get(path)
+            if file_descriptor is None:
+                file_descriptor = open_file(path)
+                self._descriptors[path] = file_descriptor
+            else:
+                self._descriptors.move_to_end(path)
+            self._pins[path] = self._pins.get(path, 0) + 1
+            self._evict()
+
+            return file_descriptor
+
+    def _release(self, path: str) -> None:
+        with self._lock:
+            self._pins[path] -= 1
+            if self._pins[path] == 0:
+                del self._pins[path]
+            self._evict()
+
+    def _evict(self) -> None:
+        if len(self._descriptors) <= self.capacity:
+            return
+
+        for path in list(self._descriptors.keys()):
+            if len(self._descriptors) <= self.capacity:
+                return
+            if path in self._pins:
+                continue
+            _close_descriptor(self._descriptors.pop(path))
+            self.evictions += 1
+
+    def close(self, path: str) -> None:
+        """Closes the descriptor (or the map) of a file (if it is open and not being used)."""
+        with self._lock:
+            if path in self._descriptors and path not in self._pins:
+                _close_descriptor(self._descriptors.pop(path))
+
+    def close_all(self) -> None:
+        """Closes all descriptors (and maps) that are not being used."""
+        with self._lock:
+            for path in list(self._descriptors.keys()):
+                if path not in self._pins:
+                    _close_descriptor(self._descriptors.pop(path))
+
+
+def map_file(path: str) -> mmap.mmap:
+    """Maps a whole file read-only (the file must not be empty: empty files cannot be mapped)."""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def unmap(file_map: mmap.mmap) -> None:
+    """Unmaps a file and closes the descriptor kept open by its map.
+    If views of the map are still referenced (e.g. by an ongoing iteration over the blocks of an SSTable), the map
+    cannot be closed yet: it is then unmapped (and its descriptor closed) when the last of them is freed.
+    """
+    try:
+        file_map.close()
+    except BufferError:
+        pass
+
+
+def _close_descriptor(file_descriptor: Union[int, mmap.mmap]) -> None:
+    if isinstance(file_descriptor, mmap.mmap):
+        unmap(file_map=file_descriptor)
+    else:
+        os.close(file_descriptor)
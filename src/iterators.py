@@ -1,6 +1,7 @@
 from heapq import heappush, heappop
-from typing import Iterator, TYPE_CHECKING, Optional
+from typing import Iterator, TYPE_CHECKING, Optional, Iterable
 
+from src.range_tombstones import RangeTombstones
 from src.record import Record
 
 # TODO: Should be possible to remove this when finished decoupling iterators logic from DataBlocks
@@ -38,10 +39,10 @@ class MemTableIterator(BaseIterator):
         if start_key is None and end_key is None:
             return iter(memtable.map)
 
-        if start_key is not None and end_key is not None:
+        if start_key is not None:
             return iter(memtable.map.scan(lower=start_key, upper=end_key))
 
-        raise ValueError(f"Only 'start_key' or 'end_key' was passed. The iterator cannot handle this case!")
+        raise ValueError(f"Only 'end_key' was passed. The iterator cannot handle this case!")
 
     def __iter__(self) -> "MemTableIterator":
         return self
@@ -63,64 +64,79 @@ class DataBlockIterator(BaseIterator):
                  ):
         super().__init__()
         self.block = block
-        self._index = self._select_index(key=start_key)
+        self._records = self._seek(key=start_key)
         self._end_key = end_key
 
     def _select_index(self, key: Optional[Record.Key] = None) -> int:
-        """Selects the first key that is >= key"""
+        """Selects the first restart point whose key is >= key"""
         if key is None:
             return 0
 
-        offsets = self.block.offsets + [len(self.block.data)]
-
-        low, high = 0, len(self.block.offsets)
-        while low < high:
-            mid = int(low + (high - low) / 2)
-            offset_start = offsets[mid]
-            offset_end = offsets[mid + 1]
-            encoded_record = self.block.data[offset_start:offset_end]
-            record = Record.from_bytes(data=encoded_record)
-            if record.key == key:
-                return mid
-            if record.key < key:
-                low = mid + 1
-            if record.key > key:
-                high = mid
-
-        # TODO mettre tout ca dans une autre fonction et StopIteration si plus que le truc (ça devrait être bon avec ce que j'ai - ajouter un test)
-        return low
+        index, _ = self.block.search(key=key)
+        return index
+
+    def _seek(self, key: Optional[Record.Key] = None) -> Iterator[Record]:
+        """Positions the iterator on the first record whose key is >= key.
+        Keys between two restart points are only reachable from the first of them: the scan thus starts from the
+        restart point preceding the one selected.
+        """
+        if key is None:
+            return self.block.records()
+
+        restart_index = max(self._select_index(key=key) - 1, 0)
+        return self.block.records(restart_index=restart_index, start_key=key)
 
     def __iter__(self) -> "DataBlockIterator":
         return self
 
     def __next__(self) -> Record:
-        if self._index >= len(self.block.offsets):
-            raise StopIteration()
-        offset = self.block.offsets[self._index]
-        next_offset = self.block.offsets[self._index + 1] if self._index + 1 < len(self.block.offsets) else len(
-            self.block.data)
-        self._index += 1
-        encoded_record = self.block.data[offset:next_offset]
-        record = Record.from_bytes(data=encoded_record)
+        record = next(self._records)
         if self._end_key and record.key > self._end_key:
             raise StopIteration
         return record
 
 
 class SSTableIterator(BaseIterator):
+    """Iterates over the records of an SSTable, from `start_key` to `end_key` (both included).
+    The data blocks entirely covered by the `shadowing_range_tombstones` (i.e. the range tombstones of newer memtables
+    and SSTables) are skipped without being read nor decoded.
+    """
+
     def __init__(self,
                  sstable: "SSTable",
                  start_key: Optional[Record.Key] = None,
-                 end_key: Optional[Record.Key] = None
+                 end_key: Optional[Record.Key] = None,
+                 shadowing_range_tombstones: Optional[RangeTombstones] = None
                  ):
         super().__init__()
-        self._index = 0
         self.sstable = sstable
         self.start_key = start_key
         self.end_key = end_key
-        self.block_iterator = self._get_block_iterator(block_id=0)
+        self.shadowing_range_tombstones = shadowing_range_tombstones
+        self._index = self._select_block_id(key=start_key)
+        self.block_iterator = self._get_block_iterator(block_id=self._index)
 
-    def _get_block_iterator(self, block_id: int):
+    def _select_block_id(self, key: Optional[Record.Key] = None) -> int:
+        """Selects the first block that may contain keys >= key (the blocks before it are never read)"""
+        if key is None:
+            return 0
+        return self.sstable.find_first_block_id(key=key)
+
+    def _is_past_end(self, block_id: int) -> bool:
+        if block_id >= len(self.sstable.meta_blocks):
+            return True
+        return self.end_key is not None and self.sstable.meta_blocks[block_id].first_key > self.end_key
+
+    def _is_shadowed(self, block_id: int) -> bool:
+        if self.shadowing_range_tombstones is None:
+            return False
+        meta_block = self.sstable.meta_blocks[block_id]
+        return self.shadowing_range_tombstones.covers_range(first_key=meta_block.first_key,
+                                                            last_key=meta_block.last_key)
+
+    def _get_block_iterator(self, block_id: int) -> Iterator[Record]:
+        if self._is_past_end(block_id=block_id) or self._is_shadowed(block_id=block_id):
+            return iter(())
         return DataBlockIterator(
             block=self.sstable.read_data_block(block_id=block_id),
             start_key=self.start_key,
@@ -130,22 +146,41 @@ class SSTableIterator(BaseIterator):
         return self
 
     def __next__(self) -> Record:
-        try:
-            return next(self.block_iterator)
-        except StopIteration:
-            self._index += 1
-            if self._index >= len(self.sstable.meta_blocks):
-                raise StopIteration()
+        # Blocks may yield no record (e.g. when they are shadowed): they are skipped in a loop, so that skipping many
+        # blocks in a row does not grow the stack
+        while True:
+            try:
+                return next(self.block_iterator)
+            except StopIteration:
+                self._index += 1
+                if self._is_past_end(block_id=self._index):
+                    raise StopIteration()
 
-            self.block_iterator = self._get_block_iterator(block_id=self._index)
-            return next(self)
+                self.block_iterator = self._get_block_iterator(block_id=self._index)
 
 
 class MergingIterator(BaseIterator):
-    def __init__(self, iterators: list[BaseIterator]):
+    """Merges sorted iterators into a single sorted iterator.
+    The iterators must be ordered from the newest to the oldest: when a key is in several of them, only the record of
+    the newest one is kept. If this record is a tombstone, the key is considered absent (i.e. it is skipped) unless
+    `keep_tombstones` is set (which is needed when the merged records are written to a level that is not the last one:
+    the tombstones must then keep shadowing the older records of the deeper levels).
+    If `range_tombstones` are given (those of each iterator, in the same order), the records of an iterator that are
+    covered by the range tombstones of a newer iterator are skipped.
+    """
+
+    def __init__(self,
+                 iterators: list[BaseIterator],
+                 keep_tombstones: bool = False,
+                 range_tombstones: Optional[list[RangeTombstones]] = None):
         super().__init__()
+        if range_tombstones is not None:
+            iterators = [self._filter_shadowed_records(iterator=iterator, shadowing_range_tombstones=shadowing)
+                         for iterator, shadowing in zip(iterators, RangeTombstones.shadowing(range_tombstones))]
         self.iterators = iterators
         self.merged_and_filtered_iterator = self._filter_duplicate_keys(self._merge_iterators())
+        if not keep_tombstones:
+            self.merged_and_filtered_iterator = self._filter_tombstones(self.merged_and_filtered_iterator)
 
     def __iter__(self) -> "MergingIterator":
         return self
@@ -180,6 +215,16 @@ class MergingIterator(BaseIterator):
             yield value
             try_push_iterator(i)
 
+    @staticmethod
+    def _filter_shadowed_records(iterator: BaseIterator,
+                                 shadowing_range_tombstones: RangeTombstones) -> Iterator[Record]:
+        if not len(shadowing_range_tombstones):
+            yield from iterator
+            return
+        for item in iterator:
+            if not shadowing_range_tombstones.covers(key=item.key):
+                yield item
+
     @staticmethod
     def _filter_duplicate_keys(iterator: Iterator[Record]) -> Iterator[Record]:
         previous_item = None
@@ -189,9 +234,20 @@ class MergingIterator(BaseIterator):
             yield item
             previous_item = item
 
+    @staticmethod
+    def _filter_tombstones(iterator: Iterator[Record]) -> Iterator[Record]:
+        for item in iterator:
+            if not item.is_tombstone:
+                yield item
+
 
 class ConcatenatingIterator(BaseIterator):
-    def __init__(self, iterators: list[BaseIterator]):
+    """Chains iterators whose records are sorted and do not overlap (e.g. the SSTables of a level).
+    `iterators` may be a generator: each iterator is then only created once the previous ones are exhausted (e.g. an
+    SSTable is only read once the scan reaches it).
+    """
+
+    def __init__(self, iterators: Iterable[BaseIterator]):
         super().__init__()
         self.iterators = iterators
         self.iterator = self._concatenate_iterators()
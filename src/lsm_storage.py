@@ -1,14 +1,30 @@
 import os
 import time
+import sys
+from bisect import bisect_left, bisect_right
 from collections import deque
-from typing import Optional, Iterator, Deque
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import count, takewhile
+from typing import Optional, Iterator, Deque, Callable
 
-from src.iterators import MemTableIterator, MergingIterator, SSTableIterator, ConcatenatingIterator, BaseIterator
+from src.block_cache import BlockCache
+from src.blocks import DataBlock
+from src.compaction import CompactionStrategy, CompactionStyle
+from src.compression import Compression
+from src.file_descriptor_pool import FileDescriptorPool
+from src.iterators import MemTableIterator, MergingIterator, ConcatenatingIterator, BaseIterator
 from src.locks import ReadWriteLock, Mutex
-from src.manifest import Manifest, Configuration, FlushEvent, CompactionEvent
+from src.manifest import Manifest, Configuration, FlushEvent, CompactionEvent, TrivialMoveEvent, CompactionPointerEvent
 from src.memtable import MemTable
+from src.prefix_extractor import PrefixExtractor
+from src.range_tombstones import RangeTombstones
 from src.record import Record
-from src.sstable import SSTableBuilder, SSTable
+from src.scheduler import BackgroundScheduler, SchedulerOptions
+from src.sstable import SSTableBuilder, SSTable, SSTableFile, MmapSSTableFile, PartitionedIndex, \
+    insert_into_sorted_run
+from src.wal import Durability, WriteAheadLog
+from src.write_batch import WriteBatch
 
 
 class LsmState:
@@ -27,6 +43,74 @@ class LsmLocks:
     def __init__(self):
         self.read_write = ReadWriteLock()
         self.state = Mutex()
+        # Only one flush at a time (flushes must install SSTables in L0 in the order of their memtables)
+        self.flush = Mutex()
+        self.path = Mutex()
+
+
+class Subcompaction:
+    """This class describes the part of a compaction that is within a key range: it merges the records of the input
+    sorted runs (ordered from the newest to the oldest) that are from `lower` (included) to `upper` (excluded) into new
+    SSTables, whose paths start with `path_prefix`.
+    It only holds paths and settings (and no open file, cache or lock), so that it can be sent to another process (cf
+    `run_subcompaction`).
+    """
+
+    def __init__(self,
+                 sorted_runs_paths: list[list[str]],
+                 lower: Optional[Record.Key],
+                 upper: Optional[Record.Key],
+                 keep_tombstones: bool,
+                 range_tombstones: RangeTombstones,
+                 path_prefix: str,
+                 max_sstable_size: int,
+                 block_size: int,
+                 block_restart_interval: int,
+                 compression: Compression,
+                 bloom_bits_per_key: float,
+                 blocked_bloom_filter: bool,
+                 index_partition_size: int,
+                 prefix_extractor: Optional[PrefixExtractor]):
+        self.sorted_runs_paths = sorted_runs_paths
+        self.lower = lower
+        self.upper = upper
+        self.keep_tombstones = keep_tombstones
+        self.range_tombstones = range_tombstones
+        self.path_prefix = path_prefix
+        self.max_sstable_size = max_sstable_size
+        self.block_size = block_size
+        self.block_restart_interval = block_restart_interval
+        self.compression = compression
+        self.bloom_bits_per_key = bloom_bits_per_key
+        self.blocked_bloom_filter = blocked_bloom_filter
+        self.index_partition_size = index_partition_size
+        self.prefix_extractor = prefix_extractor
+
+
+def run_subcompaction(subcompaction: Subcompaction) -> list[str]:
+    """Runs a subcompaction (usually in a worker process) and returns the paths of the SSTables it wrote."""
+    sorted_runs = [[SSTable.build_from_path(path=path) for path in paths] for paths in subcompaction.sorted_runs_paths]
+    records_iterator = LsmStorage._merge_sorted_runs(sorted_runs=sorted_runs,
+                                                     keep_tombstones=subcompaction.keep_tombstones,
+                                                     lower=subcompaction.lower)
+    if subcompaction.upper is not None:
+        records_iterator = takewhile(lambda record: record.key < subcompaction.upper, records_iterator)
+    indexes = count()
+    new_ss_tables = LsmStorage._write_sstables(
+        records_iterator=records_iterator,
+        range_tombstones=subcompaction.range_tombstones,
+        create_sstable_builder=lambda: SSTableBuilder(sstable_size=subcompaction.max_sstable_size,
+                                                      block_size=subcompaction.block_size,
+                                                      restart_interval=subcompaction.block_restart_interval,
+                                                      compression=subcompaction.compression,
+                                                      directory=os.path.dirname(subcompaction.path_prefix),
+                                                      bloom_bits_per_key=subcompaction.bloom_bits_per_key,
+                                                      blocked_bloom_filter=subcompaction.blocked_bloom_filter,
+                                                      index_partition_size=subcompaction.index_partition_size,
+                                                      prefix_extractor=subcompaction.prefix_extractor),
+        compute_path=lambda: f"{subcompaction.path_prefix}_{next(indexes)}.sst",
+        max_sstable_size=subcompaction.max_sstable_size)
+    return [sstable.file.path for sstable in new_ss_tables]
 
 
 class LsmStorage:
@@ -34,7 +118,14 @@ class LsmStorage:
                  configuration: Configuration,
                  directory: str,
                  state: LsmState,
-                 manifest: Manifest
+                 manifest: Manifest,
+                 block_cache: Optional[BlockCache] = None,
+                 descriptor_pool: Optional[FileDescriptorPool] = None,
+                 use_mmap: bool = False,
+                 scheduler_options: Optional[SchedulerOptions] = None,
+                 durability: Durability = Durability.NONE,
+                 max_subcompactions: int = 1,
+                 multi_get_threads: int = 1
                  ):
         self.directory = directory
         self._create_directory()
@@ -46,16 +137,61 @@ class LsmStorage:
         # State
         self.state = state
 
+        # Read path
+        self.block_cache = block_cache
+        self.descriptor_pool = descriptor_pool
+        self.use_mmap = use_mmap
+        # The data blocks needed by a `multi_get` are read by up to `multi_get_threads` threads at once (the threads of
+        # the pool are only started when it is first used)
+        self.multi_get_threads = multi_get_threads
+        self._multi_get_pool: Optional[ThreadPoolExecutor] = \
+            ThreadPoolExecutor(max_workers=multi_get_threads) if multi_get_threads > 1 else None
+
+        # Write path
+        self.durability = durability
+
         # Concurrency handling
         self._locks = LsmLocks()
+        self._last_path_timestamp = 0
+
+        # Compactions
+        # Last key compacted in each level (L1 or deeper), from which the next SSTable to compact is picked (they are
+        # recorded in the manifest, so that the picking goes on where it stopped when the store is reopened)
+        self._compaction_pointers: dict[int, Record.Key] = manifest.compaction_pointers()
+
+        self.compaction_strategy = CompactionStrategy.create(store=self)
+        # Compactions are split into up to `max_subcompactions` key ranges, merged in parallel by worker processes
+        self.max_subcompactions = max_subcompactions
+        self._subcompaction_pool: Optional[ProcessPoolExecutor] = None
+
+        # Background jobs (flushes and compactions run on the threads of the callers when there is no scheduler)
+        self.scheduler = BackgroundScheduler(store=self, options=scheduler_options) \
+            if scheduler_options is not None else None
 
     def close(self) -> None:
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+
         if self.state.memtable.approximate_size > 0:
             self._freeze_memtable()
 
         while len(self.state.immutable_memtables):
             self.flush_next_immutable_memtable()
 
+        if self._subcompaction_pool is not None:
+            self._subcompaction_pool.shutdown(wait=True)
+            self._subcompaction_pool = None
+
+        if self._multi_get_pool is not None:
+            self._multi_get_pool.shutdown(wait=True)
+            self._multi_get_pool = None
+
+        self._close_files(sstables=[sstable for level in [self.state.sstables_level0] + self.state.sstables_levels
+                                    for sstable in level])
+        if self.descriptor_pool is not None:
+            self.descriptor_pool.close_all()
+
     @classmethod
     def create(cls,
                max_sstable_size: Optional[int] = 262_144_000,
@@ -63,8 +199,58 @@ class LsmStorage:
                levels_ratio: float = 0.1,
                max_l0_sstables: int = 10,
                nb_levels: int = 6,
+               base_level_size: int = 268_435_456,
+               dynamic_level_bytes: bool = False,
+               compaction_style: CompactionStyle = CompactionStyle.LEVELED,
                directory: Optional[str] = ".",
+               block_restart_interval: int = 16,
+               block_cache_size: int = 8_388_608,
+               max_open_files: int = 1000,
+               use_mmap: bool = False,
+               compression_per_level: Optional[list[Compression]] = None,
+               bloom_bits_per_key_per_level: Optional[list[float]] = None,
+               blocked_bloom_filters: bool = False,
+               index_partition_size: int = 0,
+               prefix_extractor: Optional[PrefixExtractor] = None,
+               scheduler_options: Optional[SchedulerOptions] = None,
+               durability: Durability = Durability.NONE,
+               max_subcompactions: int = 1,
+               multi_get_threads: int = 1,
                ) -> "LsmStorage":
+        """Creates a new store.
+        The `block_cache_size` is the capacity (in bytes) of the LRU cache of data blocks shared by all SSTables of the
+        store. Setting it to 0 disables the cache.
+        The `max_open_files` is the number of SSTable files that are kept open between reads. Setting it to 0 makes
+        every read open and close the file.
+        If `use_mmap` is set, SSTables are read through memory maps instead (cf `MmapSSTableFile`).
+        The `base_level_size` is the target size (in bytes) of L1, and each deeper level targets `1 / levels_ratio`
+        times the size of the previous one. If `dynamic_level_bytes` is set, the targets derive from the actual size of
+        the last level instead (cf `LeveledCompactionStrategy.level_targets`).
+        The `compaction_style` is the strategy used to compact SSTables: leveled (the default), or universal, which
+        writes less at the cost of more sorted runs to read from (cf `CompactionStrategy`).
+        The `compression_per_level` gives the codec of the data blocks written at each level (index 0 is L0, and the
+        last codec applies to all deeper levels), e.g. `[Compression.NONE, Compression.ZLIB, Compression.LZMA]`. Data
+        blocks are not compressed by default.
+        The `bloom_bits_per_key_per_level` gives the size of the bloom filters of each level, in bits per key (index 0
+        is L0, the last value applies to all deeper levels, and 0 builds no bloom filter). Since most lookups of
+        existing keys end in the last level, its filters save the fewest reads: e.g. `[14, 10, 0]` gives no filter to
+        L2. Bloom filters have about 14.4 bits per key (0.1% of false positives) by default. If `blocked_bloom_filters`
+        is set, each lookup only reads one cache line of the filter (cf `BlockedBloomFilter`).
+        If `index_partition_size` is more than 0, the index and bloom filter of each SSTable are split into partitions
+        covering that many data blocks. Only a small top-level index then stays in memory, and partitions are read on
+        demand and cached in the block cache (cf `PartitionedIndex`).
+        If a `prefix_extractor` is given, SSTables also get a bloom filter of the prefixes of their keys, which lets
+        `scan_prefix` skip the SSTables that have no key with the scanned prefix.
+        If `scheduler_options` are given, memtables are flushed and levels are compacted by background threads, and
+        writes are slowed down or stopped when these threads lag behind (cf `BackgroundScheduler`). Otherwise, the
+        flushes and compactions are run by the threads that call `flush_next_immutable_memtable`.
+        The `durability` tells whether writes are synced to disk before returning (cf `Durability`): not at all (the
+        default), in batches of concurrent writes, or one by one.
+        If `max_subcompactions` is more than 1, the key range of each compaction is split into (up to) that many
+        subranges, which are merged in parallel by a pool of worker processes (cf `_split_key_range`).
+        If `multi_get_threads` is more than 1, the data blocks needed by a `multi_get` are read in parallel by a pool of
+        that many threads.
+        """
 
         configuration = Configuration(
             nb_levels=nb_levels,
@@ -72,10 +258,19 @@ class LsmStorage:
             max_l0_sstables=max_l0_sstables,
             max_sstable_size=max_sstable_size,
             block_size=block_size,
+            block_restart_interval=block_restart_interval,
+            compression_per_level=compression_per_level,
+            base_level_size=base_level_size,
+            dynamic_level_bytes=dynamic_level_bytes,
+            compaction_style=compaction_style,
+            bloom_bits_per_key_per_level=bloom_bits_per_key_per_level,
+            blocked_bloom_filters=blocked_bloom_filters,
+            index_partition_size=index_partition_size,
+            prefix_extractor=prefix_extractor,
         )
 
         state = LsmState(
-            memtable=MemTable.create(directory=directory),
+            memtable=MemTable.create(directory=directory, durability=durability),
             immutable_memtables=deque(),
             sstables_level0=deque(),
             sstables_levels=[deque() for _ in range(nb_levels)],
@@ -85,9 +280,28 @@ class LsmStorage:
             directory=directory,
             configuration=configuration,
             state=state,
-            manifest=Manifest.create(path=f"{directory}/manifest.txt", configuration=configuration)
+            manifest=Manifest.create(path=f"{directory}/manifest.txt", configuration=configuration),
+            block_cache=cls._create_block_cache(block_cache_size=block_cache_size),
+            descriptor_pool=cls._create_descriptor_pool(max_open_files=max_open_files),
+            use_mmap=use_mmap,
+            scheduler_options=scheduler_options,
+            durability=durability,
+            max_subcompactions=max_subcompactions,
+            multi_get_threads=multi_get_threads
         )
 
+    @staticmethod
+    def _create_block_cache(block_cache_size: int) -> Optional[BlockCache]:
+        if block_cache_size <= 0:
+            return None
+        return BlockCache(capacity=block_cache_size)
+
+    @staticmethod
+    def _create_descriptor_pool(max_open_files: int) -> Optional[FileDescriptorPool]:
+        if max_open_files <= 0:
+            return None
+        return FileDescriptorPool(capacity=max_open_files)
+
     def _try_freeze(self) -> None:
         """Checks if the memtable should be frozen or not.
         The memtable should be frozen if it is bigger than the `self._configuration.max_sstable_size` threshold.
@@ -139,200 +353,792 @@ class LsmStorage:
                     latest_approximate_size = self.state.memtable.approximate_size
                 if latest_approximate_size >= self._configuration.max_sstable_size:
                     self._freeze_memtable()
+                    if self.scheduler is not None:
+                        self.scheduler.schedule_flush()
 
     def _freeze_memtable(self) -> None:
         with self._locks.read_write.write():
-            new_memtable = MemTable.create(directory=self.directory)
+            new_memtable = MemTable.create(directory=self.directory, durability=self.durability)
             self.state.immutable_memtables.insert(0, self.state.memtable)
             self.state.memtable = new_memtable
 
     def put(self, key: Record.Key, value: Record.Value) -> None:
-        self.state.memtable.put(key=key, value=value)
+        if self.scheduler is not None:
+            self.scheduler.throttle_writes()
+        # The memtable cannot be frozen (and then flushed, which removes its WAL) while it is written to
+        with self._locks.read_write.read():
+            self.state.memtable.put(key=key, value=value)
+        self._try_freeze()
+
+    def delete(self, key: Record.Key) -> None:
+        """Deletes a key. A tombstone is written for it: it hides the values of the key in older memtables and SSTables
+        until it reaches the last level, where it is dropped along with these values."""
+        if self.scheduler is not None:
+            self.scheduler.throttle_writes()
+        with self._locks.read_write.read():
+            self.state.memtable.delete(key=key)
+        self._try_freeze()
+
+    def delete_range(self, lower: Record.Key, upper: Record.Key) -> None:
+        """Deletes all keys from `lower` (included) to `upper` (excluded).
+        A single range tombstone is written: it hides the records of the range in older memtables and SSTables (reads
+        skip them, and compactions drop them, without reading the data blocks that it covers entirely) until it reaches
+        the last level, where it is dropped.
+        """
+        if self.scheduler is not None:
+            self.scheduler.throttle_writes()
+        with self._locks.read_write.read():
+            self.state.memtable.delete_range(lower=lower, upper=upper)
+        self._try_freeze()
+
+    def write(self, batch: WriteBatch) -> None:
+        """Applies all the writes of a batch at once.
+        The batch is written to the WAL as a single entry (it is thus recovered entirely or not at all), and it is
+        applied to the memtable while holding the read lock of the state: the memtable cannot be frozen in the middle of
+        the batch, which always ends up in a single memtable.
+        """
+        if len(batch) == 0:
+            return
+
+        if self.scheduler is not None:
+            self.scheduler.throttle_writes()
+        with self._locks.read_write.read():
+            self.state.memtable.put_batch(records=batch.records)
         self._try_freeze()
 
+    def _snapshot(self) -> tuple[list[MemTable], list[SSTable], list[list[SSTable]]]:
+        """Copies the lists of immutable memtables and SSTables of the state, so that they can be iterated over while
+        flushes and compactions modify the state."""
+        with self._locks.read_write.read():
+            return (list(self.state.immutable_memtables),
+                    list(self.state.sstables_level0),
+                    [list(level) for level in self.state.sstables_levels])
+
     def get(self, key: Record.Key) -> Optional[Record.Value]:
-        value = self.state.memtable.get(key=key)
+        record = self._get_record(key=key)
+        if record is None or record.is_tombstone:
+            return None
+        return record.value
 
-        if value is not None:
-            return value
+    def _get_record(self, key: Record.Key) -> Optional[Record]:
+        """Returns the newest record of a key (which is a tombstone if the key was deleted)."""
+        record = self.state.memtable.get_record(key=key)
 
-        for memtable in self.state.immutable_memtables:
-            value = memtable.get(key=key)
-            if value is not None:
-                return value
+        if record is not None:
+            return record
 
-        for sstable in self.state.sstables_level0:
-            if not sstable.bloom_filter.may_contain(key=key):
-                continue
-            value = sstable.get(key=key)
-            if value is not None:
-                return value
+        immutable_memtables, sstables_level0, sstables_levels = self._snapshot()
+        for memtable in immutable_memtables:
+            record = memtable.get_record(key=key)
+            if record is not None:
+                return record
+
+        for sstable in sstables_level0:
+            record = self._get_record_from_sstable(sstable=sstable, key=key)
+            if record is not None:
+                return record
 
-        for level in self.state.sstables_levels:
+        for level in sstables_levels:
             for sstable in level:
                 if not sstable.first_key <= key <= sstable.last_key:
                     continue
+                record = self._get_record_from_sstable(sstable=sstable, key=key)
+                if record is not None:
+                    return record
+
+        return None
+
+    @staticmethod
+    def _get_record_from_sstable(sstable: SSTable, key: Record.Key) -> Optional[Record]:
+        """Returns the record of a key in an SSTable, or a tombstone if a range tombstone of the SSTable covers it.
+        The data blocks are only read if the bloom filter says that the key may be in the SSTable."""
+        if not sstable.bloom_filter.may_contain(key=key):
+            return sstable.get_range_tombstone(key=key)
+        return sstable.get_record(key=key)
+
+    def multi_get(self, keys: list[Record.Key]) -> list[Optional[Record.Value]]:
+        """Returns the values of several keys (None for the keys that are absent), in the order of `keys`.
+        This is equivalent to calling `get` for each key, but cheaper for large batches: the keys are sorted and looked
+        up layer by layer (each memtable, each L0 SSTable and each deeper level once per batch), and only the keys that
+        are not found yet go down to the next layer. Within a layer, the keys are grouped by the data block that may
+        contain them, so that each block is read and decoded once (cf `_multi_get_from_sstables`).
+        """
+        records = self._multi_get_records(keys=keys)
+        values = []
+        for key in keys:
+            record = records.get(key)
+            values.append(None if record is None or record.is_tombstone else record.value)
+        return values
+
+    def _multi_get_records(self, keys: list[Record.Key]) -> dict[Record.Key, Record]:
+        """Returns the newest record of each key that is in the store (which is a tombstone if the key was deleted)."""
+        records = {}
+        remaining_keys = sorted(set(keys))
+
+        memtables = [self.state.memtable]
+        immutable_memtables, sstables_level0, sstables_levels = self._snapshot()
+        for memtable in memtables + immutable_memtables:
+            not_found_keys = []
+            for key in remaining_keys:
+                record = memtable.get_record(key=key)
+                if record is not None:
+                    records[key] = record
+                else:
+                    not_found_keys.append(key)
+            remaining_keys = not_found_keys
+
+        # Each L0 SSTable is a layer on its own, whereas the SSTables of a deeper level are looked up all at once
+        for sstables in [[sstable] for sstable in sstables_level0] + [list(level) for level in sstables_levels]:
+            if len(remaining_keys) == 0:
+                break
+            found_records = self._multi_get_from_sstables(sstables=sstables, keys=remaining_keys)
+            records.update(found_records)
+            remaining_keys = [key for key in remaining_keys if key not in found_records]
+
+        return records
+
+    def _multi_get_from_sstables(self, sstables: list[SSTable], keys: list[Record.Key]) -> dict[Record.Key, Record]:
+        """Looks sorted keys up in SSTables ordered from the newest to the oldest (e.g. a level), and returns the
+        newest record of each key that is found (or a tombstone if a range tombstone covers it).
+        The keys that pass the key range and the bloom filter of an SSTable are grouped by the data block that may
+        contain them: all these blocks are then read at once (cf `_read_data_blocks`), each of them only once.
+        """
+        # Keys (sorted) within the key range of each SSTable
+        keys_per_sstable = [keys[bisect_left(keys, sstable.first_key):bisect_right(keys, sstable.last_key)]
+                            for sstable in sstables]
+
+        # Group the keys by (SSTable, block)
+        keys_per_block: dict[tuple[int, int], list[Record.Key]] = {}
+        for index, (sstable, sstable_keys) in enumerate(zip(sstables, keys_per_sstable)):
+            for key in sstable_keys:
                 if not sstable.bloom_filter.may_contain(key=key):
                     continue
-                value = sstable.get(key=key)
-                if value is not None:
-                    return value
+                block_id = sstable.find_block_id(key=key)
+                if block_id is not None:
+                    keys_per_block.setdefault((index, block_id), []).append(key)
 
-        return None
+        # Read the blocks, and look the keys up in them
+        blocks = self._read_data_blocks(sstables=sstables, block_handles=list(keys_per_block))
+        records_per_sstable: list[dict[Record.Key, Record]] = [{} for _ in sstables]
+        for (index, block_id), block_keys in keys_per_block.items():
+            block = blocks[(index, block_id)]
+            for key in block_keys:
+                record = block.get(key=key)
+                if record is not None:
+                    records_per_sstable[index][key] = record
+
+        # The newest SSTable that has a record (or a range tombstone) of a key wins
+        records = {}
+        for sstable, sstable_keys, sstable_records in zip(sstables, keys_per_sstable, records_per_sstable):
+            for key in sstable_keys:
+                if key in records:
+                    continue
+                record = sstable_records.get(key)
+                if record is None:
+                    record = sstable.get_range_tombstone(key=key)
+                if record is not None:
+                    records[key] = record
+        return records
+
+    def _read_data_blocks(self,
+                          sstables: list[SSTable],
+                          block_handles: list[tuple[int, int]]) -> dict[tuple[int, int], DataBlock]:
+        """Reads data blocks given by (index of their SSTable in `sstables`, block id) handles (sorted by block id for
+        each SSTable).
+        Consecutive blocks of an SSTable are read together (cf `SSTable.read_data_blocks`). If the store has a pool of
+        `multi_get_threads`, the runs of consecutive blocks are read in parallel.
+        """
+        block_ids_per_sstable: dict[int, list[int]] = {}
+        for index, block_id in block_handles:
+            block_ids_per_sstable.setdefault(index, []).append(block_id)
+        runs = [(index, run) for index, block_ids in block_ids_per_sstable.items()
+                for run in SSTable.group_consecutive_block_ids(block_ids=block_ids)]
+
+        def read_run(index_and_run: tuple[int, list[int]]) -> list[DataBlock]:
+            index, run = index_and_run
+            return sstables[index].read_data_blocks(block_ids=run)
+
+        if self._multi_get_pool is not None and len(runs) > 1:
+            blocks_per_run = list(self._multi_get_pool.map(read_run, runs))
+        else:
+            blocks_per_run = [read_run(index_and_run) for index_and_run in runs]
+
+        return {(index, block_id): block
+                for (index, run), blocks in zip(runs, blocks_per_run) for block_id, block in zip(run, blocks)}
 
     def scan(self, lower: Record.Key, upper: Record.Key) -> Iterator[Record]:
-        active_memtable_iterator = self.state.memtable.scan(lower=lower, upper=upper)
-        immutable_memtables_iterators = [memtable.scan(lower=lower, upper=upper) for memtable in
-                                         self.state.immutable_memtables]
-        sstables_iterators = [sstable.scan(lower=lower, upper=upper) for sstable in self.state.sstables_level0]
+        """Iterates over the records from `lower` to `upper` (both included) of all memtables and levels.
+        The SSTables of L1 and deeper levels are sorted and do not overlap within a sorted run (cf `_sorted_runs`):
+        each run is read by a single iterator, which only opens the SSTables that overlap the range, one after the
+        other. The scan thus merges one iterator per memtable, per L0 SSTable and per sorted run.
+        """
+        yield from self._scan(lower=lower, upper=upper)
+
+    def scan_prefix(self, prefix: Record.Key) -> Iterator[Record]:
+        """Iterates over the records whose key starts with `prefix` of all memtables and levels.
+        If the prefix is in the domain of the prefix extractor of the store (i.e. it is at least as long as the
+        extracted prefixes, cf `PrefixExtractor`), the SSTables whose prefix bloom filter rules out its extracted prefix
+        are not read (their range tombstones still hide the records of older SSTables).
+        """
+        if len(prefix) == 0:
+            raise ValueError("Cannot scan an empty prefix")
+
+        prefix_extractor = self._configuration.prefix_extractor
+        extracted_prefix = prefix_extractor.transform(prefix) \
+            if prefix_extractor is not None and prefix_extractor.in_domain(prefix) else None
+
+        # All the keys that start with the prefix are between the prefix and its successor (which is excluded)
+        upper = self._prefix_successor(prefix=prefix)
+        records = self._scan(lower=prefix, upper=upper, extracted_prefix=extracted_prefix)
+        yield from takewhile(lambda record: record.key.startswith(prefix), records)
+
+    @staticmethod
+    def _prefix_successor(prefix: Record.Key) -> Optional[Record.Key]:
+        """Returns the smallest key that is greater than all the keys that start with `prefix`, or None if there is
+        none (when the prefix is only made of the greatest character, U+10FFFF).
+        The greatest characters at the end of the prefix cannot be incremented: they are dropped, and the last of the
+        remaining characters is incremented (surrogates, which cannot be encoded in keys, are skipped).
+        """
+        stripped_prefix = prefix.rstrip(chr(sys.maxunicode))
+        if len(stripped_prefix) == 0:
+            return None
+        next_code_point = ord(stripped_prefix[-1]) + 1
+        if next_code_point == 0xD800:
+            next_code_point = 0xE000
+        return stripped_prefix[:-1] + chr(next_code_point)
+
+    def _scan(self,
+              lower: Record.Key,
+              upper: Optional[Record.Key],
+              extracted_prefix: Optional[Record.Key] = None) -> Iterator[Record]:
+        """Implements `scan` (there is no upper bound if `upper` is None). If an `extracted_prefix` is given, the
+        SSTables that have no key with this prefix (cf `SSTable.may_contain_prefix`) are not read, but their range
+        tombstones still apply."""
+        active_memtable = self.state.memtable
+        active_memtable_iterator = active_memtable.scan(lower=lower, upper=upper)
+        immutable_memtables, sstables_level0, sstables_levels = self._snapshot()
+        immutable_memtables_iterators = [memtable.scan(lower=lower, upper=upper) for memtable in immutable_memtables]
+        memtables = [active_memtable] + immutable_memtables
+        sorted_runs = [[sstable for sstable in sorted_run
+                        if (upper is None or sstable.first_key <= upper) and lower <= sstable.last_key]
+                       for level in sstables_levels for sorted_run in self._sorted_runs(sstables=level)]
+
+        # Records covered by the range tombstones of newer layers are skipped (whole data blocks are not even read)
+        range_tombstones = ([memtable.range_tombstones for memtable in memtables] +
+                            [sstable.range_tombstones for sstable in sstables_level0] +
+                            [RangeTombstones.union([sstable.range_tombstones for sstable in sorted_run])
+                             for sorted_run in sorted_runs])
+        shadowing_range_tombstones = RangeTombstones.shadowing(range_tombstones)[len(memtables):]
+        # The iterators of the SSTables that are not read stay empty (so that they still match their range tombstones)
+        sstables_iterators = [sstable.scan(lower=lower, upper=upper, shadowing_range_tombstones=shadowing)
+                              if extracted_prefix is None or sstable.may_contain_prefix(prefix=extracted_prefix)
+                              else iter([])
+                              for sstable, shadowing in zip(sstables_level0, shadowing_range_tombstones)]
+        if extracted_prefix is not None:
+            sorted_runs = [[sstable for sstable in sorted_run if sstable.may_contain_prefix(prefix=extracted_prefix)]
+                           for sorted_run in sorted_runs]
+        sorted_runs_iterators = [
+            self._scan_sorted_run(sstables=sorted_run, lower=lower, upper=upper, shadowing_range_tombstones=shadowing)
+            for sorted_run, shadowing in zip(sorted_runs, shadowing_range_tombstones[len(sstables_level0):])]
 
         iterator = MergingIterator(
-            iterators=[active_memtable_iterator] + immutable_memtables_iterators + sstables_iterators)
+            iterators=([active_memtable_iterator] + immutable_memtables_iterators + sstables_iterators +
+                       sorted_runs_iterators),
+            range_tombstones=range_tombstones)
         yield from iterator
 
+    @staticmethod
+    def _sorted_runs(sstables: list[SSTable]) -> list[list[SSTable]]:
+        """Splits the SSTables of a level (L1 or deeper) into sorted runs, i.e. sequences of SSTables that are sorted
+        and do not overlap.
+        Compactions keep the SSTables of a level sorted and non-overlapping (cf `_compact_into_next_level`), so a level
+        is a single sorted run; manifests written before leveled compactions may however still hold levels made of the
+        outputs of their latest compactions, from the newest to the oldest, which may overlap each other.
+        """
+        sorted_runs = []
+        for sstable in sstables:
+            if len(sorted_runs) and sorted_runs[-1][-1].last_key < sstable.first_key:
+                sorted_runs[-1].append(sstable)
+            else:
+                sorted_runs.append([sstable])
+        return sorted_runs
+
+    @staticmethod
+    def _scan_sorted_run(sstables: list[SSTable],
+                         shadowing_range_tombstones: RangeTombstones,
+                         lower: Optional[Record.Key] = None,
+                         upper: Optional[Record.Key] = None) -> ConcatenatingIterator:
+        # The SSTables are scanned lazily: each one is only opened once the previous ones are exhausted
+        return ConcatenatingIterator(iterators=(
+            sstable.scan(lower=lower, upper=upper, shadowing_range_tombstones=shadowing_range_tombstones)
+            for sstable in sstables
+        ))
+
     def _do_flush(self) -> None:
         # Read the oldest memtable
         with self._locks.read_write.read():
             memtable_to_flush = self.state.immutable_memtables[-1]
 
         # Flush it to SSTable
+        sstable = self._build_sstable_from_memtable(memtable=memtable_to_flush)
+
+        self._install_flushed_sstable(sstable=sstable)
+
+    def _build_sstable_from_memtable(self, memtable: MemTable) -> SSTable:
         path = self._compute_path()
-        sstable_builder = SSTableBuilder(sstable_size=self._configuration.max_sstable_size,
-                                         block_size=self._configuration.block_size)
-        memtable_iterator = MemTableIterator(memtable=memtable_to_flush)
+        sstable_builder = self._create_sstable_builder(level=0)
+        memtable_iterator = MemTableIterator(memtable=memtable)
         for record in memtable_iterator:
-            sstable_builder.add(key=record.key, value=record.value)
-        sstable = sstable_builder.build(path=path)
+            # The tombstones that replaced the records covered by a range tombstone are redundant with it
+            if record.is_tombstone and memtable.range_tombstones.covers(key=record.key):
+                continue
+            sstable_builder.add(key=record.key, value=record.value, is_tombstone=record.is_tombstone)
+        for range_tombstone in memtable.range_tombstones:
+            sstable_builder.add_range_tombstone(range_tombstone=range_tombstone)
+        return sstable_builder.build(path=path)
 
+    def _install_flushed_sstable(self, sstable: SSTable) -> None:
         # Update state to remove oldest memtable and add new SSTable
         with self._locks.read_write.write():
             flushed_memtable = self.state.immutable_memtables.pop()
             self.state.sstables_level0.insert(0, sstable)
 
         # Write to manifest
-        event = FlushEvent(sstable=sstable)
+        event = FlushEvent(sstable=sstable, wal_name=os.path.basename(flushed_memtable.wal.path))
         self.manifest.add_event(event=event)
 
         # Delete the WAL
         flushed_memtable.wal.remove_self()
 
     def flush_next_immutable_memtable(self) -> None:
-        with self._locks.state:
-            self._do_flush()
+        with self._locks.flush:
+            with self._locks.state:
+                self._do_flush()
 
         self._try_compact()
 
+    def _flush_in_background(self) -> None:
+        """Flushes the oldest immutable memtable.
+        Unlike `flush_next_immutable_memtable`, the SSTable is built without holding `self._locks.state`: memtables can
+        thus be frozen (i.e. writes can go on) while the flush is in progress.
+        """
+        with self._locks.flush:
+            with self._locks.read_write.read():
+                memtable_to_flush = self.state.immutable_memtables[-1]
+
+            sstable = self._build_sstable_from_memtable(memtable=memtable_to_flush)
+
+            with self._locks.state:
+                self._install_flushed_sstable(sstable=sstable)
+
+    def _create_sstable_builder(self, level: int) -> SSTableBuilder:
+        return SSTableBuilder(sstable_size=self._configuration.max_sstable_size,
+                              block_size=self._configuration.block_size,
+                              block_cache=self.block_cache,
+                              descriptor_pool=self.descriptor_pool,
+                              use_mmap=self.use_mmap,
+                              restart_interval=self._configuration.block_restart_interval,
+                              compression=self._configuration.compression_for_level(level=level),
+                              directory=self.directory,
+                              bloom_bits_per_key=self._configuration.bloom_bits_per_key_for_level(level=level),
+                              blocked_bloom_filter=self._configuration.blocked_bloom_filters,
+                              index_partition_size=self._configuration.index_partition_size,
+                              prefix_extractor=self._configuration.prefix_extractor)
+
     def _compute_path(self) -> str:
-        timestamp_in_us = int(time.time() * 1_000_000)
+        # Timestamps are made strictly increasing so that SSTables built at the same time by different threads do not
+        # get the same path
+        with self._locks.path:
+            timestamp_in_us = max(int(time.time() * 1_000_000), self._last_path_timestamp + 1)
+            self._last_path_timestamp = timestamp_in_us
         return f"{self.directory}/{timestamp_in_us}.sst"
 
     def _create_directory(self) -> None:
         if not os.path.exists(self.directory):
             os.makedirs(self.directory)
 
-    def _compact(self, records_iterator: BaseIterator) -> list[SSTable]:
+    def _compact(self,
+                 records_iterator: BaseIterator,
+                 output_level: int = 1,
+                 range_tombstones: Optional[RangeTombstones] = None) -> list[SSTable]:
+        """Writes the records to new SSTables of the output level (cf `_write_sstables`)."""
+        return self._write_sstables(records_iterator=records_iterator,
+                                    range_tombstones=range_tombstones,
+                                    create_sstable_builder=lambda: self._create_sstable_builder(level=output_level),
+                                    compute_path=self._compute_path,
+                                    max_sstable_size=self._configuration.max_sstable_size)
+
+    @staticmethod
+    def _write_sstables(records_iterator: Iterator[Record],
+                        range_tombstones: Optional[RangeTombstones],
+                        create_sstable_builder: Callable[[], SSTableBuilder],
+                        compute_path: Callable[[], str],
+                        max_sstable_size: int) -> list[SSTable]:
+        """Writes the records to new SSTables of at most (about) `max_sstable_size` bytes each.
+        The `range_tombstones` are split between the new SSTables, each of which gets the part of them that is within
+        its own key range (so that the SSTables of a level do not overlap).
+        """
+        range_tombstones = range_tombstones if range_tombstones is not None else RangeTombstones()
         new_ss_tables = []
-        sstable_builder = SSTableBuilder(sstable_size=self._configuration.max_sstable_size,
-                                         block_size=self._configuration.block_size)
+        sstable_builder = create_sstable_builder()
+        lower = None
 
         for record in records_iterator:
-            sstable_builder.add(key=record.key, value=record.value)
+            sstable_builder.add(key=record.key, value=record.value, is_tombstone=record.is_tombstone)
 
-            if sstable_builder.current_buffer_position >= self._configuration.max_sstable_size:
-                sstable = sstable_builder.build(path=self._compute_path())
+            if sstable_builder.current_buffer_position >= max_sstable_size:
+                # The smallest key greater than the last key of the SSTable: the next SSTable starts there
+                upper = record.key + "\x00"
+                for range_tombstone in range_tombstones.clip(lower=lower, upper=upper):
+                    sstable_builder.add_range_tombstone(range_tombstone=range_tombstone)
+                sstable = sstable_builder.build(path=compute_path())
                 new_ss_tables.append(sstable)
-                sstable_builder = SSTableBuilder(sstable_size=self._configuration.max_sstable_size,
-                                                 block_size=self._configuration.block_size)
+                sstable_builder = create_sstable_builder()
+                lower = upper
+
+        for range_tombstone in range_tombstones.clip(lower=lower):
+            sstable_builder.add_range_tombstone(range_tombstone=range_tombstone)
 
-        if sstable_builder.current_buffer_position > 0:
-            sstable = sstable_builder.build(path=self._compute_path())
+        # Records of the last block are only in the block builder (not in the buffer) until the SSTable is built
+        if sstable_builder.nb_keys > 0 or len(sstable_builder.range_tombstones) > 0:
+            sstable = sstable_builder.build(path=compute_path())
             new_ss_tables.append(sstable)
 
         return new_ss_tables
 
+    @staticmethod
+    def _merge_sorted_runs(sorted_runs: list[list[SSTable]],
+                           keep_tombstones: bool,
+                           lower: Optional[Record.Key] = None) -> MergingIterator:
+        """Merges the records of sorted runs (e.g. an L0 SSTable, or SSTables of a level) ordered from the newest to the
+        oldest, from `lower` (if given) onwards.
+        The records covered by the range tombstones of newer runs are dropped: the data blocks that these range
+        tombstones cover entirely are skipped without being read.
+        """
+        range_tombstones = [RangeTombstones.union([sstable.range_tombstones for sstable in sorted_run])
+                            for sorted_run in sorted_runs]
+        shadowing_range_tombstones = RangeTombstones.shadowing(range_tombstones)
+        return MergingIterator(iterators=[
+            LsmStorage._scan_sorted_run(sstables=sorted_run, shadowing_range_tombstones=shadowing, lower=lower)
+            for sorted_run, shadowing in zip(sorted_runs, shadowing_range_tombstones)
+        ], keep_tombstones=keep_tombstones, range_tombstones=range_tombstones)
+
     def force_compaction_l0(self) -> None:
+        """Compacts all SSTables of L0 into L1.
+        L0 SSTables may overlap each other: they are all merged at once, along with the SSTables of L1 that they
+        overlap (so that the SSTables of L1 keep not overlapping each other).
+        """
         with self._locks.read_write.read():
             sstables_to_compact = [sstable for sstable in self.state.sstables_level0]
-            l0_ss_table_iterator = MergingIterator(iterators=[
-                SSTableIterator(sstable=sstable) for sstable in sstables_to_compact
-            ])
+            if len(sstables_to_compact) == 0:
+                return
+            first_key = min(sstable.first_key for sstable in sstables_to_compact)
+            last_key = max(sstable.last_key for sstable in sstables_to_compact)
+            sstables_to_merge_with = self._find_overlapping_sstables(level=1, first_key=first_key, last_key=last_key)
+
+        if self._can_move(level=0, sstables=sstables_to_compact, sstables_to_merge_with=sstables_to_merge_with):
+            self._move_sstables(level=0, sstables=sstables_to_compact)
+            return
 
-        new_ss_tables = self._compact(records_iterator=l0_ss_table_iterator)
+        self._compact_into_next_level(level=0,
+                                      sorted_runs_to_compact=[[sstable] for sstable in sstables_to_compact],
+                                      sstables_to_merge_with=sstables_to_merge_with)
 
+    def force_compaction_l1_or_more_level(self, level: int) -> None:
+        """Compacts one SSTable of a level (L1 or deeper, but not the last one) into the next level.
+        The SSTable is picked by the compaction pointer of the level (cf `_pick_sstable_to_compact`), and it is only
+        merged with the SSTables of the next level that it overlaps: the cost of a compaction depends on the size of
+        the SSTables, not on the size of the levels.
+        """
+        if not 1 <= level < self._configuration.nb_levels:
+            raise ValueError(f"Level {level} cannot be compacted: only levels 1 to {self._configuration.nb_levels - 1} "
+                             f"have a next level.")
+
+        with self._locks.read_write.read():
+            if len(self.state.sstables_levels[level - 1]) == 0:
+                return
+            sstable_to_compact = self._pick_sstable_to_compact(level=level)
+            sstables_to_merge_with = self._find_overlapping_sstables(level=level + 1,
+                                                                     first_key=sstable_to_compact.first_key,
+                                                                     last_key=sstable_to_compact.last_key)
+
+        if self._can_move(level=level, sstables=[sstable_to_compact], sstables_to_merge_with=sstables_to_merge_with):
+            self._move_sstables(level=level, sstables=[sstable_to_compact])
+        else:
+            self._compact_into_next_level(level=level,
+                                          sorted_runs_to_compact=[[sstable_to_compact]],
+                                          sstables_to_merge_with=sstables_to_merge_with)
+        self._compaction_pointers[level] = sstable_to_compact.last_key
+        self.manifest.add_event(event=CompactionPointerEvent(level=level, key=sstable_to_compact.last_key))
+
+    def _can_move(self, level: int, sstables: list[SSTable], sstables_to_merge_with: list[SSTable]) -> bool:
+        """Tells whether SSTables to compact can be moved as they are to the next level (a "trivial move"), i.e.
+        whether merging them would not change their records: they must not overlap any SSTable of the next level, nor
+        each other (L0 SSTables may overlap each other).
+        SSTables are not moved between levels with different codecs or bloom filters (cf
+        `Configuration.compression_per_level` and `Configuration.bloom_bits_per_key_per_level`), and SSTables with
+        range tombstones are not moved to the last level, where range tombstones are dropped.
+        """
+        if len(sstables_to_merge_with):
+            return False
+        if self._configuration.compression_for_level(level=level) != \
+                self._configuration.compression_for_level(level=level + 1):
+            return False
+        if self._configuration.bloom_bits_per_key_for_level(level=level) != \
+                self._configuration.bloom_bits_per_key_for_level(level=level + 1):
+            return False
+        if level + 1 == self._configuration.nb_levels and any(len(sstable.range_tombstones) for sstable in sstables):
+            return False
+        sorted_sstables = sorted(sstables, key=lambda sstable: sstable.first_key)
+        return all(previous.last_key < sstable.first_key
+                   for previous, sstable in zip(sorted_sstables, sorted_sstables[1:]))
+
+    def _move_sstables(self, level: int, sstables: list[SSTable]) -> None:
+        """Moves SSTables from a level to the next one without rewriting them (cf `_can_move`): only the state and the
+        manifest are updated."""
+        sorted_sstables = sorted(sstables, key=lambda sstable: sstable.first_key)
         with self._locks.state:
             with self._locks.read_write.write():
-                self.state.sstables_levels[0].extendleft(reversed(new_ss_tables))
-                for sstable in sstables_to_compact:
-                    self.state.sstables_level0.remove(sstable)
+                moved_level = self.state.sstables_level0 if level == 0 else self.state.sstables_levels[level - 1]
+                for sstable in sorted_sstables:
+                    moved_level.remove(sstable)
+                insert_into_sorted_run(sorted_run=self.state.sstables_levels[level], sstables=sorted_sstables)
 
         # Write to manifest
-        event = CompactionEvent(input_sstables=sstables_to_compact, output_sstables=new_ss_tables, level=0)
-        self.manifest.add_event(event=event)
+        self.manifest.add_event(event=TrivialMoveEvent(sstables=sorted_sstables, level=level))
 
-    def force_compaction_l1_or_more_level(self, level: int) -> None:
-        level_index = level - 1
-        next_level_index = level
-        if self._configuration.nb_levels < level:
-            next_level_index = level - 1
+    def _pick_sstable_to_compact(self, level: int) -> SSTable:
+        """Picks the SSTable to compact in a level (L1 or deeper): the first one after the compaction pointer of the
+        level (i.e. after the last key compacted in this level), going back to the first SSTable after the last one.
+        Compactions thus go round the key space of the level, so that all its SSTables get compacted in turn.
+        """
+        sstables = self.state.sstables_levels[level - 1]
+        compaction_pointer = self._compaction_pointers.get(level)
+        if compaction_pointer is not None:
+            for sstable in sstables:
+                if sstable.first_key > compaction_pointer:
+                    return sstable
+        return sstables[0]
 
-        with self._locks.read_write.read():
-            sstables_to_compact = [sstable for sstable in self.state.sstables_levels[level_index]]
-            l0_ss_table_iterator = ConcatenatingIterator(iterators=[
-                SSTableIterator(sstable=sstable) for sstable in sstables_to_compact
-            ])
+    def _find_overlapping_sstables(self, level: int, first_key: Record.Key, last_key: Record.Key) -> list[SSTable]:
+        """Returns the SSTables of a level (L1 or deeper) that overlap the range from `first_key` to `last_key`."""
+        return [sstable for sstable in self.state.sstables_levels[level - 1]
+                if sstable.first_key <= last_key and first_key <= sstable.last_key]
+
+    def _compact_into_next_level(self,
+                                 level: int,
+                                 sorted_runs_to_compact: list[list[SSTable]],
+                                 sstables_to_merge_with: list[SSTable]) -> None:
+        """Merges SSTables of a level with the SSTables of the next level that they overlap, and replaces them all with
+        the merged SSTables in the next level."""
+        self._compact_sorted_runs(sorted_runs=sorted_runs_to_compact + [sstables_to_merge_with],
+                                  output_level=level + 1)
+
+    def _compact_sorted_runs(self, sorted_runs: list[list[SSTable]], output_level: int) -> None:
+        """Merges sorted runs (ordered from the newest to the oldest) and replaces them with the merged SSTables in
+        `output_level`, where they are kept sorted among the SSTables that are already there (which they must not
+        overlap).
+        When the output level is the last one, tombstones (including range tombstones) and the records they shadow (as
+        well as overwritten records) are dropped for good: there is no older record left for them to hide.
+        """
+        is_into_last_level = output_level == self._configuration.nb_levels
+        input_sstables = [sstable for sorted_run in sorted_runs for sstable in sorted_run]
 
-        new_ss_tables = self._compact(records_iterator=l0_ss_table_iterator)
+        range_tombstones = RangeTombstones() if is_into_last_level else \
+            RangeTombstones.union([sstable.range_tombstones for sstable in input_sstables])
+        key_ranges = self._split_key_range(sstables=input_sstables, nb_subranges=self.max_subcompactions)
+        if len(key_ranges) > 1:
+            new_ss_tables = self._run_subcompactions(sorted_runs=sorted_runs, key_ranges=key_ranges,
+                                                     output_level=output_level, range_tombstones=range_tombstones)
+        else:
+            records_iterator = self._merge_sorted_runs(sorted_runs=sorted_runs,
+                                                       keep_tombstones=not is_into_last_level)
+            new_ss_tables = self._compact(records_iterator=records_iterator, output_level=output_level,
+                                          range_tombstones=range_tombstones)
 
         with self._locks.state:
             with self._locks.read_write.write():
-                self.state.sstables_levels[next_level_index].extendleft(reversed(new_ss_tables))
-                for sstable in sstables_to_compact:
-                    self.state.sstables_levels[level_index].remove(sstable)
+                levels = [self.state.sstables_level0] + self.state.sstables_levels
+                for sstable in input_sstables:
+                    next(level for level in levels if sstable in level).remove(sstable)
+                insert_into_sorted_run(sorted_run=self.state.sstables_levels[output_level - 1],
+                                       sstables=new_ss_tables)
 
         # Write to manifest
-        event = CompactionEvent(input_sstables=sstables_to_compact, output_sstables=new_ss_tables, level=level)
+        event = CompactionEvent(input_sstables=input_sstables, output_sstables=new_ss_tables, level=output_level - 1)
         self.manifest.add_event(event=event)
 
+        self._close_files(sstables=input_sstables)
+
+    @staticmethod
+    def _split_key_range(sstables: list[SSTable],
+                         nb_subranges: int) -> list[tuple[Optional[Record.Key], Optional[Record.Key]]]:
+        """Splits the key space of SSTables into (up to) `nb_subranges` disjoint subranges from a lower key (included)
+        to an upper key (excluded), where None means unbounded.
+        The boundaries are first keys of data blocks, picked so that each subrange holds about as many data blocks of
+        the SSTables: the subranges thus hold about the same amount of data.
+        """
+        block_first_keys = sorted({meta_block.first_key for sstable in sstables for meta_block in sstable.meta_blocks})
+        nb_subranges = min(nb_subranges, len(block_first_keys))
+        if nb_subranges <= 1:
+            return [(None, None)]
+
+        boundaries = sorted({block_first_keys[len(block_first_keys) * index // nb_subranges]
+                             for index in range(1, nb_subranges)})
+        return list(zip([None] + boundaries, boundaries + [None]))
+
+    def _run_subcompactions(self,
+                            sorted_runs: list[list[SSTable]],
+                            key_ranges: list[tuple[Optional[Record.Key], Optional[Record.Key]]],
+                            output_level: int,
+                            range_tombstones: RangeTombstones) -> list[SSTable]:
+        """Merges the records of sorted runs (ordered from the newest to the oldest) into new SSTables of the output
+        level, with one subcompaction per key range, run in parallel by worker processes (so that encoding SSTables is
+        not serialized by the GIL).
+        The key ranges being disjoint and sorted, the SSTables written by the subcompactions are simply put one after
+        the other.
+        """
+        if self._subcompaction_pool is None:
+            # Worker processes are spawned (rather than forked) since the store may be running background threads
+            self._subcompaction_pool = ProcessPoolExecutor(max_workers=self.max_subcompactions,
+                                                           mp_context=multiprocessing.get_context("spawn"))
+
+        subcompactions = [Subcompaction(
+            sorted_runs_paths=[[sstable.file.path for sstable in sorted_run] for sorted_run in sorted_runs],
+            lower=lower,
+            upper=upper,
+            keep_tombstones=output_level != self._configuration.nb_levels,
+            range_tombstones=range_tombstones.clip(lower=lower, upper=upper),
+            path_prefix=self._compute_path()[:-len(".sst")],
+            max_sstable_size=self._configuration.max_sstable_size,
+            block_size=self._configuration.block_size,
+            block_restart_interval=self._configuration.block_restart_interval,
+            compression=self._configuration.compression_for_level(level=output_level),
+            bloom_bits_per_key=self._configuration.bloom_bits_per_key_for_level(level=output_level),
+            blocked_bloom_filter=self._configuration.blocked_bloom_filters,
+            index_partition_size=self._configuration.index_partition_size,
+            prefix_extractor=self._configuration.prefix_extractor,
+        ) for lower, upper in key_ranges]
+
+        paths = [path for subcompaction_paths in self._subcompaction_pool.map(run_subcompaction, subcompactions)
+                 for path in subcompaction_paths]
+        return [SSTable.build_from_path(path=path, block_cache=self.block_cache, descriptor_pool=self.descriptor_pool,
+                                        use_mmap=self.use_mmap)
+                for path in paths]
+
+    def _close_files(self, sstables: list[SSTable]) -> None:
+        """Releases the file descriptors (and the maps) kept open for SSTables that are no longer used."""
+        for sstable in sstables:
+            sstable.file.close()
+
     def _try_compact(self) -> None:
-        """Checks if a level should be compacted or not and compacts it if so.
+        """Runs the compactions that the compaction strategy of the store asks for, the most urgent first, until there
+        is none left (cf `CompactionStrategy`).
 
-        Compaction should be triggered:
-        - at level 0 if the number of SSTables at level 0 exceeds a given threshold
-          (`self._configuration.max_l0_sstables`)
-        - at any other level if the ratio of the number of SSTables at this level over the number of SSTables at the
-        next level exceeds a given threshold (`self._configuration.levels_ratio`).
+        A compaction fills the level it writes to, which may then need to be compacted too: compactions are thus
+        triggered in cascade here.
 
-        A compaction operation executed at a given level may trigger compaction at higher levels.
-        In other words, compaction operations are triggered in cascade here.
+        When the store has a background scheduler, the compactions are handed over to it instead.
         """
+        if self.scheduler is not None:
+            self.scheduler.schedule_compactions()
+            return
 
-        # Try to compact level 0
-        if len(self.state.sstables_level0) >= self._configuration.max_l0_sstables:
-            self.force_compaction_l0()
+        levels_to_compact = self._levels_to_compact()
+        while len(levels_to_compact):
+            self._force_compaction(level=levels_to_compact[0])
+            levels_to_compact = self._levels_to_compact()
 
-        # Try to compact other levels
-        for level_index in range(self._configuration.nb_levels - 1):
-            current_level = self.state.sstables_levels[level_index]
-            next_level = self.state.sstables_levels[level_index + 1]
-            if len(current_level) > 0 and len(current_level) >= self._configuration.levels_ratio * len(next_level):
-                self.force_compaction_l1_or_more_level(level=level_index + 1)
+    def _levels_to_compact(self) -> list[int]:
+        return self.compaction_strategy.levels_to_compact()
+
+    def _force_compaction(self, level: int) -> None:
+        self.compaction_strategy.compact(level=level)
 
     @classmethod
-    def reconstruct_from_manifest(cls, manifest_path: str) -> "LsmStorage":
+    def reconstruct_from_manifest(cls,
+                                  manifest_path: str,
+                                  block_cache_size: int = 8_388_608,
+                                  max_open_files: int = 1000,
+                                  use_mmap: bool = False,
+                                  scheduler_options: Optional[SchedulerOptions] = None,
+                                  durability: Durability = Durability.NONE,
+                                  nb_recovery_threads: int = 4,
+                                  max_subcompactions: int = 1,
+                                  multi_get_threads: int = 1) -> "LsmStorage":
+        """Opens an existing store.
+        The memtables that were not flushed before the store was closed (e.g. because the process crashed) are
+        recovered from their WAL files (`nb_recovery_threads` of them are replayed at once) and flushed before the
+        store is returned.
+        """
         manifest = Manifest.build(manifest_path)
         ss_tables_levels = manifest.reconstruct_sstables()
         directory = os.path.dirname(manifest_path)
+        recovered_memtables = cls._recover_memtables(directory=directory,
+                                                     flushed_wal_names=manifest.flushed_wal_names(),
+                                                     nb_threads=nb_recovery_threads)
+
+        block_cache = cls._create_block_cache(block_cache_size=block_cache_size)
+        descriptor_pool = cls._create_descriptor_pool(max_open_files=max_open_files)
+        file_class = MmapSSTableFile if use_mmap else SSTableFile
+        for level in ss_tables_levels:
+            for sstable in level:
+                sstable.block_cache = block_cache
+                sstable.file = file_class.open(path=sstable.file.path, descriptor_pool=descriptor_pool)
+                # Partitions of partitioned indexes are read through the same file and cached in the same cache
+                if isinstance(sstable.meta_blocks, PartitionedIndex):
+                    sstable.meta_blocks.file = sstable.file
+                    sstable.meta_blocks.block_cache = block_cache
 
         state = LsmState(
-            memtable=MemTable.create(directory=directory),
-            immutable_memtables=deque(),
+            memtable=MemTable.create(directory=directory, durability=durability),
+            immutable_memtables=recovered_memtables,
             sstables_level0=ss_tables_levels[0],
             sstables_levels=ss_tables_levels[1:]
         )
 
-        return cls(
+        store = cls(
             configuration=manifest.configuration,
             directory=directory,
             state=state,
-            manifest=manifest
+            manifest=manifest,
+            block_cache=block_cache,
+            descriptor_pool=descriptor_pool,
+            use_mmap=use_mmap,
+            scheduler_options=scheduler_options,
+            durability=durability,
+            max_subcompactions=max_subcompactions,
+            multi_get_threads=multi_get_threads
         )
+
+        if store.scheduler is not None:
+            store.scheduler.schedule_flush()
+        else:
+            while len(store.state.immutable_memtables):
+                store.flush_next_immutable_memtable()
+
+        return store
+
+    @staticmethod
+    def _recover_memtables(directory: str, flushed_wal_names: set[str], nb_threads: int) -> Deque[MemTable]:
+        """Replays the WAL files of the directory that were not flushed into immutable memtables (ordered from the
+        newest to the oldest, as in the state).
+        The WAL files of flushed memtables (which may remain if the process crashed right after a flush) and the empty
+        ones are deleted instead.
+        """
+        wal_paths = []
+        for wal_path in WriteAheadLog.list_paths(directory=directory):
+            if os.path.basename(wal_path) in flushed_wal_names or os.path.getsize(wal_path) == 0:
+                os.remove(wal_path)
+            else:
+                wal_paths.append(wal_path)
+
+        if len(wal_paths) == 0:
+            return deque()
+
+        # WAL files are independent from each other: they are read and decoded concurrently
+        with ThreadPoolExecutor(max_workers=max(min(nb_threads, len(wal_paths)), 1),
+                                thread_name_prefix="recovery") as executor:
+            memtables = list(executor.map(lambda path: MemTable.create_from_wal(wal_path=path), wal_paths))
+
+        return deque(reversed(memtables))
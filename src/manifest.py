@@ -1,9 +1,13 @@
 import os
 import struct
 from collections import deque
-from typing import Dict, Type, BinaryIO, Deque
+from typing import Dict, Type, BinaryIO, Deque, Optional
 
-from src.sstable import SSTable
+from src.bloom_filter import DEFAULT_BITS_PER_KEY
+from src.compaction import CompactionStyle
+from src.compression import Compression
+from src.prefix_extractor import PrefixExtractor
+from src.sstable import SSTable, insert_into_sorted_run
 
 
 class Event:
@@ -12,17 +16,25 @@ class Event:
 
 
 class FlushEvent(Event):
-    def __init__(self, sstable: SSTable):
+    """A memtable was flushed to an SSTable of L0.
+    The `wal_name` is the name of the WAL file of the flushed memtable (which is then obsolete): upon recovery, it tells
+    apart the WALs that still need to be replayed.
+    """
+
+    def __init__(self, sstable: SSTable, wal_name: Optional[str] = None):
         super().__init__()
         self.sstable = sstable
+        self.wal_name = wal_name
 
     def __eq__(self, other):
         if not isinstance(other, FlushEvent):
             return NotImplemented
-        return self.sstable == other.sstable
+        return self.sstable == other.sstable and self.wal_name == other.wal_name
 
 
 class CompactionEvent(Event):
+    """Records that the `input_sstables` were replaced with the `output_sstables`, which were written to `level + 1`."""
+
     def __init__(self, input_sstables: list[SSTable], output_sstables: list[SSTable], level: int):
         super().__init__()
         self.input_sstables = input_sstables
@@ -37,6 +49,36 @@ class CompactionEvent(Event):
                 and self.level == other.level)
 
 
+class TrivialMoveEvent(Event):
+    """Records that the `sstables` were moved from `level` to `level + 1` as they were (without being rewritten)."""
+
+    def __init__(self, sstables: list[SSTable], level: int):
+        super().__init__()
+        self.sstables = sstables
+        self.level = level
+
+    def __eq__(self, other):
+        if not isinstance(other, TrivialMoveEvent):
+            return NotImplemented
+        return self.sstables == other.sstables and self.level == other.level
+
+
+class CompactionPointerEvent(Event):
+    """Records the compaction pointer of a level (L1 or deeper), i.e. the last key of the SSTable of this level that was
+    last compacted: the round-robin picking of the SSTables to compact resumes from it when the store is reopened (cf
+    `LsmStorage._pick_sstable_to_compact`).
+    """
+
+    def __init__(self, level: int, key: str):
+        super().__init__()
+        self.level = level
+        self.key = key
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactionPointerEvent):
+            return NotImplemented
+        return self.level == other.level and self.key == other.key
+
 
 class Configuration:
     def __init__(
@@ -45,13 +87,56 @@ class Configuration:
             levels_ratio: float,
             max_l0_sstables: int,
             max_sstable_size: int,
-            block_size: int
+            block_size: int,
+            block_restart_interval: int = 16,
+            compression_per_level: Optional[list[Compression]] = None,
+            base_level_size: int = 268_435_456,
+            dynamic_level_bytes: bool = False,
+            compaction_style: CompactionStyle = CompactionStyle.LEVELED,
+            bloom_bits_per_key_per_level: Optional[list[float]] = None,
+            blocked_bloom_filters: bool = False,
+            index_partition_size: int = 0,
+            prefix_extractor: Optional[PrefixExtractor] = None
     ):
         self.nb_levels = nb_levels
+        # Ratio of the target size of a level over the target size of the next one (e.g. 0.1: each level is 10 times
+        # bigger than the previous one)
         self.levels_ratio = levels_ratio
         self.max_l0_sstables = max_l0_sstables
         self.max_sstable_size = max_sstable_size
         self.block_size = block_size
+        # Number of entries between two restart points of data blocks (1 disables the prefix compression of keys)
+        self.block_restart_interval = block_restart_interval
+        # Codec of the data blocks of each level (index 0 is L0). Levels beyond the end of the list use its last codec.
+        self.compression_per_level = compression_per_level if compression_per_level is not None else []
+        # Target size (in bytes) of L1, from which the targets of the deeper levels derive (cf `levels_ratio`)
+        self.base_level_size = base_level_size
+        # If set, the targets derive from the actual size of the last level instead (cf
+        # `LeveledCompactionStrategy.level_targets`)
+        self.dynamic_level_bytes = dynamic_level_bytes
+        self.compaction_style = compaction_style
+        # Bits per key of the bloom filters of each level (index 0 is L0). Levels beyond the end of the list use its
+        # last value, and 0 disables bloom filters: e.g. [14, 10, 0] spends less memory on the deeper levels and none
+        # on L2 (where most lookups of existing keys end)
+        self.bloom_bits_per_key_per_level = \
+            bloom_bits_per_key_per_level if bloom_bits_per_key_per_level is not None else []
+        # If set, bloom filters are blocked (cf `BlockedBloomFilter`)
+        self.blocked_bloom_filters = blocked_bloom_filters
+        # Number of data blocks per partition of the index of SSTables (0 disables partitioned indexes, cf
+        # `PartitionedIndex`)
+        self.index_partition_size = index_partition_size
+        # If set, SSTables get a bloom filter of the prefixes of their keys (cf `LsmStorage.scan_prefix`)
+        self.prefix_extractor = prefix_extractor
+
+    def compression_for_level(self, level: int) -> Compression:
+        if len(self.compression_per_level) == 0:
+            return Compression.NONE
+        return self.compression_per_level[min(level, len(self.compression_per_level) - 1)]
+
+    def bloom_bits_per_key_for_level(self, level: int) -> float:
+        if len(self.bloom_bits_per_key_per_level) == 0:
+            return DEFAULT_BITS_PER_KEY
+        return self.bloom_bits_per_key_per_level[min(level, len(self.bloom_bits_per_key_per_level) - 1)]
 
     def __eq__(self, other):
         if not isinstance(other, Configuration):
@@ -61,11 +146,42 @@ class Configuration:
                 self.levels_ratio == other.levels_ratio and
                 self.max_l0_sstables == other.max_l0_sstables and
                 self.max_sstable_size == other.max_sstable_size and
-                self.block_size == other.block_size
+                self.block_size == other.block_size and
+                self.block_restart_interval == other.block_restart_interval and
+                self.compression_per_level == other.compression_per_level and
+                self.base_level_size == other.base_level_size and
+                self.dynamic_level_bytes == other.dynamic_level_bytes and
+                self.compaction_style == other.compaction_style and
+                self.bloom_bits_per_key_per_level == other.bloom_bits_per_key_per_level and
+                self.blocked_bloom_filters == other.blocked_bloom_filters and
+                self.index_partition_size == other.index_partition_size and
+                self.prefix_extractor == other.prefix_extractor
         )
 
 
+HEADER_VERSION_LEGACY = 1
+HEADER_VERSION_CONFIGURATION = 2
+HEADER_VERSION = HEADER_VERSION_CONFIGURATION  # Version of the headers written
+HEADER_MAGIC = b'PBM\xdb'
+
+
 class ManifestHeader:
+    """The header of the manifest holds the configuration of the store.
+
+    Since version 2, the header starts with a magic (which, read as a signed int, is negative: it cannot be mistaken
+    for the number of levels that legacy headers start with) and the version of its layout:
+    -------------------------------------------------------------------------------------------------------------
+    |                                                  Header                                                   |
+    -------------------------------------------------------------------------------------------------------------
+    | Magic (4B) | Version (1B) | nb_levels (4B) | levels_ratio (8B) | max_l0 (4B) | max_sstable_size (4B) | ...  |
+    -------------------------------------------------------------------------------------------------------------
+    where `...` stands for the other fields of the configuration (cf `to_bytes`).
+
+    Legacy headers (version 1) have neither magic nor version, and only hold the first five fields of the
+    configuration (nb_levels, levels_ratio, max_l0, max_sstable_size and block_size): the other ones get their
+    default value when decoded.
+    """
+
     def __init__(self, configuration: Configuration):
         self.configuration = configuration
 
@@ -79,33 +195,93 @@ class ManifestHeader:
         return len(self.to_bytes())
 
     def to_bytes(self) -> bytes:
+        encoded_version = HEADER_MAGIC + struct.pack("B", HEADER_VERSION)
         encoded_nb_levels = struct.pack("i", self.configuration.nb_levels)
         encoded_levels_ratio = struct.pack("d", self.configuration.levels_ratio)
         encoded_max_l0_sstables = struct.pack("i", self.configuration.max_l0_sstables)
         encoded_max_sstable_size = struct.pack("i", self.configuration.max_sstable_size)
         encoded_block_size = struct.pack("i", self.configuration.block_size)
+        encoded_block_restart_interval = struct.pack("i", self.configuration.block_restart_interval)
+        compression_per_level = self.configuration.compression_per_level
+        encoded_compression_per_level = (struct.pack("B", len(compression_per_level)) +
+                                         struct.pack("B" * len(compression_per_level), *compression_per_level))
+        encoded_base_level_size = struct.pack("q", self.configuration.base_level_size)
+        encoded_dynamic_level_bytes = struct.pack("?", self.configuration.dynamic_level_bytes)
+        encoded_compaction_style = struct.pack("B", self.configuration.compaction_style)
+        bloom_bits_per_key_per_level = self.configuration.bloom_bits_per_key_per_level
+        encoded_bloom_bits_per_key_per_level = (struct.pack("B", len(bloom_bits_per_key_per_level)) +
+                                                struct.pack("d" * len(bloom_bits_per_key_per_level),
+                                                            *bloom_bits_per_key_per_level))
+        encoded_blocked_bloom_filters = struct.pack("?", self.configuration.blocked_bloom_filters)
+        encoded_index_partition_size = struct.pack("i", self.configuration.index_partition_size)
+        encoded_prefix_extractor = PrefixExtractor.encode(prefix_extractor=self.configuration.prefix_extractor)
 
         return (
+                encoded_version +
                 encoded_nb_levels +
                 encoded_levels_ratio +
                 encoded_max_l0_sstables +
                 encoded_max_sstable_size +
-                encoded_block_size)
+                encoded_block_size +
+                encoded_block_restart_interval +
+                encoded_compression_per_level +
+                encoded_base_level_size +
+                encoded_dynamic_level_bytes +
+                encoded_compaction_style +
+                encoded_bloom_bits_per_key_per_level +
+                encoded_blocked_bloom_filters +
+                encoded_index_partition_size +
+                encoded_prefix_extractor)
 
     @classmethod
     def from_bytes(cls, data: bytes) -> "ManifestHeader":
-        decoded_nb_levels = struct.unpack("i", data[:4])[0]
-        decoded_levels_ratio = struct.unpack("d", data[4:12])[0]
-        decoded_max_l0_sstables = struct.unpack("i", data[12:16])[0]
-        decoded_max_sstable_size = struct.unpack("i", data[16:20])[0]
-        decoded_block_size = struct.unpack("i", data[20:24])[0]
+        header, _ = cls._from_bytes(data=data)
+        return header
 
-        configuration = Configuration(nb_levels=decoded_nb_levels, levels_ratio=decoded_levels_ratio,
-                                      max_l0_sstables=decoded_max_l0_sstables,
-                                      max_sstable_size=decoded_max_sstable_size,
-                                      block_size=decoded_block_size)
-
-        return cls(configuration=configuration)
+    @classmethod
+    def _from_bytes(cls, data: bytes) -> tuple["ManifestHeader", int]:
+        """Decodes the header at the start of `data`, and returns it along with the offset of its end (i.e. where the
+        events of the manifest start)."""
+        if data[:len(HEADER_MAGIC)] == HEADER_MAGIC:
+            version = struct.unpack("B", data[len(HEADER_MAGIC):len(HEADER_MAGIC) + 1])[0]
+            offset = len(HEADER_MAGIC) + 1
+        else:
+            version = HEADER_VERSION_LEGACY
+            offset = 0
+        if version > HEADER_VERSION:
+            raise ValueError(f"Unsupported version of manifest header: {version}")
+
+        nb_levels, levels_ratio, max_l0_sstables, max_sstable_size, block_size = \
+            struct.unpack("=idiii", data[offset:offset + 24])
+        offset += 24
+        configuration = Configuration(nb_levels=nb_levels, levels_ratio=levels_ratio,
+                                      max_l0_sstables=max_l0_sstables, max_sstable_size=max_sstable_size,
+                                      block_size=block_size)
+        if version == HEADER_VERSION_LEGACY:
+            return cls(configuration=configuration), offset
+
+        configuration.block_restart_interval = struct.unpack("i", data[offset:offset + 4])[0]
+        nb_compressions = struct.unpack("B", data[offset + 4:offset + 5])[0]
+        offset += 5
+        configuration.compression_per_level = [Compression(compression) for compression in
+                                               struct.unpack("B" * nb_compressions,
+                                                             data[offset:offset + nb_compressions])]
+        offset += nb_compressions
+        configuration.base_level_size = struct.unpack("q", data[offset:offset + 8])[0]
+        configuration.dynamic_level_bytes = struct.unpack("?", data[offset + 8:offset + 9])[0]
+        configuration.compaction_style = CompactionStyle(struct.unpack("B", data[offset + 9:offset + 10])[0])
+        nb_bloom_bits_per_key = struct.unpack("B", data[offset + 10:offset + 11])[0]
+        offset += 11
+        bloom_bits_per_key_size = 8 * nb_bloom_bits_per_key
+        configuration.bloom_bits_per_key_per_level = list(struct.unpack("d" * nb_bloom_bits_per_key,
+                                                                        data[offset:offset + bloom_bits_per_key_size]))
+        offset += bloom_bits_per_key_size
+        configuration.blocked_bloom_filters = struct.unpack("?", data[offset:offset + 1])[0]
+        configuration.index_partition_size = struct.unpack("i", data[offset + 1:offset + 5])[0]
+        configuration.prefix_extractor = PrefixExtractor.decode(data=data[offset + 5:offset + 9])
+        offset += 9
+
+        return cls(configuration=configuration), offset
 
 
 class ManifestFile:
@@ -158,8 +334,7 @@ class ManifestFile:
             data = f.read()
 
         # Decode header
-        header = ManifestHeader.from_bytes(data=data)
-        checkpoint = header.size
+        header, checkpoint = ManifestHeader._from_bytes(data=data)
 
         # Decode events
         events = self.decode_events(data=data[checkpoint:])
@@ -202,6 +377,14 @@ class Manifest:
 
         return cls(events=events, configuration=header.configuration, file=file)
 
+    def flushed_wal_names(self) -> set[str]:
+        """Returns the names of the WAL files whose memtables were flushed."""
+        return {event.wal_name for event in self.events if isinstance(event, FlushEvent) and event.wal_name is not None}
+
+    def compaction_pointers(self) -> dict[int, str]:
+        """Returns the last compaction pointer recorded for each level (levels without any are left out)."""
+        return {event.level: event.key for event in self.events if isinstance(event, CompactionPointerEvent)}
+
     def reconstruct_sstables(self) -> list[Deque[SSTable]]:
         ss_tables_levels = [deque() for _ in range(self.configuration.nb_levels + 1)]
 
@@ -210,17 +393,24 @@ class Manifest:
                 ss_tables_levels[0].insert(0, event.sstable)
             if isinstance(event, CompactionEvent):
                 level = event.level
-                for sstable in event.output_sstables:
-                    ss_tables_levels[level + 1].insert(0, sstable)
                 for sstable in event.input_sstables:
-                    ss_tables_levels[level].remove(sstable)
+                    # Input SSTables usually come from the compacted level or from the next one, but a universal
+                    # compaction may merge sorted runs of any levels above its output
+                    next(sstables for sstables in ss_tables_levels if sstable in sstables).remove(sstable)
+                insert_into_sorted_run(sorted_run=ss_tables_levels[level + 1], sstables=event.output_sstables)
+            if isinstance(event, TrivialMoveEvent):
+                for sstable in event.sstables:
+                    ss_tables_levels[event.level].remove(sstable)
+                insert_into_sorted_run(sorted_run=ss_tables_levels[event.level + 1], sstables=event.sstables)
 
         return ss_tables_levels
 
 
 class ManifestRecord:
-    category_encoding: Dict[Type[Event], int] = {FlushEvent: 0, CompactionEvent: 1}
-    category_decoding = {0: 'ManifestFlushRecord', 1: 'ManifestCompactionRecord'}
+    category_encoding: Dict[Type[Event], int] = {FlushEvent: 0, CompactionEvent: 1, TrivialMoveEvent: 2,
+                                                 CompactionPointerEvent: 3}
+    category_decoding = {0: 'ManifestFlushRecord', 1: 'ManifestCompactionRecord', 2: 'ManifestTrivialMoveRecord',
+                         3: 'ManifestCompactionPointerRecord'}
 
     def __init__(self, event: Event):
         self.event = event
@@ -267,11 +457,13 @@ class ManifestFlushRecord(ManifestRecord):
     """This class handles encoding and decoding of ManifestFlushRecords.
 
     Each ManifestFlushRecord has the following format:
-    +--------+-----------------------+-----------------------------+
-    | FLUSH  | manifest_sstable_size |       ManifestSSTable       | # TODO: ADD TIMESTAMP ???
-    +--------+-----------------------+-----------------------------+
-    | 1 byte |        1 byte         | manifest_sstable_size bytes |
-    +--------+-----------------------+-----------------------------+
+    +--------+-------------+-----------------+-----------------+
+    | FLUSH  | record_size | ManifestSSTable |    WAL name     |
+    +--------+-------------+-----------------+-----------------+
+    | 1 byte |   1 byte    | (variable size) | (variable size) |
+    +--------+-------------+-----------------+-----------------+
+    The WAL name takes the rest of the record: it is empty in the records written before it was added (and for flushes
+    whose WAL is unknown).
     """
 
     def __init__(self, event: FlushEvent):
@@ -281,15 +473,17 @@ class ManifestFlushRecord(ManifestRecord):
     def to_bytes(self):
         manifest_ss_table = ManifestSSTable(sstable=self.event.sstable)
         encoded_manifest_sstable = manifest_ss_table.to_bytes()
-        encoded_size = struct.pack("B", len(encoded_manifest_sstable))
+        encoded_wal_name = (self.event.wal_name or "").encode(encoding="utf-8")
+        encoded_size = struct.pack("B", len(encoded_manifest_sstable) + len(encoded_wal_name))
 
-        return encoded_size + encoded_manifest_sstable
+        return encoded_size + encoded_manifest_sstable + encoded_wal_name
 
     @classmethod
     def from_bytes(cls, data: bytes) -> "ManifestFlushRecord":
         size = struct.unpack("B", data[0:1])[0]
-        sstable = ManifestSSTable.from_bytes(data=data[1:1 + size]).sstable
-        event = FlushEvent(sstable=sstable)
+        manifest_sstable = ManifestSSTable.from_bytes(data=data[1:1 + size])
+        wal_name = data[1 + manifest_sstable.size:1 + size].decode("utf-8") or None
+        event = FlushEvent(sstable=manifest_sstable.sstable, wal_name=wal_name)
 
         return cls(event=event)
 
@@ -419,3 +613,73 @@ class ManifestCompactionRecord(ManifestRecord):
     @staticmethod
     def encode_manifest_sstables_block(sstables: list[SSTable]) -> bytes:
         return b''.join([ManifestSSTable(sstable).to_bytes() for sstable in sstables])
+
+
+class ManifestTrivialMoveRecord(ManifestRecord):
+    """This class handles encoding and decoding of ManifestTrivialMoveRecords.
+
+    Each ManifestTrivialMoveRecord has the following format:
+    +----------+---------------------+-----------------------+
+    | Category |        Extra        |    Moved SSTables     |
+    +----------+---------------------+-----------------------+
+    |   MOVE   | level | SSTs_size   | SST_1 | ... | SST_n   |
+    +----------+---------------------+-----------------------+
+    (SST_k = moved SSTable k - encoded as ManifestSSTable)
+
+    With the Extra section having the following format:
+    +--------+-----------+
+    | level  | SSTs_size |
+    +--------+-----------+
+    | 1 byte |  2 bytes  |
+    +--------+-----------+
+    """
+
+    def __init__(self, event: TrivialMoveEvent):
+        super().__init__(event)
+        self.event = event
+
+    def to_bytes(self) -> bytes:
+        encoded_level = struct.pack("B", self.event.level)
+        encoded_sstables = ManifestSSTablesBlock(sstables=self.event.sstables).to_bytes()
+        encoded_size_sstables = struct.pack("H", len(encoded_sstables))
+
+        return encoded_level + encoded_size_sstables + encoded_sstables
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ManifestTrivialMoveRecord":
+        level = struct.unpack("B", data[0:1])[0]
+        size_sstables = struct.unpack("H", data[1:3])[0]
+        decoded_sstables = ManifestSSTablesBlock.from_bytes(data=data[3:3 + size_sstables]).sstables
+
+        return cls(event=TrivialMoveEvent(sstables=decoded_sstables, level=level))
+
+
+class ManifestCompactionPointerRecord(ManifestRecord):
+    """This class handles encoding and decoding of ManifestCompactionPointerRecords.
+
+    Each ManifestCompactionPointerRecord has the following format:
+    +----------+--------+----------+----------------+
+    | Category | level  | key_size |      key       |
+    +----------+--------+----------+----------------+
+    | POINTER  | 1 byte | 2 bytes  | key_size bytes |
+    +----------+--------+----------+----------------+
+    """
+
+    def __init__(self, event: CompactionPointerEvent):
+        super().__init__(event)
+        self.event = event
+
+    def to_bytes(self) -> bytes:
+        encoded_level = struct.pack("B", self.event.level)
+        encoded_key = self.event.key.encode(encoding="utf-8")
+        encoded_key_size = struct.pack("H", len(encoded_key))
+
+        return encoded_level + encoded_key_size + encoded_key
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ManifestCompactionPointerRecord":
+        level = struct.unpack("B", data[0:1])[0]
+        key_size = struct.unpack("H", data[1:3])[0]
+        key = data[3:3 + key_size].decode("utf-8")
+
+        return cls(event=CompactionPointerEvent(level=level, key=key))
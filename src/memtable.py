@@ -3,26 +3,33 @@ import time
 from typing import Optional
 
 from src.iterators import MemTableIterator
+from src.range_tombstones import RangeTombstone, RangeTombstones
 from src.record import Record
 from src.red_black_tree import RedBlackTree
-from src.wal import WriteAheadLog
+from src.wal import WriteAheadLog, Durability
 
 
 class MemTable:
-    def __init__(self, map: RedBlackTree, approximate_size: int, directory: str, wal: WriteAheadLog):
+    def __init__(self,
+                 map: RedBlackTree,
+                 approximate_size: int,
+                 directory: str,
+                 wal: WriteAheadLog,
+                 range_tombstones: Optional[RangeTombstones] = None):
         self.map = map
         self.approximate_size: int = approximate_size
         self.directory = directory
         self.wal = wal
+        self.range_tombstones = range_tombstones if range_tombstones is not None else RangeTombstones()
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, MemTable):
             return NotImplemented
-        return self.map == other.map
+        return self.map == other.map and self.range_tombstones == other.range_tombstones
 
     @classmethod
-    def create(cls, directory: str):
-        wal = cls._create_wal(directory=directory)
+    def create(cls, directory: str, durability: Durability = Durability.NONE):
+        wal = cls._create_wal(directory=directory, durability=durability)
         return cls(map=RedBlackTree(), directory=directory, approximate_size=0, wal=wal)
 
     @classmethod
@@ -44,25 +51,30 @@ class MemTable:
         wal = WriteAheadLog.open(path=wal_path)
         records = wal.read_records()
 
-        red_black_tree = RedBlackTree()
-        approximate_size = 0
+        memtable = cls(directory=directory, approximate_size=0, map=RedBlackTree(), wal=wal)
         for record in records:
-            red_black_tree.insert(key=record.key, data=record.to_bytes())
-            approximate_size += record.size
+            if isinstance(record, RangeTombstone):
+                memtable._apply_range_tombstone(range_tombstone=record)
+            else:
+                memtable.map.insert(key=record.key, data=record.to_bytes())
+            memtable.approximate_size += record.size
 
-        return cls(directory=directory, approximate_size=approximate_size, map=red_black_tree, wal=wal)
+        return memtable
 
     @staticmethod
-    def _create_wal(directory) -> WriteAheadLog:
+    def _create_wal(directory, durability: Durability = Durability.NONE) -> WriteAheadLog:
         timestamp_in_us = time.time()
 
-        return WriteAheadLog.create(path=f"{directory}/{timestamp_in_us}.wal")
+        return WriteAheadLog.create(path=f"{directory}/{timestamp_in_us}{WriteAheadLog.EXTENSION}",
+                                    durability=durability)
 
-    def scan(self, lower: Record.Key, upper: Record.Key) -> MemTableIterator:
+    def scan(self, lower: Record.Key, upper: Optional[Record.Key]) -> MemTableIterator:
         return MemTableIterator(memtable=self, start_key=lower, end_key=upper)
 
     def put(self, key: Record.Key, value: Record.Value):
-        record = Record(key=key, value=value)
+        self._put_record(record=Record(key=key, value=value))
+
+    def _put_record(self, record: Record) -> None:
         self.wal.insert(record=record)
         self.map.insert(key=record.key, data=record.to_bytes())
         # Recomputing the approximate size of the mem table by adding the size of the record
@@ -71,9 +83,49 @@ class MemTable:
         # choice is to compute the _approximate size_.
         self.approximate_size += record.size
 
-    def get(self, key: Record.Key) -> Optional[Record.Value]:
+    def put_batch(self, records: list[Record]) -> None:
+        """Puts several records, which are written to the WAL as a single entry (i.e. they are recovered atomically)."""
+        self.wal.insert_batch(records=records)
+        for record in records:
+            self.map.insert(key=record.key, data=record.to_bytes())
+            self.approximate_size += record.size
+
+    def delete(self, key: Record.Key) -> None:
+        """Deletes a key by putting a tombstone for it (which shadows the values of the key in older layers)."""
+        self._put_record(record=Record.tombstone(key=key))
+
+    def delete_range(self, lower: Record.Key, upper: Record.Key) -> None:
+        """Deletes all keys from `lower` (included) to `upper` (excluded) with a single range tombstone."""
+        range_tombstone = RangeTombstone(start=lower, end=upper)
+        self.wal.insert_range_tombstone(range_tombstone=range_tombstone)
+        self._apply_range_tombstone(range_tombstone=range_tombstone)
+        self.approximate_size += range_tombstone.size
+
+    def _apply_range_tombstone(self, range_tombstone: RangeTombstone) -> None:
+        """Adds a range tombstone to the memtable.
+        Range tombstones only hide the records of older layers: the records of the memtable that it covers are replaced
+        by tombstones (they are not written to the WAL since replaying the range tombstone replaces them again). These
+        tombstones are not flushed (the range tombstone covers them) and records put later in the range are visible.
+        """
+        self.range_tombstones.add(range_tombstone=range_tombstone)
+        covered_keys = [Record.from_bytes(encoded_record).key
+                        for encoded_record in self.map.scan(lower=range_tombstone.start, upper=range_tombstone.end)]
+        for key in covered_keys:
+            if range_tombstone.covers(key=key):
+                self.map.insert(key=key, data=Record.tombstone(key=key).to_bytes())
+
+    def get_record(self, key: Record.Key) -> Optional[Record]:
+        """Returns the record of a key, which may be a tombstone (including when the key is covered by a range
+        tombstone of the memtable)."""
         encoded_record = self.map.get(key=key)
         if encoded_record is None:
+            if self.range_tombstones.covers(key=key):
+                return Record.tombstone(key=key)
+            return None
+        return Record.from_bytes(encoded_record)
+
+    def get(self, key: Record.Key) -> Optional[Record.Value]:
+        decoded_record = self.get_record(key=key)
+        if decoded_record is None or decoded_record.is_tombstone:
             return None
-        decoded_record = Record.from_bytes(encoded_record)
         return decoded_record.value
@@ -0,0 +1,46 @@
+import struct
+from typing import Optional
+
+from src.record import Record
+
+
+class PrefixExtractor:
+    """This class extracts the prefix of keys, so that SSTables can have a bloom filter of the prefixes of their keys
+    (cf `SSTableBuilder`) and scans of all the keys with a given prefix can skip the SSTables that have none (cf
+    `LsmStorage.scan_prefix`).
+
+    The prefix of a key is made of its first `length` characters: e.g. with a length of 9, the prefix of
+    "tenant01/entity42" is "tenant01/". Keys that are shorter than `length` have no prefix (they are not in the domain
+    of the extractor).
+    Since all the keys that start with a prefix of at least `length` characters share the same extracted prefix, prefix
+    bloom filters can rule out such prefixes (and only these).
+    """
+
+    def __init__(self, length: int):
+        if length <= 0:
+            raise ValueError(f"The length of prefixes must be positive (got {length})")
+        self.length = length
+
+    def __eq__(self, other):
+        if not isinstance(other, PrefixExtractor):
+            return NotImplemented
+        return self.length == other.length
+
+    def __repr__(self):
+        return f"PrefixExtractor(length={self.length})"
+
+    def in_domain(self, key: Record.Key) -> bool:
+        return len(key) >= self.length
+
+    def transform(self, key: Record.Key) -> Record.Key:
+        return key[:self.length]
+
+    @staticmethod
+    def encode(prefix_extractor: Optional["PrefixExtractor"]) -> bytes:
+        """Encodes an optional prefix extractor on 4 bytes (its length, or 0 if there is none)."""
+        return struct.pack("i", prefix_extractor.length if prefix_extractor is not None else 0)
+
+    @staticmethod
+    def decode(data: bytes) -> Optional["PrefixExtractor"]:
+        length = struct.unpack("i", data[:4])[0]
+        return PrefixExtractor(length=length) if length > 0 else None
@@ -0,0 +1,174 @@
+import struct
+from bisect import bisect_left, bisect_right
+from typing import Iterator, Optional
+
+from src.record import Record
+
+
+class RangeTombstone:
+    """This class handles encoding and decoding of Range Tombstones.
+
+    A range tombstone marks the deletion of all the keys from `start` (included) to `end` (excluded).
+
+    Each Range Tombstone has the following format:
+    +------------+------------------+----------+----------------+
+    | Start_size |      Start       | End_size |      End       |
+    +------------+------------------+----------+----------------+
+    |  4 bytes   | Start_size bytes | 4 bytes  | End_size bytes |
+    +------------+------------------+----------+----------------+
+    """
+    ENCODING = "utf-8"
+    NB_BYTES_INTEGER = 4
+
+    def __init__(self, start: Record.Key, end: Record.Key):
+        if start >= end:
+            raise ValueError(f"The start of a range tombstone must be lower than its end (got {start!r} and {end!r}).")
+        self.start = start
+        self.end = end
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, RangeTombstone):
+            return NotImplemented
+        return self.start == other.start and self.end == other.end
+
+    def __repr__(self):
+        return f"[{self.start}, {self.end})"
+
+    def covers(self, key: Record.Key) -> bool:
+        return self.start <= key < self.end
+
+    @property
+    def size(self) -> int:
+        return len(self.to_bytes())
+
+    def to_bytes(self) -> bytes:
+        encoded_start = bytes(self.start, encoding=self.ENCODING)
+        encoded_end = bytes(self.end, encoding=self.ENCODING)
+
+        return (struct.pack("i", len(encoded_start)) + encoded_start +
+                struct.pack("i", len(encoded_end)) + encoded_end)
+
+    @classmethod
+    def _from_bytes(cls, data: bytes | memoryview, offset: int = 0) -> tuple["RangeTombstone", int]:
+        """Decodes the range tombstone starting at `offset` in `data` and returns it along with the offset of its
+        end."""
+        start_size = struct.unpack_from("i", data, offset)[0]
+        start_end = offset + cls.NB_BYTES_INTEGER + start_size
+        start = str(data[offset + cls.NB_BYTES_INTEGER:start_end], encoding=cls.ENCODING)
+        end_size = struct.unpack_from("i", data, start_end)[0]
+        end_end = start_end + cls.NB_BYTES_INTEGER + end_size
+        end = str(data[start_end + cls.NB_BYTES_INTEGER:end_end], encoding=cls.ENCODING)
+
+        return cls(start=start, end=end), end_end
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview, offset: int = 0) -> "RangeTombstone":
+        range_tombstone, _ = cls._from_bytes(data=data, offset=offset)
+        return range_tombstone
+
+
+class RangeTombstones:
+    """This class handles the set of range tombstones of a memtable or of an SSTable.
+
+    Overlapping (or contiguous) range tombstones are merged upon insertion: the ranges are thus kept sorted and
+    disjoint, so that finding whether a key (or a whole range of keys, e.g. a data block) is deleted is a binary search.
+
+    Range tombstones only hide the records of older memtables and SSTables. The records of the memtable or SSTable that
+    holds them are always more recent: a range deletion hides the records of its own memtable when it is applied (cf
+    `MemTable.delete_range`), and compactions drop the records hidden by the range tombstones they merge.
+
+    The range tombstones of an SSTable are stored in a dedicated section, as a sequence of encoded `RangeTombstone`s.
+    """
+
+    def __init__(self, range_tombstones: Optional[list[RangeTombstone]] = None):
+        self._starts: list[Record.Key] = []
+        self._ends: list[Record.Key] = []
+        for range_tombstone in range_tombstones or []:
+            self.add(range_tombstone=range_tombstone)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, RangeTombstones):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+
+    def __repr__(self):
+        return f"RangeTombstones({list(self)})"
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __iter__(self) -> Iterator[RangeTombstone]:
+        for start, end in zip(self._starts, self._ends):
+            yield RangeTombstone(start=start, end=end)
+
+    @property
+    def first_key(self) -> Optional[Record.Key]:
+        return self._starts[0] if len(self) else None
+
+    @property
+    def last_key(self) -> Optional[Record.Key]:
+        return self._ends[-1] if len(self) else None
+
+    def add(self, range_tombstone: RangeTombstone) -> None:
+        start, end = range_tombstone.start, range_tombstone.end
+        # Ranges [first_merged, last_merged) are those that overlap or touch the new one
+        first_merged = bisect_left(self._ends, start)
+        last_merged = bisect_right(self._starts, end)
+        if first_merged < last_merged:
+            start = min(start, self._starts[first_merged])
+            end = max(end, self._ends[last_merged - 1])
+        self._starts[first_merged:last_merged] = [start]
+        self._ends[first_merged:last_merged] = [end]
+
+    def covers(self, key: Record.Key) -> bool:
+        index = bisect_right(self._starts, key) - 1
+        return index >= 0 and key < self._ends[index]
+
+    def covers_range(self, first_key: Record.Key, last_key: Record.Key) -> bool:
+        """Returns True if all keys from `first_key` to `last_key` (both included) are deleted."""
+        index = bisect_right(self._starts, first_key) - 1
+        return index >= 0 and last_key < self._ends[index]
+
+    def clip(self, lower: Optional[Record.Key] = None, upper: Optional[Record.Key] = None) -> "RangeTombstones":
+        """Returns the parts of the range tombstones that are from `lower` (included) to `upper` (excluded)."""
+        clipped = RangeTombstones()
+        for start, end in zip(self._starts, self._ends):
+            start = start if lower is None else max(start, lower)
+            end = end if upper is None else min(end, upper)
+            if start < end:
+                clipped._starts.append(start)
+                clipped._ends.append(end)
+        return clipped
+
+    @classmethod
+    def union(cls, range_tombstones_list: list["RangeTombstones"]) -> "RangeTombstones":
+        union = cls()
+        for range_tombstones in range_tombstones_list:
+            for range_tombstone in range_tombstones:
+                union.add(range_tombstone=range_tombstone)
+        return union
+
+    @classmethod
+    def shadowing(cls, range_tombstones_list: list["RangeTombstones"]) -> list["RangeTombstones"]:
+        """Takes the range tombstones of layers (memtables or SSTables) ordered from the newest to the oldest, and
+        returns, for each layer, the union of the range tombstones of all newer layers (i.e. those that hide its
+        records)."""
+        shadowing = []
+        union = cls()
+        for range_tombstones in range_tombstones_list:
+            shadowing.append(cls.union([union]))
+            for range_tombstone in range_tombstones:
+                union.add(range_tombstone=range_tombstone)
+        return shadowing
+
+    def to_bytes(self) -> bytes:
+        return b''.join([range_tombstone.to_bytes() for range_tombstone in self])
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview) -> "RangeTombstones":
+        range_tombstones = cls()
+        offset = 0
+        while offset < len(data):
+            range_tombstone, offset = RangeTombstone._from_bytes(data=data, offset=offset)
+            range_tombstones.add(range_tombstone=range_tombstone)
+        return range_tombstones
@@ -13,24 +13,34 @@ class Record:
     +----------+----------------+------------+------------------+
     | 4 bytes  | Key_size bytes |  4 bytes   | Value_size bytes |
     +----------+----------------+------------+------------------+
+
+    A tombstone (i.e. a record marking the deletion of its key) has no value: its Value_size is `TOMBSTONE_VALUE_SIZE`
+    (a negative size, that no actual value can have).
     """
     Key = str
     Value = bytes
     ENCODING = "utf-8"
     NB_BYTES_INTEGER = 4
+    TOMBSTONE_VALUE_SIZE = -1
 
-    def __init__(self, key: Key, value: Value):
+    def __init__(self, key: Key, value: Value, is_tombstone: bool = False):
         self.key = key
         self.value = value
-        self.key_size = len(self.key)
+        self.is_tombstone = is_tombstone
         self.value_size = len(self.value)
 
+    @classmethod
+    def tombstone(cls, key: Key) -> "Record":
+        return cls(key=key, value=b'', is_tombstone=True)
+
     def __eq__(self, other) -> bool:
         if not isinstance(other, Record):
             return NotImplemented
-        return self.key == other.key and self.value == other.value
+        return self.key == other.key and self.value == other.value and self.is_tombstone == other.is_tombstone
 
     def __repr__(self):
+        if self.is_tombstone:
+            return f"{self.key}: <tombstone>"
         return f"{self.key}: {self.value}"
 
     def __lt__(self, other: "Record"):
@@ -51,50 +61,60 @@ class Record:
     def encode_integer(integer: int) -> bytes:
         return struct.pack("i", integer)
 
+    @property
+    def key_size(self) -> int:
+        """Size of the encoded key, in bytes (keys may hold characters that are encoded on several bytes)."""
+        return len(self.encoded_key)
+
     @property
     def encoded_key_size(self) -> bytes:
         return self.encode_integer(self.key_size)
 
     @property
     def encoded_value_size(self) -> bytes:
-        return self.encode_integer(self.value_size)
+        return self.encode_integer(self.TOMBSTONE_VALUE_SIZE if self.is_tombstone else self.value_size)
 
     @property
     def size(self) -> int:
         return len(self.to_bytes())
 
     def to_bytes(self) -> bytes:
-        encoded_key_size = self.encoded_key_size
         encoded_key = self.encoded_key
+        encoded_key_size = self.encode_integer(len(encoded_key))
         encoded_value_size = self.encoded_value_size
         encoded_value = self.value  # already encoded
 
         return encoded_key_size + encoded_key + encoded_value_size + encoded_value
 
     @classmethod
-    def _from_bytes(cls, data: bytes) -> tuple["Record", int]:
-        key_size_end = cls.NB_BYTES_INTEGER
-        key_size = struct.unpack("i", data[:key_size_end])[0]
+    def _from_bytes(cls, data: bytes | memoryview, offset: int = 0) -> tuple["Record", int]:
+        """Decodes the record starting at `offset` in `data` and returns it along with the offset of its end.
+        `data` can be a `memoryview` (e.g. on a memory-mapped file): only the key and the value are copied out of it.
+        """
+        key_size_end = offset + cls.NB_BYTES_INTEGER
+        key_size = struct.unpack_from("i", data, offset)[0]
         key_end = key_size_end + key_size
-        key = data[key_size_end:key_end].decode(encoding=cls.ENCODING)
+        key = str(data[key_size_end:key_end], encoding=cls.ENCODING)
         value_size_end = key_end + cls.NB_BYTES_INTEGER
-        value_size = struct.unpack("i", data[key_end:value_size_end])[0]
+        value_size = struct.unpack_from("i", data, key_end)[0]
+        if value_size == cls.TOMBSTONE_VALUE_SIZE:
+            return cls.tombstone(key=key), value_size_end
         value_end = value_size_end + value_size
-        value = data[value_size_end:value_end]
+        value = bytes(data[value_size_end:value_end])
 
         return cls(key=key, value=value), value_end
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "Record":
-        record, _ = cls._from_bytes(data=data)
+    def from_bytes(cls, data: bytes | memoryview, offset: int = 0) -> "Record":
+        record, _ = cls._from_bytes(data=data, offset=offset)
         return record
 
     # TODO: move this to a dedicated class (this would be an iterator)
     @classmethod
     def list_from_bytes(cls, data: bytes) -> list["Record"]:
         records = []
-        while len(data):
-            record, checkpoint = cls._from_bytes(data)
+        checkpoint = 0
+        while checkpoint < len(data):
+            record, checkpoint = cls._from_bytes(data, offset=checkpoint)
             records.append(record)
-            data = data[checkpoint:]
         return records
@@ -57,11 +57,13 @@ class Node:
         if self is RedBlackTree.NIL_LEAF:
             return
 
-        # Optimization: stop traversing as soon as we reach a node bigger than the upper bound
+        # Optimization: only the left subtree of a node bigger than the upper bound can hold keys within the bounds
         if upper is not None and self.key > upper:
+            yield from self.left.in_order_traversal(lower=lower, upper=upper)
             return
-        # Optimization: stop traversing as soon as we reach a node smaller than the lower bound
+        # Optimization: only the right subtree of a node smaller than the lower bound can hold keys within the bounds
         if lower is not None and self.key < lower:
+            yield from self.right.in_order_traversal(lower=lower, upper=upper)
             return
 
         yield from self.left.in_order_traversal(lower=lower, upper=upper)
@@ -96,7 +98,7 @@ class RedBlackTree:
 
         return candidate
 
-    def scan(self, lower: Node.Key, upper: Node.Key) -> Iterator[Node.Data]:
+    def scan(self, lower: Optional[Node.Key], upper: Optional[Node.Key]) -> Iterator[Node.Data]:
         for node in self.root.in_order_traversal(lower=lower, upper=upper):
             yield node.data
 
@@ -0,0 +1,184 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Callable
+
+if TYPE_CHECKING:
+    from src.lsm_storage import LsmStorage
+
+
+class SchedulerOptions:
+    """Options of the background jobs of a store.
+
+    Writes are slowed down (each one sleeps `slowdown_delay` seconds) once the number of immutable memtables or of L0
+    SSTables reaches its `slowdown_*` threshold, and they are stopped (they wait for background jobs to catch up) once
+    it reaches its `stop_*` threshold. This bounds the amount of work that flushes and compactions can lag behind.
+    """
+
+    def __init__(self,
+                 nb_compaction_threads: int = 2,
+                 slowdown_immutable_memtables: int = 3,
+                 stop_immutable_memtables: int = 5,
+                 slowdown_l0_sstables: int = 20,
+                 stop_l0_sstables: int = 36,
+                 slowdown_delay: float = 0.001):
+        self.nb_compaction_threads = nb_compaction_threads
+        self.slowdown_immutable_memtables = slowdown_immutable_memtables
+        self.stop_immutable_memtables = stop_immutable_memtables
+        self.slowdown_l0_sstables = slowdown_l0_sstables
+        self.stop_l0_sstables = stop_l0_sstables
+        self.slowdown_delay = slowdown_delay
+
+
+class BackgroundScheduler:
+    """This class runs the flushes and compactions of a store in the background, outside the threads that write to it.
+
+    - A dedicated thread flushes immutable memtables (oldest first) as soon as there are some.
+    - A pool of threads runs compactions. Each compaction reserves the levels it reads from and writes to (cf
+      `CompactionStrategy.reserved_levels`): several compactions can thus run at the same time as long as they do not
+      touch the same levels.
+    - Writers call `throttle_writes` before each write, which applies the slowdown/stop thresholds of the options.
+
+    An exception raised by a background job is kept in `error` and re-raised (wrapped) to writers: there is no point in
+    accepting writes that will never be flushed.
+
+    Jobs take the locks of the store before `_condition` (e.g. a compaction installs its output, then releases its
+    levels): the levels to compact, which are read under the locks of the store, are thus never computed while holding
+    `_condition`.
+    """
+
+    def __init__(self, store: "LsmStorage", options: SchedulerOptions):
+        if options.stop_immutable_memtables < 1:
+            raise ValueError("Writes cannot be stopped before there is an immutable memtable to flush.")
+        if options.stop_l0_sstables < store._configuration.max_l0_sstables:
+            raise ValueError(f"Writes cannot be stopped before L0 gets compacted "
+                             f"(stop_l0_sstables={options.stop_l0_sstables} is lower than "
+                             f"max_l0_sstables={store._configuration.max_l0_sstables}).")
+
+        self.store = store
+        self.options = options
+        self.error: Optional[Exception] = None
+        self.nb_slowdowns = 0
+        self.nb_stops = 0
+        self._is_stopped = False
+        self._compacting_levels: set[int] = set()
+        self._condition = threading.Condition()
+        # Number of notifications of `_condition`, which tells whether the state changed while `_condition` was not held
+        # (cf `wait_until_idle`)
+        self._nb_notifications = 0
+        self._compaction_pool = ThreadPoolExecutor(max_workers=options.nb_compaction_threads,
+                                                   thread_name_prefix="compaction")
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="flush", daemon=True)
+        self._flush_thread.start()
+
+    def schedule_flush(self) -> None:
+        with self._condition:
+            self._notify_all()
+
+    def schedule_compactions(self) -> None:
+        """Submits a compaction for every level that needs one and whose levels are not already being compacted.
+        The levels may no longer need a compaction once they are reserved: each compaction checks it again before it
+        runs (cf `_compact`).
+        """
+        levels_to_compact = self.store._levels_to_compact()
+        with self._condition:
+            if self._is_stopped:
+                return
+            for level in levels_to_compact:
+                levels = self.store.compaction_strategy.reserved_levels(level=level)
+                if levels & self._compacting_levels:
+                    continue
+                self._compacting_levels |= levels
+                self._compaction_pool.submit(self._compact, level, levels)
+
+    def throttle_writes(self) -> None:
+        with self._condition:
+            is_stopped = False
+            while self.error is None and not self._is_stopped and self._must_stop_writes():
+                is_stopped = True
+                self._condition.wait()
+            if self.error is not None:
+                raise RuntimeError("A background flush or compaction failed: the store cannot accept writes.") \
+                    from self.error
+            if is_stopped:
+                self.nb_stops += 1
+            must_slow_down = self._must_slow_down_writes()
+            if must_slow_down:
+                self.nb_slowdowns += 1
+
+        if must_slow_down:
+            time.sleep(self.options.slowdown_delay)
+
+    def wait_until_idle(self) -> None:
+        """Waits until there is nothing left to flush and no compaction is running."""
+        while True:
+            with self._condition:
+                nb_notifications = self._nb_notifications
+            levels_to_compact = self.store._levels_to_compact()
+            with self._condition:
+                if (self.error is not None or self._is_stopped
+                        or not (len(self.store.state.immutable_memtables) or self._compacting_levels
+                                or levels_to_compact)):
+                    return
+                # Unless the state changed since the levels to compact were computed (they are then computed again)
+                if self._nb_notifications == nb_notifications:
+                    self._condition.wait()
+
+    def stop(self) -> None:
+        """Stops the background jobs. Running jobs are completed (but no new one is started)."""
+        with self._condition:
+            self._is_stopped = True
+            self._notify_all()
+        self._flush_thread.join()
+        self._compaction_pool.shutdown(wait=True)
+
+    def _must_stop_writes(self) -> bool:
+        return (len(self.store.state.immutable_memtables) >= self.options.stop_immutable_memtables
+                or len(self.store.state.sstables_level0) >= self.options.stop_l0_sstables)
+
+    def _must_slow_down_writes(self) -> bool:
+        return (len(self.store.state.immutable_memtables) >= self.options.slowdown_immutable_memtables
+                or len(self.store.state.sstables_level0) >= self.options.slowdown_l0_sstables)
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._is_stopped and self.error is None and not len(self.store.state.immutable_memtables):
+                    self._condition.wait()
+                if self._is_stopped or self.error is not None:
+                    return
+
+            if not self._run(job=self.store._flush_in_background):
+                return
+            self.schedule_compactions()
+
+    def _compact(self, level: int, levels: set[int]) -> None:
+        try:
+            # The state may have changed since the compaction was scheduled
+            if level in self.store._levels_to_compact():
+                self._run(job=lambda: self.store._force_compaction(level=level))
+        finally:
+            with self._condition:
+                self._compacting_levels -= levels
+                self._notify_all()
+
+        # The compaction may have pushed the next level over its threshold
+        self.schedule_compactions()
+
+    def _run(self, job: Callable[[], None]) -> bool:
+        try:
+            job()
+        except Exception as error:
+            with self._condition:
+                self.error = error
+                self._notify_all()
+            return False
+
+        with self._condition:
+            self._notify_all()
+        return True
+
+    def _notify_all(self) -> None:
+        """Wakes up the threads that wait on `_condition` (which must be held)."""
+        self._nb_notifications += 1
+        self._condition.notify_all()
@@ -1,30 +1,61 @@
+import mmap
 import os
+import shutil
 import struct
-from typing import Optional
+import tempfile
+from array import array
+from bisect import bisect_left
+from typing import Optional, Deque, Iterator, Sequence, Union
 
+from src.block_cache import BlockCache
 from src.blocks import DataBlockBuilder, DataBlock, MetaBlock
-from src.bloom_filter import BloomFilter
+from src.bloom_filter import BloomFilter, BlockedBloomFilter, BloomFilterLayout, BLOOM_FILTER_CLASSES, \
+    DEFAULT_BITS_PER_KEY
+from src.compression import Compression, compress_block, decompress_block
+from src.file_descriptor_pool import FileDescriptorPool, map_file, unmap
 from src.iterators import SSTableIterator
+from src.prefix_extractor import PrefixExtractor
+from src.range_tombstones import RangeTombstone, RangeTombstones
 from src.record import Record
 
 INT_i_SIZE = 4
 
+FORMAT_VERSION_LEGACY = 1
+FORMAT_VERSION_RESTART_POINTS = 2
+FORMAT_VERSION_BLOCK_COMPRESSION = 3
+FORMAT_VERSION_RANGE_TOMBSTONES = 4
+FORMAT_VERSION_DOUBLE_HASHING = 5
+FORMAT_VERSION_BLOOM_FILTER_LAYOUT = 6
+FORMAT_VERSION_PARTITIONED_INDEX = 7
+FORMAT_VERSION_PREFIX_BLOOM_FILTER = 8
+FORMAT_VERSION = FORMAT_VERSION_PREFIX_BLOOM_FILTER  # Version of the SSTables written
+MAGIC = b'PBL\xdb'
+MAX_EXTRA_SIZE = 5 * INT_i_SIZE + 1 + len(MAGIC)
+
 
 class SSTableFile:
-    def __init__(self, path: str):
+    """This class handles reads and writes of SSTable files.
+
+    By default, every read opens the file, seeks and reads the requested range before closing the file again.
+    When a `descriptor_pool` is given, the file is instead kept open in the pool (which bounds the total number of open
+    files) and ranges are read with positional reads (`os.pread`), which are safe to use from several threads at once.
+    """
+
+    def __init__(self, path: str, descriptor_pool: Optional[FileDescriptorPool] = None):
         self.path = path
+        self.descriptor_pool = descriptor_pool
 
     @classmethod
-    def create(cls, path: str, data: bytes):
-        obj = cls(path)
+    def create(cls, path: str, data: bytes, descriptor_pool: Optional[FileDescriptorPool] = None):
+        obj = cls(path, descriptor_pool=descriptor_pool)
         if obj._exists():
             raise ValueError(f"Cannot create the file because there is already one at {path}")
         obj._write(data=data)
         return obj
 
     @classmethod
-    def open(cls, path: str):
-        obj = cls(path)
+    def open(cls, path: str, descriptor_pool: Optional[FileDescriptorPool] = None):
+        obj = cls(path, descriptor_pool=descriptor_pool)
         if not obj._exists():
             raise ValueError(f"Cannot open the file because there is none at {path}")
         return obj
@@ -39,6 +70,10 @@ class SSTableFile:
             f.write(data)
 
     def read_range(self, start: int, end: int) -> bytes:
+        if self.descriptor_pool is not None:
+            with self.descriptor_pool.open(path=self.path) as file_descriptor:
+                return os.pread(file_descriptor, end - start, start)
+
         with open(self.path, "rb") as f:
             f.seek(start)
             return f.read(end - start)
@@ -47,26 +82,117 @@ class SSTableFile:
         with open(self.path, "rb") as f:
             return f.read()
 
+    def close(self) -> None:
+        """Closes the descriptor kept open for the file (if any), e.g. once the SSTable was compacted."""
+        if self.descriptor_pool is not None:
+            self.descriptor_pool.close(path=self.path)
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
     def _exists(self) -> bool:
         return os.path.isfile(self.path)
 
 
+class MmapSSTableFile(SSTableFile):
+    """This class reads SSTable files through a read-only memory map.
+
+    Reads return `memoryview` slices of the mapping instead of `bytes`: no data is copied into the Python heap until it
+    is actually decoded, and the pages of the file are loaded (and evicted) by the operating system on demand.
+    The file is mapped lazily, upon the first read. When a `descriptor_pool` is given, the map is kept in the pool (cf
+    `FileDescriptorPool.map`), so that maps count against the number of open files and are unmapped when evicted.
+    """
+
+    def __init__(self, path: str, descriptor_pool: Optional[FileDescriptorPool] = None):
+        super().__init__(path=path, descriptor_pool=descriptor_pool)
+        self._map: Optional[Union[mmap.mmap, bytes]] = None
+
+    def _view(self) -> memoryview:
+        if self.descriptor_pool is not None:
+            with self.descriptor_pool.map(path=self.path) as view:
+                return view
+        if self._map is None:
+            # Empty files cannot be mapped
+            self._map = map_file(path=self.path) if os.path.getsize(self.path) else b''
+        return memoryview(self._map)
+
+    def read_range(self, start: int, end: int) -> memoryview:
+        return self._view()[start:end]
+
+    def read(self) -> memoryview:
+        return self._view()
+
+    def close(self) -> None:
+        """Unmaps the file (it is mapped again upon the next read)."""
+        super().close()
+        file_map, self._map = self._map, None
+        if isinstance(file_map, mmap.mmap):
+            unmap(file_map=file_map)
+
+
 class SSTableEncoding:
     """This class handles encoding and decoding of SSTables.
 
     Each SSTable has the following format:
-    +-----------------------+---------------------------+--------------+----------------------------+
-    |         Blocks        |        Meta Blocks        |  Meta Bloom  |            Extra           |
-    +-----------------------+---------------------------+--------------+----------------------------+
-    | DB1 | DB2 | ... | DBn | meta_DB1 | ... | meta_DBn | bloom filter | meta_offset | bloom_offset |
-    +-----------------------+---------------------------+--------------+----------------------------+
-    (DB = Data Block)
+    +-----------------------+---------------------------+------------------+--------------+--------------+-------+
+    |         Blocks        |        Meta Blocks        | Range Tombstones | Prefix Bloom |  Meta Bloom  | Extra |
+    +-----------------------+---------------------------+------------------+--------------+--------------+-------+
+    | DB1 | DB2 | ... | DBn | meta_DB1 | ... | meta_DBn |  RT1 | ... | RTm | bloom filter | bloom filter |       |
+    +-----------------------+---------------------------+------------------+--------------+--------------+-------+
+    (DB = Data Block, RT = Range Tombstone)
+
+    With the Extra section having the following format:
+    +-------------+--------------+-----------------+-------------------+---------------------+---------+---------+
+    | meta_offset | bloom_offset | range_tombstone | partitions_offset | prefix_bloom_offset | version |  magic  |
+    |             |              |     _offset     |                   |                     |         |         |
+    +-------------+--------------+-----------------+-------------------+---------------------+---------+---------+
+    |   4 bytes   |   4 bytes    |     4 bytes     |      4 bytes      |       4 bytes       | 1 byte  | 4 bytes |
+    +-------------+--------------+-----------------+-------------------+---------------------+---------+---------+
+
+    The index of an SSTable may be partitioned (cf `PartitionedIndex`). The partitions (cf `IndexPartition`) are then
+    stored between the data blocks and the meta blocks section (from `partitions_offset` to `meta_offset`), the meta
+    blocks section holds the top-level index (cf `TopLevelIndex`) and the bloom filter section is empty (each partition
+    has its own bloom filter):
+    +-----------------------+-------------------------+-----------------+------------------+-------+
+    |         Blocks        |   Index partitions      | Top-level index | Range Tombstones | Extra |
+    +-----------------------+-------------------------+-----------------+------------------+-------+
+    | DB1 | DB2 | ... | DBn | P1 | P2 | ... | Pk      |                 |  RT1 | ... | RTm |       |
+    +-----------------------+-------------------------+-----------------+------------------+-------+
+
+    The version identifies the format of the SSTable:
+    - Version 1 (legacy): each record of a data block is stored in full. The Extra section of these SSTables only
+      contains `meta_offset` and `bloom_offset` (there is neither version nor magic).
+    - Version 2: keys of data blocks are prefix-compressed between restart points (cf `DataBlock`).
+    - Version 3: each data block is followed by the byte of the codec it is compressed with (cf `compress_block`).
+    - Version 4: the range tombstones of the SSTable (cf `RangeTombstones`) are stored between the meta blocks and the
+      bloom filter, and their offset is part of the Extra section. Older SSTables have neither (they have no range
+      tombstones).
+    - Version 5: the bloom filter is built with double hashing (cf `BloomFilter._hash`). Its encoding is unchanged, but
+      the bits it sets are different.
+    - Version 6: the bloom filter is preceded by the byte of its layout (cf `BloomFilterLayout`).
+    - Version 7: the index may be partitioned, and the offset of its partitions is part of the Extra section (it is
+      the same as `meta_offset` if the index is not partitioned). Older SSTables have no partition.
+    - Version 8: the bloom filter of the prefixes of the keys (cf `PrefixExtractor`) is stored between the range
+      tombstones and the bloom filter, and its offset is part of the Extra section. The section is empty if the SSTable
+      was built without a prefix extractor (as are those of older SSTables).
+    The magic number cannot be mistaken for the `bloom_offset` of a legacy SSTable (as a signed integer, it is
+    negative), which is how SSTables of version 1 are told apart from the others.
     """
 
-    def __init__(self, data: bytes, meta_blocks: list[MetaBlock], bloom_filter: BloomFilter):
+    def __init__(self,
+                 data: bytes,
+                 meta_blocks: list[MetaBlock],
+                 bloom_filter: BloomFilter,
+                 version: int = FORMAT_VERSION,
+                 range_tombstones: Optional[RangeTombstones] = None,
+                 prefix_bloom_filter: Optional[BloomFilter] = None):
         self.meta_blocks = meta_blocks
         self.data = data
         self.bloom_filter = bloom_filter
+        self.version = version
+        self.range_tombstones = range_tombstones if range_tombstones is not None else RangeTombstones()
+        self.prefix_bloom_filter = prefix_bloom_filter
 
     @property
     def meta_block_section_offset(self):
@@ -78,39 +204,410 @@ class SSTableEncoding:
             f.write(encoded_sstable)
 
     def to_bytes(self) -> bytes:
-        encoded_meta_blocks = b''.join([meta_block.to_bytes() for meta_block in self.meta_blocks])
-        encoded_bloom_filter = self.bloom_filter.to_bytes()
-        encoded_meta_block_offset = struct.pack("i", len(self.data))
-        encoded_bloom_filter_offset = struct.pack("i", len(self.data) + len(encoded_meta_blocks))
+        return self.data + self.encode_index(data_size=len(self.data), meta_blocks=self.meta_blocks,
+                                             bloom_filter=self.bloom_filter, version=self.version,
+                                             range_tombstones=self.range_tombstones,
+                                             prefix_bloom_filter=self.prefix_bloom_filter)
+
+    @staticmethod
+    def encode_index(data_size: int,
+                     meta_blocks: list[MetaBlock],
+                     bloom_filter: Optional[BloomFilter],
+                     version: int = FORMAT_VERSION,
+                     range_tombstones: Optional[RangeTombstones] = None,
+                     partitions_size: int = 0,
+                     top_level_index: Optional["TopLevelIndex"] = None,
+                     prefix_bloom_filter: Optional[BloomFilter] = None) -> bytes:
+        """Encodes everything that follows the data blocks (meta blocks, range tombstones, bloom filters and Extra
+        section) of an SSTable whose data blocks section is `data_size` bytes long.
+        This lets the data blocks be written (e.g. streamed to a file) separately from the rest of the SSTable.
+        If the index is partitioned, its `partitions_size` bytes of partitions must follow the data blocks: the
+        `top_level_index` is then encoded instead of the meta blocks, and there is no bloom filter.
+        """
+        range_tombstones = range_tombstones if range_tombstones is not None else RangeTombstones()
+        if top_level_index is not None:
+            encoded_meta_blocks = top_level_index.to_bytes()
+            encoded_bloom_filter = b''
+        else:
+            encoded_meta_blocks = b''.join([meta_block.to_bytes() for meta_block in meta_blocks])
+            encoded_bloom_filter = SSTableEncoding.encode_bloom_filter(bloom_filter=bloom_filter, version=version)
+        has_range_tombstones = version >= FORMAT_VERSION_RANGE_TOMBSTONES
+        has_partitions = version >= FORMAT_VERSION_PARTITIONED_INDEX
+        has_prefix_bloom_filter = version >= FORMAT_VERSION_PREFIX_BLOOM_FILTER
+        encoded_range_tombstones = range_tombstones.to_bytes() if has_range_tombstones else b''
+        encoded_prefix_bloom_filter = \
+            SSTableEncoding.encode_bloom_filter(bloom_filter=prefix_bloom_filter, version=version) \
+            if has_prefix_bloom_filter and prefix_bloom_filter is not None else b''
+        meta_block_offset = data_size + partitions_size
+        range_tombstone_offset = meta_block_offset + len(encoded_meta_blocks)
+        prefix_bloom_filter_offset = range_tombstone_offset + len(encoded_range_tombstones)
+        encoded_meta_block_offset = struct.pack("i", meta_block_offset)
+        encoded_bloom_filter_offset = struct.pack("i", prefix_bloom_filter_offset + len(encoded_prefix_bloom_filter))
+        encoded_range_tombstone_offset = struct.pack("i", range_tombstone_offset) if has_range_tombstones else b''
+        encoded_partitions_offset = struct.pack("i", data_size) if has_partitions else b''
+        encoded_prefix_bloom_filter_offset = \
+            struct.pack("i", prefix_bloom_filter_offset) if has_prefix_bloom_filter else b''
+        encoded_version = b'' if version == FORMAT_VERSION_LEGACY else struct.pack("B", version) + MAGIC
+
+        return (encoded_meta_blocks + encoded_range_tombstones + encoded_prefix_bloom_filter + encoded_bloom_filter +
+                encoded_meta_block_offset + encoded_bloom_filter_offset + encoded_range_tombstone_offset +
+                encoded_partitions_offset + encoded_prefix_bloom_filter_offset + encoded_version)
+
+    @staticmethod
+    def encode_bloom_filter(bloom_filter: BloomFilter, version: int = FORMAT_VERSION) -> bytes:
+        has_layout = version >= FORMAT_VERSION_BLOOM_FILTER_LAYOUT
+        encoded_layout = struct.pack("B", bloom_filter.LAYOUT) if has_layout else b''
+        return encoded_layout + bloom_filter.to_bytes()
+
+    @staticmethod
+    def decode_bloom_filter(data: bytes | memoryview, version: int) -> BloomFilter:
+        if version < FORMAT_VERSION_BLOOM_FILTER_LAYOUT:
+            return BloomFilter.from_bytes(data=data, double_hashing=version >= FORMAT_VERSION_DOUBLE_HASHING)
+        bloom_filter_class = BLOOM_FILTER_CLASSES[BloomFilterLayout(data[0])]
+        return bloom_filter_class.from_bytes(data=data[1:])
+
+    @staticmethod
+    def decode_extra(data: bytes) -> tuple[int, int, int, int, int, int, int]:
+        """Decodes the Extra section from the last bytes of the SSTable (`data` must contain at least the last
+        `MAX_EXTRA_SIZE` bytes of the SSTable, or the whole SSTable if it is smaller).
+        Returns the offsets of the meta blocks section, of the range tombstones section, of the prefix bloom filter
+        section, of the bloom filter section and of the index partitions section (i.e. the end of the data blocks), the
+        version of the SSTable and the size of the Extra section.
+        """
+        if bytes(data[-len(MAGIC):]) == MAGIC:
+            version = data[-len(MAGIC) - 1]
+            offsets_end = len(data) - len(MAGIC) - 1
+        else:
+            version = FORMAT_VERSION_LEGACY
+            offsets_end = len(data)
 
-        return self.data + encoded_meta_blocks + encoded_bloom_filter + encoded_meta_block_offset + encoded_bloom_filter_offset
+        if version >= FORMAT_VERSION_PREFIX_BLOOM_FILTER:
+            nb_offsets = 5
+        elif version >= FORMAT_VERSION_PARTITIONED_INDEX:
+            nb_offsets = 4
+        elif version >= FORMAT_VERSION_RANGE_TOMBSTONES:
+            nb_offsets = 3
+        else:
+            nb_offsets = 2
+        offsets_start = offsets_end - nb_offsets * INT_i_SIZE
+        offsets = struct.unpack("i" * nb_offsets, data[offsets_start:offsets_end])
+        meta_block_offset, bloom_offset = offsets[0], offsets[1]
+        # Older SSTables have an empty range tombstones section (right before the bloom filter)
+        range_tombstone_offset = offsets[2] if nb_offsets >= 3 else bloom_offset
+        # And an empty index partitions section (right before the meta blocks)
+        partitions_offset = offsets[3] if nb_offsets >= 4 else meta_block_offset
+        # And an empty prefix bloom filter section (right before the bloom filter)
+        prefix_bloom_offset = offsets[4] if nb_offsets >= 5 else bloom_offset
+        return (meta_block_offset, range_tombstone_offset, prefix_bloom_offset, bloom_offset, partitions_offset,
+                version, len(data) - offsets_start)
+
+    @staticmethod
+    def decode_meta_blocks(data: bytes | memoryview) -> list[MetaBlock]:
+        meta_blocks = []
+        while len(data) > 0:
+            meta_block = MetaBlock.from_bytes(data=data)
+            meta_blocks.append(meta_block)
+            data = data[meta_block.size:]
+        return meta_blocks
 
     @classmethod
     def from_bytes(cls, data) -> "SSTableEncoding":
+        """Decodes a whole SSTable whose index is not partitioned (partitioned indexes are read on demand, cf
+        `read_index`)."""
         # Decode extra
-        extra_section_start = len(data) - 2 * INT_i_SIZE
-        extra_section_end = len(data)
-        extra_meta_offset = extra_section_start
-        extra_bloom_offset = extra_section_start + INT_i_SIZE
-        bloom_offset = struct.unpack("i", data[extra_bloom_offset:extra_section_end])[0]
-        meta_block_offset = struct.unpack("i", data[extra_meta_offset:extra_bloom_offset])[0]
+        meta_block_offset, range_tombstone_offset, prefix_bloom_offset, bloom_offset, partitions_offset, version, \
+            extra_size = cls.decode_extra(data=data[-MAX_EXTRA_SIZE:])
+        extra_section_start = len(data) - extra_size
+        if partitions_offset != meta_block_offset:
+            raise ValueError("Cannot decode an SSTable with a partitioned index at once")
 
         # Decode bloom filters
         encoded_bloom_filter = data[bloom_offset:extra_section_start]
-        bloom_filter = BloomFilter.from_bytes(data=encoded_bloom_filter)
+        bloom_filter = cls.decode_bloom_filter(data=encoded_bloom_filter, version=version)
+        encoded_prefix_bloom_filter = data[prefix_bloom_offset:bloom_offset]
+        prefix_bloom_filter = cls.decode_bloom_filter(data=encoded_prefix_bloom_filter, version=version) \
+            if len(encoded_prefix_bloom_filter) else None
+
+        # Decode range tombstones
+        range_tombstones = RangeTombstones.from_bytes(data=data[range_tombstone_offset:prefix_bloom_offset])
 
         # Decode meta blocks
-        encoded_meta_blocks = data[meta_block_offset:bloom_offset]
-        meta_blocks = []
-        while len(encoded_meta_blocks) > 0:
-            meta_block = MetaBlock.from_bytes(data=encoded_meta_blocks)
-            meta_blocks.append(meta_block)
-            encoded_meta_blocks = encoded_meta_blocks[meta_block.size:]
+        meta_blocks = cls.decode_meta_blocks(data=data[meta_block_offset:range_tombstone_offset])
 
         # Decode data blocks
         encoded_data_blocks = data[0:meta_block_offset]
 
-        return cls(data=encoded_data_blocks, meta_blocks=meta_blocks, bloom_filter=bloom_filter)
+        return cls(data=encoded_data_blocks, meta_blocks=meta_blocks, bloom_filter=bloom_filter, version=version,
+                   range_tombstones=range_tombstones, prefix_bloom_filter=prefix_bloom_filter)
+
+    @classmethod
+    def read_index(cls,
+                   file: SSTableFile,
+                   block_cache: Optional[BlockCache] = None
+                   ) -> tuple[Sequence[MetaBlock], int, Union[BloomFilter, "PartitionedBloomFilter"], int,
+                              RangeTombstones, Optional[BloomFilter]]:
+        """Reads the meta blocks, the range tombstones and the bloom filters of an SSTable file, without reading its
+        data blocks.
+        Returns the meta blocks, the end of the data blocks section, the bloom filter, the version, the range
+        tombstones and the prefix bloom filter (if any) of the SSTable.
+        If the index is partitioned, only its top-level index is read: the meta blocks and the bloom filter that are
+        returned read the partitions on demand (through the `block_cache`, cf `PartitionedIndex`).
+        """
+        file_size = file.size
+        encoded_extra = file.read_range(start=max(file_size - MAX_EXTRA_SIZE, 0), end=file_size)
+        meta_block_offset, range_tombstone_offset, prefix_bloom_offset, bloom_offset, partitions_offset, version, \
+            extra_size = cls.decode_extra(data=encoded_extra)
+        extra_section_start = file_size - extra_size
+
+        # The index is copied out of memory-mapped files: it is kept for as long as the SSTable is open, and views of
+        # the map would keep it from being unmapped
+        encoded_index = bytes(file.read_range(start=meta_block_offset, end=extra_section_start))
+        encoded_meta_blocks = encoded_index[:range_tombstone_offset - meta_block_offset]
+        range_tombstones = RangeTombstones.from_bytes(
+            data=encoded_index[range_tombstone_offset - meta_block_offset:prefix_bloom_offset - meta_block_offset])
+        # The prefix bloom filter is a view of the encoded index (it is not copied)
+        encoded_prefix_bloom_filter = \
+            memoryview(encoded_index)[prefix_bloom_offset - meta_block_offset:bloom_offset - meta_block_offset]
+        prefix_bloom_filter = cls.decode_bloom_filter(data=encoded_prefix_bloom_filter, version=version) \
+            if len(encoded_prefix_bloom_filter) else None
+
+        if partitions_offset != meta_block_offset:
+            meta_blocks = PartitionedIndex(file=file,
+                                           top_level_index=TopLevelIndex.from_bytes(data=encoded_meta_blocks),
+                                           partitions_end=meta_block_offset,
+                                           block_cache=block_cache)
+            bloom_filter = PartitionedBloomFilter(index=meta_blocks)
+            return meta_blocks, partitions_offset, bloom_filter, version, range_tombstones, prefix_bloom_filter
+
+        meta_blocks = cls.decode_meta_blocks(data=encoded_meta_blocks)
+        # The bloom filter is a view of the encoded index (it is not copied)
+        bloom_filter = cls.decode_bloom_filter(data=memoryview(encoded_index)[bloom_offset - meta_block_offset:],
+                                               version=version)
+
+        return meta_blocks, meta_block_offset, bloom_filter, version, range_tombstones, prefix_bloom_filter
+
+
+class IndexPartition:
+    """This class handles encoding and decoding of the partitions of a partitioned index (cf `PartitionedIndex`).
+    Each partition holds the meta blocks of consecutive data blocks and the bloom filter of their keys, and has the
+    following format:
+    +---------------------------+--------------+-------------------+
+    |        Meta Blocks        | Bloom filter | meta_blocks_size  |
+    +---------------------------+--------------+-------------------+
+    | meta_DB1 | ... | meta_DBn |              |      4 bytes      |
+    +---------------------------+--------------+-------------------+
+    (The bloom filter is preceded by the byte of its layout, cf `SSTableEncoding.encode_bloom_filter`)
+    """
+
+    def __init__(self, meta_blocks: list[MetaBlock], bloom_filter: BloomFilter):
+        self.meta_blocks = meta_blocks
+        self.bloom_filter = bloom_filter
+        self._last_keys = [meta_block.last_key for meta_block in meta_blocks]
+
+    def __eq__(self, other):
+        if not isinstance(other, IndexPartition):
+            return NotImplemented
+        return self.meta_blocks == other.meta_blocks and self.bloom_filter == other.bloom_filter
+
+    def find_first_block_id(self, key: Record.Key) -> int:
+        """Returns the id (within the partition) of the first block whose last key is >= `key`."""
+        return bisect_left(self._last_keys, key)
+
+    def to_bytes(self) -> bytes:
+        encoded_meta_blocks = b''.join([meta_block.to_bytes() for meta_block in self.meta_blocks])
+        encoded_bloom_filter = SSTableEncoding.encode_bloom_filter(bloom_filter=self.bloom_filter)
+        return encoded_meta_blocks + encoded_bloom_filter + struct.pack("i", len(encoded_meta_blocks))
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview) -> "IndexPartition":
+        meta_blocks_size = struct.unpack("i", data[-INT_i_SIZE:])[0]
+        meta_blocks = SSTableEncoding.decode_meta_blocks(data=data[:meta_blocks_size])
+        bloom_filter = SSTableEncoding.decode_bloom_filter(data=data[meta_blocks_size:-INT_i_SIZE],
+                                                           version=FORMAT_VERSION_PARTITIONED_INDEX)
+        return cls(meta_blocks=meta_blocks, bloom_filter=bloom_filter)
+
+
+class TopLevelIndex:
+    """This class handles encoding and decoding of the top-level index of a partitioned index (cf `PartitionedIndex`).
+    The top-level index has one handle per partition, which is a `MetaBlock` with the first and last keys of the
+    partition and the offset of the partition in the SSTable file. It has the following format:
+    +-----------------------------+----------------------+-----------+
+    |      Partition handles      | blocks_per_partition | nb_blocks |
+    +-----------------------------+----------------------+-----------+
+    | handle_P1 | ... | handle_Pk |       4 bytes        |  4 bytes  |
+    +-----------------------------+----------------------+-----------+
+    Every partition but the last one holds the meta blocks of `blocks_per_partition` data blocks.
+    """
+
+    def __init__(self, handles: list[MetaBlock], blocks_per_partition: int, nb_blocks: int):
+        self.handles = handles
+        self.blocks_per_partition = blocks_per_partition
+        self.nb_blocks = nb_blocks
+
+    def __eq__(self, other):
+        if not isinstance(other, TopLevelIndex):
+            return NotImplemented
+        return (self.handles == other.handles
+                and self.blocks_per_partition == other.blocks_per_partition
+                and self.nb_blocks == other.nb_blocks)
+
+    def to_bytes(self) -> bytes:
+        encoded_handles = b''.join([handle.to_bytes() for handle in self.handles])
+        return encoded_handles + struct.pack("ii", self.blocks_per_partition, self.nb_blocks)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | memoryview) -> "TopLevelIndex":
+        blocks_per_partition, nb_blocks = struct.unpack("ii", data[-2 * INT_i_SIZE:])
+        handles = SSTableEncoding.decode_meta_blocks(data=data[:-2 * INT_i_SIZE])
+        return cls(handles=handles, blocks_per_partition=blocks_per_partition, nb_blocks=nb_blocks)
+
+
+class PartitionedIndex(Sequence[MetaBlock]):
+    """This class gives access to the meta blocks of an SSTable whose index is partitioned.
+
+    The meta blocks (and the bloom filter, cf `PartitionedBloomFilter`) of an SSTable are split into partitions of
+    `blocks_per_partition` data blocks each. Only the small top-level index, which tells the key range and the offset of
+    each partition, is kept in memory: partitions are read from the file when they are needed, and are cached in the
+    `block_cache` of the store along with data blocks (so that they are evicted when they are not used). Opening an
+    SSTable thus does not load its whole index, and the memory used by indexes is bounded by the block cache (plus the
+    last partition decoded by each SSTable, which is kept so that the successive accesses of a lookup or of a scan to
+    the same partition do not read and decode it again, even without a block cache).
+
+    It behaves as the list of all meta blocks of the SSTable (meta block `i` is the one of data block `i`).
+    """
+
+    def __init__(self,
+                 file: SSTableFile,
+                 top_level_index: TopLevelIndex,
+                 partitions_end: int,
+                 block_cache: Optional[BlockCache] = None):
+        self.file = file
+        self.top_level_index = top_level_index
+        self.partitions_end = partitions_end
+        self.block_cache = block_cache
+        self._last_keys = [handle.last_key for handle in top_level_index.handles]
+        # Last partition decoded, as a (partition_id, partition) pair (replaced at once, so that concurrent lookups
+        # always see a consistent pair)
+        self._last_partition: Optional[tuple[int, IndexPartition]] = None
+        # Offset of the first data block of each partition, read once when it is needed as the end of the last data
+        # block of the previous partition (cf `block_range`)
+        self._partition_data_starts: dict[int, int] = {}
+
+    def __eq__(self, other):
+        if not isinstance(other, PartitionedIndex):
+            return NotImplemented
+        return self.file == other.file and self.top_level_index == other.top_level_index
+
+    def __len__(self) -> int:
+        return self.top_level_index.nb_blocks
+
+    def __getitem__(self, block_id: int) -> MetaBlock:
+        if block_id < 0:
+            block_id += len(self)
+        if not 0 <= block_id < len(self):
+            raise IndexError(f"No block {block_id} in an SSTable of {len(self)} blocks")
+        partition_id, id_in_partition = divmod(block_id, self.top_level_index.blocks_per_partition)
+        return self.get_partition(partition_id=partition_id).meta_blocks[id_in_partition]
+
+    def __iter__(self) -> Iterator[MetaBlock]:
+        for partition_id in range(self.nb_partitions):
+            yield from self.get_partition(partition_id=partition_id).meta_blocks
+
+    @property
+    def nb_partitions(self) -> int:
+        return len(self.top_level_index.handles)
+
+    @property
+    def first_key(self) -> Record.Key:
+        return self.top_level_index.handles[0].first_key
+
+    @property
+    def last_key(self) -> Record.Key:
+        return self.top_level_index.handles[-1].last_key
+
+    def find_partition_id(self, key: Record.Key) -> int:
+        """Returns the id of the first partition whose last key is >= `key` (or the number of partitions if there is
+        none)."""
+        return bisect_left(self._last_keys, key)
+
+    def find_first_block_id(self, key: Record.Key) -> int:
+        """Returns the id of the first block whose last key is >= `key` (or the number of blocks if there is none):
+        only the partition that holds its meta block is read."""
+        partition_id = self.find_partition_id(key=key)
+        if partition_id == self.nb_partitions:
+            return len(self)
+        partition = self.get_partition(partition_id=partition_id)
+        return partition_id * self.top_level_index.blocks_per_partition + partition.find_first_block_id(key=key)
+
+    def block_range(self, block_id: int, data_end: int) -> tuple[int, int]:
+        """Returns the offsets of the start and of the end (excluded) of a data block in the file, where `data_end` is
+        the end of the last data block. Only the partition of the block is resolved: the end of the last block of a
+        partition (i.e. the start of the next partition's first block) is only read once.
+        """
+        partition_id, id_in_partition = divmod(block_id, self.top_level_index.blocks_per_partition)
+        meta_blocks = self.get_partition(partition_id=partition_id).meta_blocks
+        start = meta_blocks[id_in_partition].offset
+        if id_in_partition + 1 < len(meta_blocks):
+            return start, meta_blocks[id_in_partition + 1].offset
+        if partition_id + 1 == self.nb_partitions:
+            return start, data_end
+        if partition_id + 1 not in self._partition_data_starts:
+            # The next partition is kept as the last one decoded, since scans go on with its blocks
+            next_partition = self.get_partition(partition_id=partition_id + 1)
+            self._partition_data_starts[partition_id + 1] = next_partition.meta_blocks[0].offset
+        return start, self._partition_data_starts[partition_id + 1]
+
+    def get_partition(self, partition_id: int) -> IndexPartition:
+        """Returns a partition, which is only read (cf `read_partition`) if it is not the last one decoded."""
+        last_partition = self._last_partition
+        if last_partition is not None and last_partition[0] == partition_id:
+            return last_partition[1]
+        partition = self.read_partition(partition_id=partition_id)
+        self._last_partition = (partition_id, partition)
+        return partition
+
+    def read_partition(self, partition_id: int) -> IndexPartition:
+        """Reads and decodes a partition (through the block cache, if any)."""
+        cache_key = (self.file.path, "partition", partition_id)
+        if self.block_cache is not None:
+            cached_partition = self.block_cache.get(key=cache_key)
+            if cached_partition is not None:
+                return cached_partition
+
+        handles = self.top_level_index.handles
+        start = handles[partition_id].offset
+        end = handles[partition_id + 1].offset if partition_id + 1 < len(handles) else self.partitions_end
+        # Partitions are copied out of memory-mapped files, since they are kept (cf `get_partition`)
+        encoded_partition = bytes(self.file.read_range(start=start, end=end))
+        partition = IndexPartition.from_bytes(data=encoded_partition)
+
+        if self.block_cache is not None:
+            self.block_cache.put(key=cache_key, block=partition, charge=len(encoded_partition))
+
+        return partition
+
+
+class PartitionedBloomFilter:
+    """This class gives access to the bloom filter of an SSTable whose index is partitioned (cf `PartitionedIndex`).
+    Each partition has the bloom filter of the keys of its data blocks: a key is only looked up in the bloom filter of
+    the partition whose key range may contain it (which is read on demand).
+    """
+
+    def __init__(self, index: PartitionedIndex):
+        self.index = index
+
+    def __eq__(self, other):
+        if not isinstance(other, PartitionedBloomFilter):
+            return NotImplemented
+        return self.index == other.index
+
+    def may_contain(self, key: str) -> bool:
+        partition_id = self.index.find_partition_id(key=key)
+        if partition_id == self.index.nb_partitions:
+            return False
+        if key < self.index.top_level_index.handles[partition_id].first_key:
+            return False
+        return self.index.get_partition(partition_id=partition_id).bloom_filter.may_contain(key=key)
 
 
 class SSTable:
@@ -123,12 +620,16 @@ class SSTable:
     #  Iterator à part ???
 
     def __init__(self,
-                 meta_blocks: list[MetaBlock],
+                 meta_blocks: Sequence[MetaBlock],
                  meta_block_offset: int,
                  file: SSTableFile,
-                 bloom_filter: BloomFilter,
+                 bloom_filter: Union[BloomFilter, PartitionedBloomFilter],
                  first_key: Record.Key,
-                 last_key: Record.Key
+                 last_key: Record.Key,
+                 block_cache: Optional[BlockCache] = None,
+                 format_version: int = FORMAT_VERSION,
+                 range_tombstones: Optional[RangeTombstones] = None,
+                 prefix_bloom_filter: Optional[BloomFilter] = None
                  ):
         self.file = file
         self.meta_blocks = meta_blocks
@@ -136,6 +637,16 @@ class SSTable:
         self.bloom_filter = bloom_filter
         self.first_key = first_key
         self.last_key = last_key
+        self.block_cache = block_cache
+        self.format_version = format_version
+        self.range_tombstones = range_tombstones if range_tombstones is not None else RangeTombstones()
+        # Bloom filter of the prefixes of the keys (None if the SSTable was built without a prefix extractor)
+        self.prefix_bloom_filter = prefix_bloom_filter
+        # Last key of each block, precomputed once so that blocks can be looked up by binary search (a partitioned
+        # index looks blocks up itself, without reading all its partitions)
+        self._last_keys = None if isinstance(meta_blocks, PartitionedIndex) \
+            else [meta_block.last_key for meta_block in meta_blocks]
+        self._size: Optional[int] = None
 
     def __eq__(self, other):
         if not isinstance(other, SSTable):
@@ -145,103 +656,312 @@ class SSTable:
                 and self.meta_block_offset == other.meta_block_offset
                 and self.bloom_filter == other.bloom_filter
                 and self.first_key == other.first_key
-                and self.last_key == other.last_key)
+                and self.last_key == other.last_key
+                and self.range_tombstones == other.range_tombstones
+                and self.prefix_bloom_filter == other.prefix_bloom_filter)
 
-    def find_block_id(self, key: Record.Key) -> Optional[int]:
-        for i, meta_block in enumerate(self.meta_blocks):
-            if meta_block.last_key < key:
-                continue
-            if meta_block.first_key <= key <= meta_block.last_key:
-                return i
-            if key <= meta_block.first_key:
-                return None
+    @staticmethod
+    def compute_key_range(meta_blocks: Sequence[MetaBlock],
+                          range_tombstones: RangeTombstones) -> tuple[Record.Key, Record.Key]:
+        """Returns the first and last keys of an SSTable, which span both its records and its range tombstones (the
+        last key is the end of the last range tombstone if it is greater than the last record: this excluded end is a
+        conservative bound)."""
+        if isinstance(meta_blocks, PartitionedIndex):
+            first_keys, last_keys = [meta_blocks.first_key], [meta_blocks.last_key]
+        else:
+            first_keys = [meta_blocks[0].first_key] if len(meta_blocks) else []
+            last_keys = [meta_blocks[-1].last_key] if len(meta_blocks) else []
+        if len(range_tombstones):
+            first_keys.append(range_tombstones.first_key)
+            last_keys.append(range_tombstones.last_key)
+        return min(first_keys), max(last_keys)
 
-        return None
-        # TODO later: Optimisation:
-        # # Perform binary search in meta blocks to find in which block the key is likely to be
-        # first_key = self.meta_blocks[0].first_key
-        # last_key = self.meta_blocks[-1].last_key
+    def find_first_block_id(self, key: Record.Key) -> int:
+        """Returns the id of the first block that may contain keys greater than or equal to `key` (i.e. the first
+        block whose last key is >= `key`). Returns the number of blocks if there is no such block.
+        """
+        if self._last_keys is None:
+            return self.meta_blocks.find_first_block_id(key=key)
+        return bisect_left(self._last_keys, key)
+
+    def find_block_id(self, key: Record.Key) -> Optional[int]:
+        """Returns the id of the block that may contain the key, or None if no block can contain it.
+        Blocks are sorted and do not overlap: the only candidate is the first block whose last key is >= `key`. The key
+        is in it only if it is also >= the first key of that block.
+        """
+        block_id = self.find_first_block_id(key=key)
+        if block_id == len(self.meta_blocks):
+            return None
+        if key < self.meta_blocks[block_id].first_key:
+            return None
+        return block_id
 
     def read_data_block(self, block_id: int) -> DataBlock:
+        """Reads and decodes a data block.
+        If the SSTable has a block cache, the block is looked up in it first, and it is added to it after having been
+        read from disk. Blocks are cached once decompressed, so that cache hits never pay for the decompression.
+        """
+        cached_block = self._get_cached_data_block(block_id=block_id)
+        if cached_block is not None:
+            return cached_block
+
+        start, end = self._data_block_range(block_id=block_id)
+        return self._decode_data_block(block_id=block_id, encoded_block=self.file.read_range(start=start, end=end))
+
+    def read_data_blocks(self, block_ids: list[int]) -> list[DataBlock]:
+        """Reads and decodes several data blocks (whose ids are sorted), e.g. all the blocks needed by a batch of
+        lookups (cf `LsmStorage.multi_get`).
+        The blocks that are not in the block cache and that are next to each other in the file are read at once: a
+        single read is issued per run of consecutive blocks (cf `group_consecutive_block_ids`) instead of one per block.
+        """
+        blocks: dict[int, DataBlock] = {}
+        uncached_block_ids = []
+        for block_id in block_ids:
+            cached_block = self._get_cached_data_block(block_id=block_id)
+            if cached_block is not None:
+                blocks[block_id] = cached_block
+            else:
+                uncached_block_ids.append(block_id)
+
+        for run in self.group_consecutive_block_ids(block_ids=uncached_block_ids):
+            start, _ = self._data_block_range(block_id=run[0])
+            _, end = self._data_block_range(block_id=run[-1])
+            encoded_blocks = self.file.read_range(start=start, end=end)
+            for block_id in run:
+                block_start, block_end = self._data_block_range(block_id=block_id)
+                blocks[block_id] = self._decode_data_block(
+                    block_id=block_id, encoded_block=encoded_blocks[block_start - start:block_end - start])
+
+        return [blocks[block_id] for block_id in block_ids]
+
+    @staticmethod
+    def group_consecutive_block_ids(block_ids: list[int]) -> list[list[int]]:
+        """Splits sorted block ids into runs of consecutive ids (duplicates are dropped), e.g. [1, 2, 2, 3, 5, 7, 8]
+        gives [[1, 2, 3], [5], [7, 8]]."""
+        runs = []
+        for block_id in block_ids:
+            if len(runs) and runs[-1][-1] == block_id:
+                continue
+            if len(runs) and runs[-1][-1] + 1 == block_id:
+                runs[-1].append(block_id)
+            else:
+                runs.append([block_id])
+        return runs
+
+    def _data_block_range(self, block_id: int) -> tuple[int, int]:
+        """Returns the offsets of the start and of the end (excluded) of a data block in the file."""
+        if isinstance(self.meta_blocks, PartitionedIndex):
+            return self.meta_blocks.block_range(block_id=block_id, data_end=self.meta_block_offset)
         start = self.meta_blocks[block_id].offset
         end = self.meta_blocks[block_id + 1].offset \
             if block_id + 1 < len(self.meta_blocks) \
             else self.meta_block_offset
+        return start, end
 
-        encoded_block = self.file.read_range(start=start, end=end)
-        return DataBlock.from_bytes(data=encoded_block)
+    def _get_cached_data_block(self, block_id: int) -> Optional[DataBlock]:
+        if self.block_cache is None:
+            return None
+        return self.block_cache.get(key=(self.file.path, block_id))
 
-    # TODO: Probably return the record and move the decoding up in the LSM Storage part
-    def get(self, key: Record.Key) -> Optional[Record.Value]:
+    def _decode_data_block(self, block_id: int, encoded_block: bytes | memoryview) -> DataBlock:
+        """Decodes a data block read from the file (and adds it to the block cache, if any)."""
+        if self.format_version >= FORMAT_VERSION_BLOCK_COMPRESSION:
+            encoded_block = decompress_block(data=encoded_block)
+        if self.block_cache is not None and isinstance(encoded_block, memoryview):
+            # Blocks of memory-mapped files are copied before being cached, so that the cache never keeps a map from
+            # being unmapped (only the blocks that are not cached are read without being copied)
+            encoded_block = bytes(encoded_block)
+        block = DataBlock.from_bytes(data=encoded_block)
+
+        if self.block_cache is not None:
+            self.block_cache.put(key=(self.file.path, block_id), block=block, charge=len(encoded_block))
+
+        return block
+
+    def get_record(self, key: Record.Key) -> Optional[Record]:
         """To look up a key in a SSTable, we need to:
         1. Find the block that may contain it (by parsing meta blocks first and last keys)
         2. Read the block and search for the key within the block.
+        The record found may be a tombstone. If there is none but the key is covered by a range tombstone of the
+        SSTable, a tombstone is returned.
         """
         block_id = self.find_block_id(key=key)
-        if block_id is None:
-            return None
+        if block_id is not None:
+            record = self.read_data_block(block_id=block_id).get(key=key)
+            if record is not None:
+                return record
 
-        block = self.read_data_block(block_id=block_id)
-        record = block.get(key=key)
+        return self.get_range_tombstone(key=key)
+
+    @property
+    def size(self) -> int:
+        """Size of the SSTable file, in bytes (read once: SSTable files are never modified)."""
+        if self._size is None:
+            self._size = self.file.size
+        return self._size
+
+    def may_contain_prefix(self, prefix: Record.Key) -> bool:
+        """Tells whether the SSTable may contain keys whose extracted prefix (cf `PrefixExtractor.transform`) is
+        `prefix`. This is always the case if it has no prefix bloom filter."""
+        if self.prefix_bloom_filter is None:
+            return True
+        return self.prefix_bloom_filter.may_contain(key=prefix)
+
+    def get_range_tombstone(self, key: Record.Key) -> Optional[Record]:
+        """Returns a tombstone if the key is covered by a range tombstone of the SSTable (no data block is read)."""
+        if self.range_tombstones.covers(key=key):
+            return Record.tombstone(key=key)
+        return None
 
-        return record.value if record is not None else None
+    def get(self, key: Record.Key) -> Optional[Record.Value]:
+        record = self.get_record(key=key)
+        if record is None or record.is_tombstone:
+            return None
+        return record.value
 
-    def scan(self, lower: Record.Key, upper: Record.Key) -> SSTableIterator:
-        return SSTableIterator(sstable=self, start_key=lower, end_key=upper)
+    def scan(self,
+             lower: Record.Key,
+             upper: Optional[Record.Key],
+             shadowing_range_tombstones: Optional[RangeTombstones] = None) -> SSTableIterator:
+        return SSTableIterator(sstable=self, start_key=lower, end_key=upper,
+                               shadowing_range_tombstones=shadowing_range_tombstones)
 
     @classmethod
-    def build_from_path(cls, path: str):
-        file = SSTableFile.open(path=path)
-        data = file.read()
-        sstable_encoding = SSTableEncoding.from_bytes(data=data)
+    def build_from_path(cls,
+                        path: str,
+                        block_cache: Optional[BlockCache] = None,
+                        descriptor_pool: Optional[FileDescriptorPool] = None,
+                        use_mmap: bool = False):
+        """Opens an existing SSTable.
+        Only the meta blocks, the range tombstones and the bloom filter are read (data blocks are read on demand). If
+        the index is partitioned, only its top-level index is read (partitions are read on demand too, through the
+        `block_cache`).
+        If `use_mmap` is set, the file is read through a memory map (cf `MmapSSTableFile`).
+        """
+        file_class = MmapSSTableFile if use_mmap else SSTableFile
+        file = file_class.open(path=path, descriptor_pool=descriptor_pool)
+        meta_blocks, meta_block_offset, bloom_filter, format_version, range_tombstones, prefix_bloom_filter = \
+            SSTableEncoding.read_index(file=file, block_cache=block_cache)
 
-        first_key = sstable_encoding.meta_blocks[0].first_key
-        last_key = sstable_encoding.meta_blocks[-1].last_key
-        meta_blocks = sstable_encoding.meta_blocks
-        meta_block_offset = sstable_encoding.meta_block_section_offset
-        bloom_filter = sstable_encoding.bloom_filter
+        first_key, last_key = cls.compute_key_range(meta_blocks=meta_blocks, range_tombstones=range_tombstones)
 
         return cls(meta_blocks=meta_blocks, meta_block_offset=meta_block_offset,
                    first_key=first_key, last_key=last_key,
-                   bloom_filter=bloom_filter, file=file)
+                   bloom_filter=bloom_filter, file=file, block_cache=block_cache, format_version=format_version,
+                   range_tombstones=range_tombstones, prefix_bloom_filter=prefix_bloom_filter)
+
+
+def insert_into_sorted_run(sorted_run: Deque[SSTable], sstables: list[SSTable]) -> None:
+    """Inserts SSTables that are sorted and do not overlap each other (e.g. the output of a compaction) into a sorted
+    run (e.g. a level of L1 or deeper), which they do not overlap either: the sorted run is kept sorted."""
+    if len(sstables) == 0:
+        return
+    index = bisect_left(sorted_run, sstables[0].first_key, key=lambda sstable: sstable.first_key)
+    for offset, sstable in enumerate(sstables):
+        sorted_run.insert(index + offset, sstable)
 
 
 class SSTableBuilder:
     """This class handles the creation of SSTables.
-    Its content is stored in an in-memory buffer that gets converted into an SSTable object only once it is full.
+    Data blocks are appended to a temporary file as soon as they are full, so that the memory used by the builder does
+    not depend on the size of the SSTable. The rest of the SSTable (meta blocks, range tombstones, bloom filter and
+    Extra section) is written once it is built, and the temporary file is then renamed to the path of the SSTable: an
+    SSTable file is thus either complete or absent.
+    The temporary file is created in `directory` (which should be the directory of the SSTable, so that it can be
+    renamed atomically), or in the default temporary directory of the system if none is given.
+    The bloom filter of the SSTable gets `bloom_bits_per_key` bits per key (0 builds no bloom filter), and is a
+    `BlockedBloomFilter` if `blocked_bloom_filter` is set.
+    If `index_partition_size` is more than 0, the index is partitioned, with the meta blocks of that many data blocks
+    and the bloom filter of their keys per partition (cf `PartitionedIndex`).
+    If a `prefix_extractor` is given, the SSTable also gets a bloom filter of the prefixes of its keys (with as many
+    bits per prefix as the bloom filter of its keys has bits per key), which is never partitioned.
+    Keys are not kept until the SSTable is built: they are hashed as they arrive (cf `BloomFilter.hash_key`), and only
+    their hashes (16 bytes per key) are kept until the bloom filter is built. With a partitioned index, the bloom filter
+    of a partition is built as soon as its data blocks are finished, so that only the hashes of the keys of the current
+    partition are kept.
     """
+    TEMPORARY_FILE_SUFFIX = ".sst.tmp"
 
-    def __init__(self, sstable_size: Optional[int] = 262_144_000, block_size: Optional[int] = 65_536):
+    def __init__(self,
+                 sstable_size: Optional[int] = 262_144_000,
+                 block_size: Optional[int] = 65_536,
+                 block_cache: Optional[BlockCache] = None,
+                 descriptor_pool: Optional[FileDescriptorPool] = None,
+                 use_mmap: bool = False,
+                 restart_interval: int = 1,
+                 compression: Compression = Compression.NONE,
+                 directory: Optional[str] = None,
+                 bloom_bits_per_key: float = DEFAULT_BITS_PER_KEY,
+                 blocked_bloom_filter: bool = False,
+                 index_partition_size: int = 0,
+                 prefix_extractor: Optional[PrefixExtractor] = None):
         # The usual target size of an SSTable is 256MB
+        self.sstable_size = sstable_size
         self.block_size = block_size
-        self.data_buffer = bytearray(sstable_size)
+        self.restart_interval = restart_interval
+        self.compression = compression
+        self.block_cache = block_cache
+        self.descriptor_pool = descriptor_pool
+        self.use_mmap = use_mmap
+        self.directory = directory
+        self.bloom_bits_per_key = bloom_bits_per_key
+        self.blocked_bloom_filter = blocked_bloom_filter
+        self.index_partition_size = index_partition_size
+        self.prefix_extractor = prefix_extractor
         self.data_block_offsets = []
-        self.block_builder = DataBlockBuilder(target_size=block_size)
+        self.block_builder = DataBlockBuilder(target_size=block_size, restart_interval=restart_interval)
         self.current_buffer_position = 0
         self.meta_blocks = []
-        self.keys = []
+        self.nb_keys = 0
+        # Hashes of the keys that are not in a bloom filter yet (cf `BloomFilter.add_hashes`)
+        self._key_hashes = array("Q")
+        # Hashes of the distinct prefixes of the keys, and the last prefix (keys are sorted, so that keys with the same
+        # prefix are next to each other)
+        self._prefix_hashes = array("Q")
+        self._last_prefix: Optional[Record.Key] = None
+        # Encoded partitions of the index, which are built as soon as their data blocks are finished
+        self._encoded_partitions: list[bytes] = []
+        self.range_tombstones = RangeTombstones()
+        # Temporary file where data blocks are written (it is created along with the first block)
+        self._temporary_file = None
 
-    def add(self, key: Record.Key, value: Record.Value):
-        """Adds a key-value pair to the SSTable.
+    def add(self, key: Record.Key, value: Record.Value, is_tombstone: bool = False):
+        """Adds a key-value pair (or a tombstone) to the SSTable.
         As long as the current block is not full, the record is appended to the current block.
-        Once it is full, the block is created, the encoded block is added to the SSTable's buffer and a new block
-        builder is initialized.
+        Once it is full, the block is created, the encoded block is written to the SSTable's temporary file and a new
+        block builder is initialized.
         """
-        self.keys.append(key)
-        was_added = self.block_builder.add(key=key, value=value)
+        was_added = self.block_builder.add(key=key, value=value, is_tombstone=is_tombstone)
+
+        # Unless the record was added to the block, finalize block
+        if not was_added:
+            self.finish_block()
 
-        # Nothing to do if the record was added to the block
-        if was_added:
-            return
+            # Create a new block
+            self.block_builder = DataBlockBuilder(target_size=self.block_size, restart_interval=self.restart_interval)
 
-        # Otherwise, finalize block
-        self.finish_block()
+            # Add record to the new block
+            self.block_builder.add(key=key, value=value, is_tombstone=is_tombstone)
 
-        # Create a new block
-        self.block_builder = DataBlockBuilder(target_size=self.block_size)
+        self.nb_keys += 1
+        if self.bloom_bits_per_key > 0:
+            self._key_hashes.extend(BloomFilter.hash_key(key=key))
+        if self.prefix_extractor is not None and self.prefix_extractor.in_domain(key):
+            prefix = self.prefix_extractor.transform(key)
+            if prefix != self._last_prefix:
+                self._prefix_hashes.extend(BloomFilter.hash_key(key=prefix))
+                self._last_prefix = prefix
 
-        # Add record to the new block
-        self.block_builder.add(key=key, value=value)
+    def add_range_tombstone(self, range_tombstone: RangeTombstone) -> None:
+        """Adds a range tombstone to the SSTable (it is stored in the range tombstones section, not in a data block).
+        """
+        self.range_tombstones.add(range_tombstone=range_tombstone)
+
+    def _open_temporary_file(self):
+        if self._temporary_file is None:
+            self._temporary_file = tempfile.NamedTemporaryFile(mode="wb", dir=self.directory,
+                                                               suffix=self.TEMPORARY_FILE_SUFFIX, delete=False)
+        return self._temporary_file
 
     def finish_block(self) -> DataBlock:
         # Add current buffer position to list of block offsets
@@ -252,37 +972,121 @@ class SSTableBuilder:
                                last_key=self.block_builder.last_key,
                                offset=self.current_buffer_position)
         self.meta_blocks.append(meta_block)
+        if self.index_partition_size > 0 and len(self.meta_blocks) % self.index_partition_size == 0:
+            self._finish_partition()
 
         # Create block
         block = self.block_builder.create_block()
-        encoded_block = block.to_bytes()
+        encoded_block = compress_block(data=block.to_bytes(), compression=self.compression)
 
-        # Add new encoded block to buffer
-        start = self.current_buffer_position
-        end = self.current_buffer_position + block.size
-        self.data_buffer[start:end] = encoded_block
+        # Append new encoded block to the temporary file
+        self._open_temporary_file().write(encoded_block)
 
         # Update buffer position
-        self.current_buffer_position += block.size
+        self.current_buffer_position += len(encoded_block)
 
         return block
 
     def build(self, path: str) -> SSTable:
-        self.finish_block()
+        if os.path.exists(path):
+            raise ValueError(f"Cannot create the file because there is already one at {path}")
 
-        # Write to file
-        bloom_filter = BloomFilter.build_from_keys_and_fp_rate(keys=self.keys, fp_rate=0.001)
-        encoded_sstable = SSTableEncoding(data=bytes(self.data_buffer[:self.current_buffer_position]),
-                                          meta_blocks=self.meta_blocks,
-                                          bloom_filter=bloom_filter).to_bytes()
-        file = SSTableFile.create(path=path, data=encoded_sstable)
+        # An SSTable may only hold range tombstones (it then has no data block)
+        if self.nb_keys > 0:
+            self.finish_block()
+
+        # Write the rest of the SSTable after its data blocks
+        prefix_bloom_filter = self._build_prefix_bloom_filter()
+        is_partitioned = self.index_partition_size > 0 and len(self.meta_blocks) > 0
+        if is_partitioned:
+            bloom_filter = None
+            encoded_partitions, top_level_index = self._encode_partitions()
+            encoded_index = encoded_partitions + SSTableEncoding.encode_index(
+                data_size=self.current_buffer_position,
+                meta_blocks=self.meta_blocks,
+                bloom_filter=None,
+                range_tombstones=self.range_tombstones,
+                partitions_size=len(encoded_partitions),
+                top_level_index=top_level_index,
+                prefix_bloom_filter=prefix_bloom_filter)
+        else:
+            bloom_filter = self._build_bloom_filter(hashes=self._key_hashes)
+            encoded_index = SSTableEncoding.encode_index(data_size=self.current_buffer_position,
+                                                         meta_blocks=self.meta_blocks,
+                                                         bloom_filter=bloom_filter,
+                                                         range_tombstones=self.range_tombstones,
+                                                         prefix_bloom_filter=prefix_bloom_filter)
+        temporary_file = self._open_temporary_file()
+        try:
+            temporary_file.write(encoded_index)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+            temporary_file.close()
+            # This is an atomic rename when both paths are on the same file system (otherwise the file is copied)
+            shutil.move(temporary_file.name, path)
+        except BaseException:
+            temporary_file.close()
+            if os.path.exists(temporary_file.name):
+                os.remove(temporary_file.name)
+            raise
+
+        if is_partitioned:
+            # The partitions are not kept in memory: they are read back on demand, like those of any other SSTable
+            return SSTable.build_from_path(path=path, block_cache=self.block_cache,
+                                           descriptor_pool=self.descriptor_pool, use_mmap=self.use_mmap)
+
+        file_class = MmapSSTableFile if self.use_mmap else SSTableFile
+        file = file_class.open(path=path, descriptor_pool=self.descriptor_pool)
 
         # Return python object
+        first_key, last_key = SSTable.compute_key_range(meta_blocks=self.meta_blocks,
+                                                        range_tombstones=self.range_tombstones)
         return SSTable(
             meta_blocks=self.meta_blocks,
             file=file,
             meta_block_offset=self.current_buffer_position,
             bloom_filter=bloom_filter,
-            first_key=self.keys[0],
-            last_key=self.keys[-1]
+            first_key=first_key,
+            last_key=last_key,
+            block_cache=self.block_cache,
+            range_tombstones=self.range_tombstones,
+            prefix_bloom_filter=prefix_bloom_filter
         )
+
+    def _build_bloom_filter(self, hashes: array) -> BloomFilter:
+        bloom_filter_class = BlockedBloomFilter if self.blocked_bloom_filter else BloomFilter
+        return bloom_filter_class.build_from_hashes_and_bits_per_key(hashes=hashes,
+                                                                     bits_per_key=self.bloom_bits_per_key)
+
+    def _build_prefix_bloom_filter(self) -> Optional[BloomFilter]:
+        if self.prefix_extractor is None:
+            return None
+        return self._build_bloom_filter(hashes=self._prefix_hashes)
+
+    def _finish_partition(self) -> None:
+        """Encodes the partition of the last data blocks (those that are not in a partition yet), with the bloom filter
+        of their keys."""
+        start = len(self._encoded_partitions) * self.index_partition_size
+        partition = IndexPartition(meta_blocks=self.meta_blocks[start:start + self.index_partition_size],
+                                   bloom_filter=self._build_bloom_filter(hashes=self._key_hashes))
+        self._encoded_partitions.append(partition.to_bytes())
+        self._key_hashes = array("Q")
+
+    def _encode_partitions(self) -> tuple[bytes, TopLevelIndex]:
+        """Returns the encoded partitions of `index_partition_size` blocks each (that follow the data blocks) and the
+        top-level index."""
+        if len(self._encoded_partitions) * self.index_partition_size < len(self.meta_blocks):
+            self._finish_partition()
+
+        handles = []
+        offset = self.current_buffer_position
+        for partition_id, encoded_partition in enumerate(self._encoded_partitions):
+            meta_blocks = self.meta_blocks[partition_id * self.index_partition_size:
+                                           (partition_id + 1) * self.index_partition_size]
+            handles.append(MetaBlock(first_key=meta_blocks[0].first_key, last_key=meta_blocks[-1].last_key,
+                                     offset=offset))
+            offset += len(encoded_partition)
+
+        top_level_index = TopLevelIndex(handles=handles, blocks_per_partition=self.index_partition_size,
+                                        nb_blocks=len(self.meta_blocks))
+        return b''.join(self._encoded_partitions), top_level_index
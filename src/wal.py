@@ -1,21 +1,82 @@
 import os
+import struct
+import threading
+from enum import Enum
+from typing import Optional
 
+from src.range_tombstones import RangeTombstone
 from src.record import Record
 
 
+class Durability(str, Enum):
+    """How writes to the Write-Ahead Log (WAL) are made durable.
+    - NONE: records are written to the file (i.e. handed over to the OS) but never synced to disk. They survive a crash
+      of the process, but not a crash of the machine.
+    - BATCHED_FSYNC: records are synced to disk before the write returns. Concurrent writes are synced together.
+    - FSYNC: each record is written and synced to disk on its own.
+    """
+    NONE = "none"
+    BATCHED_FSYNC = "batched_fsync"
+    FSYNC = "fsync"
+
+
 class WriteAheadLog:
-    def __init__(self, path: str, file):
+    """This class handles the Write-Ahead Log (WAL) of a memtable.
+
+    Unless the durability is `Durability.FSYNC`, records are appended with a group commit: writers enqueue their
+    records, and the first writer that finds no write in progress becomes the leader. The leader writes all enqueued
+    records with a single `write` (followed by a single sync for `Durability.BATCHED_FSYNC`), while the next writers
+    enqueue their records for the next batch. Each writer returns once the batch containing its record is written (and
+    synced).
+
+    If a write fails, the WAL is considered broken: every following write raises.
+    Once the WAL is removed (cf `remove_self`), writes raise a `ValueError`: the WAL is not broken, it is just no longer
+    the WAL of a memtable that can be written to.
+
+    The WAL is a sequence of entries, each of which is either a single Record (cf `Record`) or a batch of Records that
+    must be recovered atomically (cf `WriteBatch`). Batches have the following format:
+    +--------------+------------+---------------------+
+    | Batch_marker | Batch_size |       Records       |
+    +--------------+------------+---------------------+
+    |   4 bytes    |  4 bytes   |  Batch_size bytes   |
+    +--------------+------------+---------------------+
+    The batch marker is a negative integer, which cannot be mistaken for the key size that starts a single Record.
+    An entry that was not fully written (e.g. because of a crash while writing it) is ignored upon recovery, along with
+    whatever follows it: it was never acknowledged to its writer.
+
+    Range deletions are logged the same way, behind their own marker (cf `RangeTombstone`):
+    +-------------------------+-----------------+
+    | Range_tombstone_marker  | Range tombstone |
+    +-------------------------+-----------------+
+    |         4 bytes         | (variable size) |
+    +-------------------------+-----------------+
+    """
+    BATCH_MARKER = -1
+    RANGE_TOMBSTONE_MARKER = -2
+    EXTENSION = ".wal"
+    INTEGER_FORMAT = "i"
+    INTEGER_SIZE = 4
+
+    def __init__(self, path: str, file, durability: Durability = Durability.NONE):
         self.path = path
         self.file = file
+        self.durability = durability
+        self._condition = threading.Condition()
+        self._pending: list[bytes] = []
+        self._last_sequence = 0  # Sequence number of the last enqueued record
+        self._written_sequence = 0  # Sequence number of the last record written (and synced if required)
+        self._is_writing = False
+        self._is_removed = False
+        self._error: Optional[Exception] = None
 
     @classmethod
-    def create(cls, path: str) -> "WriteAheadLog":
+    def create(cls, path: str, durability: Durability = Durability.NONE) -> "WriteAheadLog":
         if cls._exists(path):
             raise ValueError(f"Cannot create the WAL because there is already one at {path}")
 
         file = open(path, "ab", buffering=0)  # setting the buffer size to 0 so that it flushes right after writing
 
-        return cls(path, file=file)
+        return cls(path, file=file, durability=durability)
 
     @classmethod
     def open(cls, path: str) -> "WriteAheadLog":
@@ -26,17 +87,140 @@ class WriteAheadLog:
 
         return cls(path=path, file=file)
 
-    def read_records(self) -> list[Record]:
+    def read_records(self) -> list[Record | RangeTombstone]:
+        """Reads the records and range tombstones of the WAL, in the order in which they were written."""
         data = self.file.read()
-        return Record.list_from_bytes(data=data)
+        records = []
+        offset = 0
+        while offset < len(data):
+            try:
+                entry_records, entry_end = self._decode_entry(data=data, offset=offset)
+            except (struct.error, ValueError):
+                # The entry is cut before the end of its sizes, or in the middle of a string (which may then not be
+                # decodable, or make an invalid range tombstone)
+                break
+            if entry_end > len(data):
+                # The entry is cut in the middle of its key, of its value or of its batch
+                break
+            records.extend(entry_records)
+            offset = entry_end
+
+        return records
+
+    def _decode_entry(self, data: bytes, offset: int) -> tuple[list[Record | RangeTombstone], int]:
+        """Decodes the entry starting at `offset` and returns its records (or range tombstone) along with the offset
+        of its end. The end is beyond `data` if the entry was not fully written, in which case its records are
+        meaningless."""
+        key_size_or_marker = struct.unpack_from(self.INTEGER_FORMAT, data, offset)[0]
+        if key_size_or_marker == self.RANGE_TOMBSTONE_MARKER:
+            range_tombstone, end = RangeTombstone._from_bytes(data=data, offset=offset + self.INTEGER_SIZE)
+            return [range_tombstone], end
+        if key_size_or_marker != self.BATCH_MARKER:
+            record, end = Record._from_bytes(data=data, offset=offset)
+            return [record], end
+
+        batch_size = struct.unpack_from(self.INTEGER_FORMAT, data, offset + self.INTEGER_SIZE)[0]
+        batch_start = offset + 2 * self.INTEGER_SIZE
+        batch_end = batch_start + batch_size
+        if batch_end > len(data):
+            return [], batch_end
+        return Record.list_from_bytes(data=data[batch_start:batch_end]), batch_end
+
+    @classmethod
+    def list_paths(cls, directory: str) -> list[str]:
+        """Returns the paths of the WAL files of a directory, from the oldest to the newest (WAL files are named after
+        the time of their creation, cf `MemTable._create_wal`)."""
+        names = [name for name in os.listdir(directory) if name.endswith(cls.EXTENSION)]
+        names.sort(key=lambda name: float(name[:-len(cls.EXTENSION)]))
+        return [f"{directory}/{name}" for name in names]
 
     @staticmethod
     def _exists(path: str) -> bool:
         return os.path.isfile(path)
 
     def insert(self, record: Record):
-        self.file.write(record.to_bytes())
+        self.append(data=record.to_bytes())
+
+    def insert_batch(self, records: list[Record]) -> None:
+        encoded_records = b''.join([record.to_bytes() for record in records])
+        header = struct.pack(self.INTEGER_FORMAT * 2, self.BATCH_MARKER, len(encoded_records))
+        self.append(data=header + encoded_records)
+
+    def insert_range_tombstone(self, range_tombstone: RangeTombstone) -> None:
+        marker = struct.pack(self.INTEGER_FORMAT, self.RANGE_TOMBSTONE_MARKER)
+        self.append(data=marker + range_tombstone.to_bytes())
+
+    def append(self, data: bytes) -> None:
+        """Appends encoded data to the WAL and returns once it is durable (as per the durability of the WAL)."""
+        if self.durability == Durability.FSYNC:
+            with self._condition:
+                self._raise_if_removed()
+                self._raise_if_broken()
+                self._write_and_sync(data=data)
+            return
+
+        with self._condition:
+            self._raise_if_removed()
+            self._pending.append(data)
+            self._last_sequence += 1
+            sequence = self._last_sequence
+
+            while self._written_sequence < sequence:
+                # The WAL may have been removed while the data was waiting for the next batch (it is then not written)
+                self._raise_if_removed()
+                self._raise_if_broken()
+                if self._is_writing:
+                    self._condition.wait()
+                    continue
+                self._lead_batch()
+
+    def _lead_batch(self) -> None:
+        """Writes all enqueued data at once. Must be called while holding `self._condition`, which is released during
+        the write so that other writers can enqueue data for the next batch."""
+        self._is_writing = True
+        batch, self._pending = self._pending, []
+        batch_sequence = self._last_sequence
+
+        self._condition.release()
+        try:
+            self._write_and_sync(data=b''.join(batch))
+        finally:
+            self._condition.acquire()
+            self._is_writing = False
+            if self._error is None:
+                self._written_sequence = batch_sequence
+            self._condition.notify_all()
+
+    def _write_and_sync(self, data: bytes) -> None:
+        try:
+            self.file.write(data)
+            if self.durability != Durability.NONE:
+                self._sync()
+        except Exception as error:
+            self._error = error
+            raise
+
+    def _sync(self) -> None:
+        # fdatasync does not sync metadata that is not needed to read the data back (e.g. the modification time)
+        if hasattr(os, "fdatasync"):
+            os.fdatasync(self.file.fileno())
+        else:
+            os.fsync(self.file.fileno())
+
+    def _raise_if_broken(self) -> None:
+        if self._error is not None:
+            raise OSError(f"Cannot write to the WAL at {self.path} since a previous write failed") from self._error
+
+    def _raise_if_removed(self) -> None:
+        if self._is_removed:
+            raise ValueError(f"Cannot write to the WAL at {self.path} since it was removed")
 
     def remove_self(self) -> None:
-        self.file.close()
+        """Closes and removes the WAL file, once the batch being written (if any) is written."""
+        with self._condition:
+            while self._is_writing:
+                self._condition.wait()
+            self._is_removed = True
+            self.file.close()
+            self._condition.notify_all()
         os.remove(self.path)
@@ -0,0 +1,22 @@
+from src.record import Record
+
+
+class WriteBatch:
+    """This class groups several writes so that they are applied to a store atomically (cf `LsmStorage.write`): after a
+    crash, either all of them or none of them are recovered from the Write-Ahead Log (WAL).
+
+    Writes (puts and deletes) are applied in the order in which they were added to the batch: if a key is written
+    several times, the last write wins.
+    """
+
+    def __init__(self):
+        self.records: list[Record] = []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def put(self, key: Record.Key, value: Record.Value) -> None:
+        self.records.append(Record(key=key, value=value))
+
+    def delete(self, key: Record.Key) -> None:
+        self.records.append(Record.tombstone(key=key))